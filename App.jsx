@@ -1,4 +1,4 @@
-import { useState } from 'react'
+import { useMemo, useRef, useState } from 'react'
 import { Button } from '@/components/ui/button.jsx'
 import { Card, CardContent, CardDescription, CardHeader, CardTitle } from '@/components/ui/card.jsx'
 import { Input } from '@/components/ui/input.jsx'
@@ -11,6 +11,27 @@ import { FileText, Download, Car, User, Calculator, CheckCircle, Percent } from
 import glanzwerkLogo from './assets/glanzwerk_logo.png'
 import './App.css'
 
+// Same format as line_items.py on the server: '[<Anzahl>x ]<Beschreibung>: <Preis>[€]'
+const LINE_ITEM_PATTERN = /^(?:(\d+)\s*[x×]\s+)?(.+?):\s*(\d+(?:[.,]\d{1,2})?)\s*€?$/i
+
+// Line items for the API ({ description, unitPrice, quantity }) and the lines that could not be read
+const parseAdditionalServices = (text) => {
+  const items = []
+  const rejected = []
+  text.split('\n').forEach((line, index) => {
+    line = line.trim()
+    if (!line) return
+    const match = line.match(LINE_ITEM_PATTERN)
+    const quantity = match ? parseInt(match[1] || '1', 10) : 0
+    if (!match || quantity < 1 || quantity > 9999) {
+      rejected.push({ line: index + 1, text: line })
+      return
+    }
+    items.push({ description: match[2].trim(), unitPrice: parseFloat(match[3].replace(',', '.')), quantity })
+  })
+  return { items, rejected }
+}
+
 function App() {
   const [customerName, setCustomerName] = useState('')
   const [vehicleNumber, setVehicleNumber] = useState('')
@@ -20,6 +41,8 @@ function App() {
   const [discountCode, setDiscountCode] = useState('')
   const [manualDiscountPercent, setManualDiscountPercent] = useState('')
   const [invoiceData, setInvoiceData] = useState(null)
+  const [customerSuggestions, setCustomerSuggestions] = useState([])
+  const suggestRequest = useRef(null)
 
   const services = [
     { id: 'aussenreinigung', name: 'Außenreinigung per Hand', price: 50, description: 'Professionelle Handwäsche außen' },
@@ -46,30 +69,60 @@ function App() {
     'SOMMER2025': 12
   }
 
-  const parseAdditionalServices = (text) => {
-    if (!text.trim()) return []
-    
-    return text.split('\n').map(line => {
-      const match = line.match(/^(.+?):\s*(\d+(?:\.\d{1,2})?)€?$/i)
-      if (match) {
-        return {
-          description: match[1].trim(),
-          price: parseFloat(match[2])
-        }
+  // Known customers for the name and plate fields; only the answer to the latest keystroke counts
+  const suggestCustomers = async (query) => {
+    suggestRequest.current?.abort()
+    if (!query.trim()) {
+      setCustomerSuggestions([])
+      return
+    }
+    const controller = new AbortController()
+    suggestRequest.current = controller
+    try {
+      const response = await fetch(`/api/search/customers?q=${encodeURIComponent(query)}`, { signal: controller.signal })
+      if (response.ok) {
+        setCustomerSuggestions((await response.json()).customers)
+      }
+    } catch (error) {
+      if (error.name !== 'AbortError') {
+        setCustomerSuggestions([])
       }
-      return null
-    }).filter(Boolean)
+    }
   }
 
+  const changeCustomerName = (name) => {
+    setCustomerName(name)
+    // Picked from the list: take over the vehicle too
+    const known = customerSuggestions.find(customer => customer.customerName === name)
+    if (known) {
+      if (!vehicleNumber) setVehicleNumber(known.vehicleNumber)
+    } else {
+      suggestCustomers(name)
+    }
+  }
+
+  const changeVehicleNumber = (plate) => {
+    setVehicleNumber(plate)
+    const known = customerSuggestions.find(customer => customer.vehicleNumber === plate)
+    if (known) {
+      if (!customerName) setCustomerName(known.customerName)
+    } else {
+      suggestCustomers(plate)
+    }
+  }
+
+  // Parsed once per change of the text, not on every render
+  const parsedServices = useMemo(() => parseAdditionalServices(additionalServices), [additionalServices])
+
   const calculateInvoice = () => {
     const service = services.find(s => s.id === selectedService)
-    if (!service || !customerName || !vehicleNumber) return
+    if (!service || !customerName || !vehicleNumber || parsedServices.rejected.length) return
 
     let netPrice = service.price
     
     // Add additional services
-    const additionalServicesList = parseAdditionalServices(additionalServices)
-    const additionalTotal = additionalServicesList.reduce((sum, item) => sum + item.price, 0)
+    const additionalServicesList = parsedServices.items
+    const additionalTotal = additionalServicesList.reduce((sum, item) => sum + item.unitPrice * item.quantity, 0)
     netPrice += additionalTotal
 
     const taxRate = 0.19
@@ -140,7 +193,7 @@ function App() {
           customerName,
           vehicleNumber,
           selectedService,
-          additionalServices,
+          additionalServices: parsedServices.items,
           isRegularCustomer,
           discountCode,
           manualDiscountPercent
@@ -210,9 +263,18 @@ function App() {
                       id="customerName"
                       placeholder="Kundenname eingeben"
                       value={customerName}
-                      onChange={(e) => setCustomerName(e.target.value)}
+                      onChange={(e) => changeCustomerName(e.target.value)}
+                      list="customerSuggestions"
+                      autoComplete="off"
                       className="mt-1"
                     />
+                    <datalist id="customerSuggestions">
+                      {customerSuggestions.map(customer => (
+                        <option key={`${customer.customerName}|${customer.vehicleNumber}`} value={customer.customerName}>
+                          {customer.vehicleNumber}
+                        </option>
+                      ))}
+                    </datalist>
                   </div>
                   <div>
                     <Label htmlFor="vehicleNumber">Fahrzeugkennzeichen</Label>
@@ -220,9 +282,18 @@ function App() {
                       id="vehicleNumber"
                       placeholder="Kennzeichen eingeben"
                       value={vehicleNumber}
-                      onChange={(e) => setVehicleNumber(e.target.value)}
+                      onChange={(e) => changeVehicleNumber(e.target.value)}
+                      list="vehicleSuggestions"
+                      autoComplete="off"
                       className="mt-1"
                     />
+                    <datalist id="vehicleSuggestions">
+                      {customerSuggestions.map(customer => (
+                        <option key={`${customer.customerName}|${customer.vehicleNumber}`} value={customer.vehicleNumber}>
+                          {customer.customerName}
+                        </option>
+                      ))}
+                    </datalist>
                   </div>
                 </div>
               </div>
@@ -272,14 +343,19 @@ function App() {
                   Zusätzliche Dienstleistungen
                 </h3>
                 <div>
-                  <Label htmlFor="additionalServices">Zusatzleistungen (Format: "Beschreibung: Preis")</Label>
+                  <Label htmlFor="additionalServices">Zusatzleistungen (Format: "Beschreibung: Preis" oder "Anzahl x Beschreibung: Preis")</Label>
                   <Textarea
                     id="additionalServices"
-                    placeholder="Beispiel:&#10;Spezialreinigung: 25€&#10;Wachsbehandlung: 40€"
+                    placeholder="Beispiel:&#10;Spezialreinigung: 25€&#10;4x Fußmatten waschen: 5€"
                     value={additionalServices}
                     onChange={(e) => setAdditionalServices(e.target.value)}
                     className="mt-1 h-20"
                   />
+                  {parsedServices.rejected.length > 0 && (
+                    <p className="text-sm text-red-600 mt-1">
+                      Nicht erkannt: {parsedServices.rejected.map(({ line, text }) => `Zeile ${line}: ${text}`).join('; ')}
+                    </p>
+                  )}
                 </div>
               </div>
 
@@ -391,8 +467,10 @@ function App() {
                         </tr>
                         {invoiceData.additionalServices.map((service, index) => (
                           <tr key={index} className="border-t">
-                            <td className="p-3">{service.description}</td>
-                            <td className="text-right p-3">{service.price.toFixed(2)}€</td>
+                            <td className="p-3">
+                              {service.quantity > 1 ? `${service.quantity} × ${service.description} (je ${service.unitPrice.toFixed(2)}€)` : service.description}
+                            </td>
+                            <td className="text-right p-3">{(service.unitPrice * service.quantity).toFixed(2)}€</td>
                           </tr>
                         ))}
                         <tr className="border-t">
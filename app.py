@@ -1,11 +1,14 @@
 import streamlit as st
-import pandas as pd
 from datetime import datetime, timedelta
-from fpdf import FPDF
-import io
-import base64
-import re
-from PIL import Image
+import os
+from catalog import get_registry
+from pdf_cache import PDFCache, cache_key
+from line_items import line_total, parse_additional_services
+from pricing import price_invoice, resolve_discounts
+
+# fpdf2 and Pillow are only needed for downloads; they are imported on first
+# use (load_logo, get_invoice_pdf) to keep cold starts short, see
+# benchmarks/bench_startup.py
 
 # Page configuration
 st.set_page_config(
@@ -60,143 +63,92 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
-class GlanzwerkInvoicePDF(FPDF):
-    def __init__(self):
-        super().__init__()
-        self.set_auto_page_break(auto=True, margin=15)
-        
-    def header(self):
-        # Company header
-        self.set_font('Arial', 'B', 16)
-        self.cell(0, 10, 'GLANZWERK RHEINLAND', 0, 1, 'C')
-        self.set_font('Arial', '', 10)
-        self.cell(0, 5, 'Grün gedacht, sauber gemacht', 0, 1, 'C')
-        self.cell(0, 5, 'Krasnaer Str. 1, 56566 Neuwied, Deutschland', 0, 1, 'C')
-        self.ln(10)
-        
-    def footer(self):
-        self.set_y(-40)
-        self.set_font('Arial', '', 9)
-        
-        # Contact information
-        self.cell(60, 4, 'Glanzwerk Rheinland', 0, 0, 'L')
-        self.cell(70, 4, 'Glanzwerk.Rheinland@gmail.com', 0, 0, 'L')
-        self.cell(60, 4, 'Bankverbindung:', 0, 1, 'L')
-        
-        self.cell(60, 4, 'Krasnaer Str. 1', 0, 0, 'L')
-        self.cell(70, 4, '+49 171 1858241', 0, 0, 'L')
-        self.cell(60, 4, 'Bank: Sparkasse Neuwied', 0, 1, 'L')
-        
-        self.cell(60, 4, '56566 Neuwied', 0, 0, 'L')
-        self.cell(70, 4, 'Instagram: @glanzwerk_rheinland', 0, 0, 'L')
-        self.cell(60, 4, 'IBAN: DE89 5745 0120 0000 1234 56', 0, 1, 'L')
+LOGO_PATH = os.path.join(os.path.dirname(__file__), 'assets', 'glanzwerk_logo.png')
 
-def parse_additional_services(text):
-    """Parse additional services from text format"""
-    if not text or not text.strip():
-        return []
-    
-    services = []
-    for line in text.strip().split('\n'):
-        match = re.match(r'^(.+?):\s*(\d+(?:\.\d{1,2})?)€?$', line.strip(), re.IGNORECASE)
-        if match:
-            services.append({
-                'description': match.group(1).strip(),
-                'price': float(match.group(2))
-            })
-    
-    return services
+# Streamlit re-runs this script on every widget interaction; these bound what is kept between reruns
+PRICING_CACHE_ENTRIES = 256
+PDF_CACHE_BYTES = 16 * 1024 * 1024
 
-def generate_pdf(invoice_data):
-    """Generate PDF invoice"""
-    pdf = GlanzwerkInvoicePDF()
-    pdf.add_page()
-    
-    # Invoice header
-    current_date = datetime.now()
-    due_date = current_date + timedelta(days=14)
-    invoice_number = f"2025-{current_date.strftime('%m%d%H%M')}"
-    
-    pdf.set_xy(120, 35)
-    pdf.set_font('Arial', '', 11)
-    pdf.cell(70, 6, f'Rechnungsnummer: {invoice_number}', 0, 1, 'L')
-    pdf.set_x(120)
-    pdf.cell(70, 6, f'Rechnungsdatum: {current_date.strftime("%d.%m.%Y")}', 0, 1, 'L')
-    pdf.set_x(120)
-    pdf.cell(70, 6, f'Fälligkeitsdatum: {due_date.strftime("%d.%m.%Y")}', 0, 1, 'L')
-    
-    # Customer information
-    pdf.set_xy(10, 70)
-    pdf.set_font('Arial', 'B', 16)
-    pdf.cell(0, 10, 'RECHNUNG', 0, 1, 'L')
-    pdf.ln(5)
-    
-    pdf.set_font('Arial', '', 11)
-    pdf.cell(0, 6, 'Sehr geehrte Damen und Herren,', 0, 1, 'L')
-    pdf.ln(3)
-    pdf.cell(0, 6, 'vielen Dank für Ihre Inanspruchnahme unserer Dienstleistungen.', 0, 1, 'L')
-    pdf.ln(8)
-    
-    pdf.cell(0, 6, f'Kunde: {invoice_data["customer_name"]}', 0, 1, 'L')
-    pdf.cell(0, 6, f'Fahrzeug: {invoice_data["vehicle_number"]}', 0, 1, 'L')
-    pdf.ln(8)
-    
-    # Service table
-    pdf.set_font('Arial', 'B', 11)
-    pdf.cell(80, 8, 'Beschreibung', 1, 0, 'L')
-    pdf.cell(25, 8, 'Anzahl', 1, 0, 'C')
-    pdf.cell(25, 8, 'Einzelpreis', 1, 0, 'R')
-    pdf.cell(25, 8, 'MwSt.', 1, 0, 'R')
-    pdf.cell(25, 8, 'Gesamt', 1, 1, 'R')
-    
-    # Main service
-    pdf.set_font('Arial', '', 10)
-    service_net = invoice_data['service_price']
-    service_tax = service_net * 0.19
-    service_gross = service_net + service_tax
-    
-    pdf.cell(80, 8, invoice_data['service_name'], 1, 0, 'L')
-    pdf.cell(25, 8, '1', 1, 0, 'C')
-    pdf.cell(25, 8, f"{service_net:.2f}EUR", 1, 0, 'R')
-    pdf.cell(25, 8, f"{service_tax:.2f}EUR", 1, 0, 'R')
-    pdf.cell(25, 8, f"{service_gross:.2f}EUR", 1, 1, 'R')
-    
-    # Additional services
-    for additional in invoice_data['additional_services']:
-        add_net = additional['price']
-        add_tax = add_net * 0.19
-        add_gross = add_net + add_tax
-        
-        pdf.cell(80, 8, additional['description'], 1, 0, 'L')
-        pdf.cell(25, 8, '1', 1, 0, 'C')
-        pdf.cell(25, 8, f"{add_net:.2f}EUR", 1, 0, 'R')
-        pdf.cell(25, 8, f"{add_tax:.2f}EUR", 1, 0, 'R')
-        pdf.cell(25, 8, f"{add_gross:.2f}EUR", 1, 1, 'R')
-    
-    # Totals
-    pdf.set_font('Arial', 'B', 10)
-    pdf.cell(155, 8, 'Zwischensumme inkl. MwSt.', 1, 0, 'R')
-    pdf.cell(25, 8, f"{invoice_data['gross_price']:.2f}EUR", 1, 1, 'R')
-    
-    if invoice_data['total_discount_percent'] > 0:
-        pdf.set_font('Arial', '', 10)
-        pdf.cell(155, 8, f"Gesamtrabatt ({invoice_data['total_discount_percent']}%)", 1, 0, 'L')
-        pdf.cell(25, 8, f"-{invoice_data['discount_amount']:.2f}EUR", 1, 1, 'R')
-    
-    pdf.set_font('Arial', 'B', 11)
-    pdf.cell(155, 10, 'Gesamt inkl. MwSt.', 1, 0, 'R')
-    pdf.cell(25, 10, f"{invoice_data['total_price']:.2f}EUR", 1, 1, 'R')
-    
-    pdf.ln(8)
+# Bump whenever generate_pdf() changes its output, so cached PDFs are re-rendered
+PDF_TEMPLATE_VERSION = 2
+
+# Port for Prometheus to scrape the render metrics from; unset, they are not served
+METRICS_PORT = os.environ.get('METRICS_PORT')
+
+
+@st.cache_resource
+def load_catalog_registry():
+    """Catalog shared by all sessions; its watcher thread picks up edits to catalog.json"""
+    return get_registry()
+
+
+@st.cache_resource
+def load_logo():
+    from assets import get_logo
+    logo = get_logo(LOGO_PATH)
+    logo.warm()
+    return logo
+
+
+@st.cache_resource
+def start_metrics_server():
+    """Serve metrics.py's /metrics on METRICS_PORT, once per process"""
+    from metrics import serve_metrics
+    return serve_metrics(int(METRICS_PORT))
+
+
+@st.cache_resource
+def load_pdf_cache():
+    """Rendered PDFs by content hash, LRU-bounded to PDF_CACHE_BYTES"""
+    return PDFCache(max_memory_bytes=PDF_CACHE_BYTES, directory=None)
+
+
+def session_line_items(text):
+    """Additional services parsed from `text`, as (items, rejected lines).
     
-    # Payment information
-    pdf.set_font('Arial', '', 10)
-    pdf.cell(0, 6, f'Bitte überweisen Sie den Betrag bis spätestens {due_date.strftime("%d.%m.%Y")}', 0, 1, 'L')
-    pdf.ln(5)
-    pdf.cell(0, 6, 'Mit freundlichen Grüßen,', 0, 1, 'L')
-    pdf.cell(0, 6, 'Glanzwerk Rheinland', 0, 1, 'L')
+    Kept in the session and parsed again only when the text changed, not on
+    every rerun.
+    """
+    parsed = st.session_state.get('parsed_additional_services')
+    if parsed is None or parsed[0] != text:
+        parsed = st.session_state.parsed_additional_services = (text, *parse_additional_services(text))
+    return parsed[1], parsed[2]
+
+def preview_table(rows):
+    """Markdown table of (description, price) rows for the invoice preview"""
+    lines = ['| Beschreibung | Preis |', '| --- | ---: |']
+    for description, price in rows:
+        lines.append(f"| {description.replace('|', '&#124;')} | {price} |")
+    return '\n'.join(lines)
+
+def get_invoice_pdf(invoice_data, invoice_number):
+    """PDF bytes for `invoice_data`, rendered only if this exact invoice is not cached yet"""
+    pdf_cache = load_pdf_cache()
+    key = cache_key(invoice_number, invoice_data, PDF_TEMPLATE_VERSION)
+    pdf_bytes = pdf_cache.get(key)
+    if pdf_bytes is None:
+        from app_pdf import generate_pdf
+        pdf_bytes = generate_pdf(invoice_data, load_logo())
+        pdf_cache.put(key, pdf_bytes)
+    return bytes(pdf_bytes)
+
+@st.cache_data(max_entries=PRICING_CACHE_ENTRIES, show_spinner=False)
+def calculate_invoice(catalog_mtime, service_price, line_totals,
+                      is_regular_customer, discount_code, manual_discount, _discount_codes):
+    """Discounts and totals, memoized on the (hashed) inputs.
     
-    return pdf.output(dest='S').encode('latin1')
+    `line_totals` are the additional services' net amounts (unit price times
+    quantity). `catalog_mtime` stands in for the unhashed `_discount_codes`,
+    so a reloaded catalog invalidates earlier results.
+    """
+    total_discount_percent, discount_sources = resolve_discounts(
+        _discount_codes,
+        is_regular_customer=is_regular_customer,
+        discount_code=discount_code,
+        manual_discount=manual_discount
+    )
+    prices = price_invoice(service_price, line_totals, total_discount_percent)
+    return dict(prices, discount_sources=discount_sources)
 
 def main():
     # Header
@@ -209,31 +161,13 @@ def main():
     </div>
     """, unsafe_allow_html=True)
     
-    # Services data
-    services = {
-        'aussenreinigung': {'name': 'Außenreinigung per Hand', 'price': 50, 'description': 'Professionelle Handwäsche außen'},
-        'felgenreinigung': {'name': 'Felgenreinigung & Flugrostentfernung', 'price': 30, 'description': 'Intensive Felgenpflege'},
-        'innenraumreinigung': {'name': 'Innenraumreinigung', 'price': 70, 'description': 'Komplette Innenraumreinigung'},
-        'lederreinigung': {'name': 'Lederreinigung & -pflege', 'price': 60, 'description': 'Professionelle Lederpflege'},
-        'lederreparatur': {'name': 'Lederreparatur', 'price': 100, 'description': 'Reparatur von Lederschäden'},
-        'polsterreinigung': {'name': 'Polster- & Teppichreinigung', 'price': 80, 'description': 'Tiefenreinigung der Polster'},
-        'scheibenreinigung': {'name': 'Scheibenreinigung innen & außen', 'price': 20, 'description': 'Kristallklare Scheiben'},
-        'lackpolitur': {'name': 'Lackpolitur & Glanzversiegelung', 'price': 150, 'description': 'Hochglanzpolitur mit Versiegelung'},
-        'nanokeramik': {'name': 'Nano-Keramik-Versiegelung', 'price': 300, 'description': 'Premium Keramikversiegelung'},
-        'motorraumreinigung': {'name': 'Motorraumreinigung', 'price': 40, 'description': 'Professionelle Motorraumreinigung'},
-        'geruchsneutralisierung': {'name': 'Geruchsneutralisierung & Ozonbehandlung', 'price': 50, 'description': 'Ozonbehandlung gegen Gerüche'},
-        'tierhaarentfernung': {'name': 'Tierhaarentfernung', 'price': 40, 'description': 'Spezielle Tierhaarentfernung'},
-        'hagelschaden': {'name': 'Hagelschaden- und Dellenentfernung', 'price': 200, 'description': 'Professionelle Dellenreparatur'},
-        'folierung': {'name': 'Auto Folierung', 'price': 500, 'description': 'Komplette Fahrzeugfolierung'},
-        'abholservice': {'name': 'Abhol- und Bringservice', 'price': 25, 'description': 'Bequemer Hol- und Bringservice'}
-    }
+    if METRICS_PORT:
+        start_metrics_server()
     
-    discount_codes = {
-        'NEUKUNDE': 15,
-        'STAMMKUNDE': 10,
-        'WINTER2025': 20,
-        'SOMMER2025': 12
-    }
+    # Services and discount codes (loaded once per process, see catalog.py)
+    catalog = load_catalog_registry().snapshot
+    services = catalog.services
+    discount_codes = catalog.discount_codes
     
     # Layout
     col1, col2 = st.columns([1, 1])
@@ -248,7 +182,7 @@ def main():
         
         # Service Selection
         st.subheader("🚗 Hauptdienstleistung")
-        service_options = [f"{service['name']} - {service['price']}€" for service in services.values()]
+        service_options = [f"{service['name']} - {service['price']:.2f}€" for service in services.values()]
         service_names = list(services.keys())
         
         selected_service_index = st.selectbox(
@@ -267,10 +201,13 @@ def main():
         # Additional Services
         st.subheader("📄 Zusätzliche Dienstleistungen")
         additional_services_text = st.text_area(
-            "Zusatzleistungen (Format: 'Beschreibung: Preis')",
-            placeholder="Beispiel:\nSpezialreinigung: 25€\nWachsbehandlung: 40€",
+            "Zusatzleistungen (Format: 'Beschreibung: Preis' oder 'Anzahl x Beschreibung: Preis')",
+            placeholder="Beispiel:\nSpezialreinigung: 25€\n4x Fußmatten waschen: 5€",
             height=100
         )
+        additional_services, rejected_lines = session_line_items(additional_services_text)
+        if rejected_lines:
+            st.warning("Nicht erkannt: " + "; ".join(f"Zeile {number}: {line}" for number, line in rejected_lines))
         
         # Discounts
         st.subheader("💰 Rabatte")
@@ -280,13 +217,15 @@ def main():
         
         # Calculate button
         if st.button("🧮 Rechnung berechnen", type="primary", use_container_width=True):
-            if customer_name and vehicle_number and selected_service_index is not None:
+            if rejected_lines:
+                st.error("Bitte korrigieren Sie die nicht erkannten Zusatzleistungen!")
+            elif customer_name and vehicle_number and selected_service_index is not None:
                 # Store calculation in session state
                 st.session_state.invoice_calculated = True
                 st.session_state.customer_name = customer_name
                 st.session_state.vehicle_number = vehicle_number
                 st.session_state.selected_service = selected_service
-                st.session_state.additional_services_text = additional_services_text
+                st.session_state.additional_services = additional_services
                 st.session_state.is_regular_customer = is_regular_customer
                 st.session_state.discount_code = discount_code
                 st.session_state.manual_discount = manual_discount
@@ -299,45 +238,34 @@ def main():
         if hasattr(st.session_state, 'invoice_calculated') and st.session_state.invoice_calculated:
             # Calculate invoice
             service = st.session_state.selected_service
-            additional_services = parse_additional_services(st.session_state.additional_services_text)
-            
-            # Calculate prices
-            service_price = service['price']
-            additional_total = sum(item['price'] for item in additional_services)
-            net_price = service_price + additional_total
-            
-            tax_rate = 0.19
-            tax_amount = net_price * tax_rate
-            gross_price = net_price + tax_amount
-            
-            # Calculate discounts
-            total_discount_percent = 0
-            discount_sources = []
-            
-            if st.session_state.is_regular_customer:
-                total_discount_percent += 10
-                discount_sources.append('Stammkundenrabatt (10%)')
-            
-            if st.session_state.discount_code.upper() in discount_codes:
-                code_discount = discount_codes[st.session_state.discount_code.upper()]
-                total_discount_percent += code_discount
-                discount_sources.append(f'Code {st.session_state.discount_code.upper()} ({code_discount}%)')
-            
-            if st.session_state.manual_discount > 0:
-                total_discount_percent += st.session_state.manual_discount
-                discount_sources.append(f'Manueller Rabatt ({st.session_state.manual_discount}%)')
-            
-            discount_amount = gross_price * (total_discount_percent / 100)
-            total_price = gross_price - discount_amount
+            additional_services = st.session_state.additional_services
+            prices = calculate_invoice(
+                catalog.mtime,
+                service['price'],
+                tuple(line_total(item) for item in additional_services),
+                st.session_state.is_regular_customer,
+                st.session_state.discount_code,
+                st.session_state.manual_discount,
+                discount_codes
+            )
+            discount_sources = prices['discount_sources']
+            service_price = prices['service_price']
+            net_price = prices['net_price']
+            tax_amount = prices['tax_amount']
+            gross_price = prices['gross_price']
+            total_discount_percent = prices['total_discount_percent']
+            discount_amount = prices['discount_amount']
+            total_price = prices['total_price']
             
             # Invoice preview
             st.markdown('<div class="invoice-preview">', unsafe_allow_html=True)
             
             # Header
             st.markdown("### 📋 RECHNUNG")
-            current_date = datetime.now()
+            # Whole minutes, like the invoice number, so reruns within a minute hit the PDF cache
+            current_date = datetime.now().replace(second=0, microsecond=0)
             due_date = current_date + timedelta(days=14)
-            invoice_number = f"2025-{current_date.strftime('%m%d%H%M')}"
+            invoice_number = current_date.strftime('%Y-%m%d%H%M')
             
             col_info1, col_info2 = st.columns(2)
             with col_info1:
@@ -350,36 +278,25 @@ def main():
             st.divider()
             
             # Service table
-            invoice_data = []
-            invoice_data.append({
-                'Beschreibung': service['name'],
-                'Preis': f"{service_price:.2f}€"
-            })
+            invoice_rows = [(service['name'], f"{service_price:.2f}€")]
             
             for additional in additional_services:
-                invoice_data.append({
-                    'Beschreibung': additional['description'],
-                    'Preis': f"{additional['price']:.2f}€"
-                })
-            
-            invoice_data.append({
-                'Beschreibung': 'MwSt. (19%)',
-                'Preis': f"{tax_amount:.2f}€"
-            })
+                description = additional['description']
+                if additional['quantity'] > 1:
+                    description = f"{additional['quantity']} × {description} (je {additional['price']:.2f}€)"
+                invoice_rows.append((description, f"{line_total(additional):.2f}€"))
             
-            invoice_data.append({
-                'Beschreibung': '**Zwischensumme**',
-                'Preis': f"**{gross_price:.2f}€**"
-            })
+            invoice_rows.append(('MwSt. (19%)', f"{tax_amount:.2f}€"))
+            invoice_rows.append(('**Zwischensumme**', f"**{gross_price:.2f}€**"))
             
             if total_discount_percent > 0:
-                invoice_data.append({
-                    'Beschreibung': f'🎯 Gesamtrabatt ({total_discount_percent}%)',
-                    'Preis': f"-{discount_amount:.2f}€"
-                })
+                invoice_rows.append((
+                    f'🎯 Gesamtrabatt ({total_discount_percent.normalize():f}%)',
+                    f"-{discount_amount:.2f}€"
+                ))
             
-            df = pd.DataFrame(invoice_data)
-            st.table(df)
+            # Plain Markdown: st.table() would pull in pandas just for this
+            st.markdown(preview_table(invoice_rows))
             
             # Total
             st.markdown(f'<div class="total-amount">Gesamt inkl. MwSt.: {total_price:.2f}€</div>', unsafe_allow_html=True)
@@ -406,10 +323,11 @@ def main():
                     'total_discount_percent': total_discount_percent,
                     'discount_sources': discount_sources,
                     'discount_amount': discount_amount,
-                    'total_price': total_price
+                    'total_price': total_price,
+                    'invoice_date': current_date
                 }
                 
-                pdf_bytes = generate_pdf(invoice_data_pdf)
+                pdf_bytes = get_invoice_pdf(invoice_data_pdf, invoice_number)
                 
                 st.download_button(
                     label="📄 PDF herunterladen",
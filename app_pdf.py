@@ -0,0 +1,174 @@
+"""PDF rendering for the Streamlit app.
+
+Kept out of app.py so fpdf2 (and Pillow, via assets.py) are only imported
+when the first invoice is downloaded, not on every cold start.
+"""
+from datetime import datetime, timedelta
+
+from fpdf import FPDF
+
+from line_items import line_total
+from metrics import PDF_BYTES, RENDERS_IN_FLIGHT, stage
+from pdf_fonts import FONT_FAMILY, FontSelection, add_fonts, core_font_covers, text_shaping
+from pricing import price_line
+
+
+class GlanzwerkInvoicePDF(FontSelection, FPDF):
+    def __init__(self, logo=None, core_font=False):
+        super().__init__()
+        self.logo = logo
+        self.set_auto_page_break(auto=True, margin=15)
+        # Latin-1 invoices print in the core font; embedded DejaVu Sans (parsed once
+        # per process, see pdf_fonts.py) prints non-latin-1 names
+        self.core_font = core_font
+        if not core_font:
+            add_fonts(self)
+    
+    def amount_cell(self, w, h, text, ln=0):
+        """Right-aligned bordered cell, in a smaller size if `text` is wider than `w` in the current font"""
+        size = self.font_size_pt
+        available = w - 2 * self.c_margin
+        text_width = self.get_string_width(text)
+        if text_width > available:
+            self.set_font_size(size * available / text_width)
+        self.cell(w, h, text, 1, ln, 'R')
+        self.set_font_size(size)
+        
+    def header(self):
+        # Logo (prepared once per process and shared across reruns, see assets.py)
+        if self.logo is not None:
+            self.logo.place(self, x=10, y=8, w=25)
+        
+        # Company header
+        self.set_font(FONT_FAMILY, 'B', 16)
+        self.cell(0, 10, 'GLANZWERK RHEINLAND', 0, 1, 'C')
+        self.set_font(FONT_FAMILY, '', 10)
+        self.cell(0, 5, 'Grün gedacht, sauber gemacht', 0, 1, 'C')
+        self.cell(0, 5, 'Krasnaer Str. 1, 56566 Neuwied, Deutschland', 0, 1, 'C')
+        self.ln(10)
+        
+    def footer(self):
+        self.set_y(-40)
+        self.set_font(FONT_FAMILY, '', 9)
+        
+        # Contact information
+        self.cell(60, 4, 'Glanzwerk Rheinland', 0, 0, 'L')
+        self.cell(70, 4, 'Glanzwerk.Rheinland@gmail.com', 0, 0, 'L')
+        self.cell(60, 4, 'Bankverbindung:', 0, 1, 'L')
+        
+        self.cell(60, 4, 'Krasnaer Str. 1', 0, 0, 'L')
+        self.cell(70, 4, '+49 171 1858241', 0, 0, 'L')
+        self.cell(60, 4, 'Bank: Sparkasse Neuwied', 0, 1, 'L')
+        
+        self.cell(60, 4, '56566 Neuwied', 0, 0, 'L')
+        self.cell(70, 4, 'Instagram: @glanzwerk_rheinland', 0, 0, 'L')
+        self.cell(60, 4, 'IBAN: DE89 5745 0120 0000 1234 56', 0, 1, 'L')
+
+
+def generate_pdf(invoice_data, logo=None):
+    """Generate PDF invoice"""
+    core_font = core_font_covers(
+        invoice_data['customer_name'], invoice_data['vehicle_number'], invoice_data['service_name'],
+        *(additional['description'] for additional in invoice_data['additional_services'])
+    )
+    with RENDERS_IN_FLIGHT.track():
+        with stage('layout'):
+            pdf = GlanzwerkInvoicePDF(logo, core_font)
+            pdf.add_page()
+            layout_invoice(pdf, invoice_data)
+        with stage('output'):
+            pdf_output = bytes(pdf.output())
+    PDF_BYTES.observe(len(pdf_output))
+    return pdf_output
+
+
+def layout_invoice(pdf, invoice_data):
+    """Lay the invoice out on the current page of `pdf`"""
+    # Invoice header
+    current_date = invoice_data.get('invoice_date') or datetime.now()
+    due_date = current_date + timedelta(days=14)
+    invoice_number = current_date.strftime('%Y-%m%d%H%M')
+    
+    pdf.set_xy(120, 35)
+    pdf.set_font(FONT_FAMILY, '', 11)
+    pdf.cell(70, 6, f'Rechnungsnummer: {invoice_number}', 0, 1, 'L')
+    pdf.set_x(120)
+    pdf.cell(70, 6, f'Rechnungsdatum: {current_date.strftime("%d.%m.%Y")}', 0, 1, 'L')
+    pdf.set_x(120)
+    pdf.cell(70, 6, f'Fälligkeitsdatum: {due_date.strftime("%d.%m.%Y")}', 0, 1, 'L')
+    
+    # Customer information
+    pdf.set_xy(10, 70)
+    pdf.set_font(FONT_FAMILY, 'B', 16)
+    pdf.cell(0, 10, 'RECHNUNG', 0, 1, 'L')
+    pdf.ln(5)
+    
+    pdf.set_font(FONT_FAMILY, '', 11)
+    pdf.cell(0, 6, 'Sehr geehrte Damen und Herren,', 0, 1, 'L')
+    pdf.ln(3)
+    pdf.cell(0, 6, 'vielen Dank für Ihre Inanspruchnahme unserer Dienstleistungen.', 0, 1, 'L')
+    pdf.ln(8)
+    
+    with text_shaping(pdf, invoice_data['customer_name']):
+        pdf.cell(0, 6, f'Kunde: {invoice_data["customer_name"]}', 0, 1, 'L')
+    pdf.cell(0, 6, f'Fahrzeug: {invoice_data["vehicle_number"]}', 0, 1, 'L')
+    pdf.ln(8)
+    
+    # Service table
+    with stage('service_table'):
+        service_table(pdf, invoice_data)
+    
+    pdf.ln(8)
+    
+    # Payment information
+    pdf.set_font(FONT_FAMILY, '', 10)
+    pdf.cell(0, 6, f'Bitte überweisen Sie den Betrag bis spätestens {due_date.strftime("%d.%m.%Y")}', 0, 1, 'L')
+    pdf.ln(5)
+    pdf.cell(0, 6, 'Mit freundlichen Grüßen,', 0, 1, 'L')
+    pdf.cell(0, 6, 'Glanzwerk Rheinland', 0, 1, 'L')
+
+
+def service_table(pdf, invoice_data):
+    """Line items and totals"""
+    pdf.set_font(FONT_FAMILY, 'B', 11)
+    pdf.cell(80, 8, 'Beschreibung', 1, 0, 'L')
+    pdf.cell(25, 8, 'Anzahl', 1, 0, 'C')
+    pdf.cell(25, 8, 'Einzelpreis', 1, 0, 'R')
+    pdf.cell(25, 8, 'MwSt.', 1, 0, 'R')
+    pdf.cell(25, 8, 'Gesamt', 1, 1, 'R')
+    
+    # Main service
+    pdf.set_font(FONT_FAMILY, '', 10)
+    service_net, service_tax, service_gross = price_line(invoice_data['service_price'])
+    
+    pdf.cell(80, 8, invoice_data['service_name'], 1, 0, 'L')
+    pdf.cell(25, 8, '1', 1, 0, 'C')
+    pdf.amount_cell(25, 8, f"{service_net:.2f}EUR")
+    pdf.amount_cell(25, 8, f"{service_tax:.2f}EUR")
+    pdf.amount_cell(25, 8, f"{service_gross:.2f}EUR", 1)
+    
+    # Additional services
+    for additional in invoice_data['additional_services']:
+        # Unit price, then tax and gross of the whole line
+        add_net, add_tax, add_gross = price_line(line_total(additional))
+        
+        with text_shaping(pdf, additional['description']):
+            pdf.cell(80, 8, additional['description'], 1, 0, 'L')
+        pdf.cell(25, 8, str(additional['quantity']), 1, 0, 'C')
+        pdf.amount_cell(25, 8, f"{additional['price']:.2f}EUR")
+        pdf.amount_cell(25, 8, f"{add_tax:.2f}EUR")
+        pdf.amount_cell(25, 8, f"{add_gross:.2f}EUR", 1)
+    
+    # Totals
+    pdf.set_font(FONT_FAMILY, 'B', 10)
+    pdf.cell(155, 8, 'Zwischensumme inkl. MwSt.', 1, 0, 'R')
+    pdf.amount_cell(25, 8, f"{invoice_data['gross_price']:.2f}EUR", 1)
+    
+    if invoice_data['total_discount_percent'] > 0:
+        pdf.set_font(FONT_FAMILY, '', 10)
+        pdf.cell(155, 8, f"Gesamtrabatt ({invoice_data['total_discount_percent'].normalize():f}%)", 1, 0, 'L')
+        pdf.amount_cell(25, 8, f"-{invoice_data['discount_amount']:.2f}EUR", 1)
+    
+    pdf.set_font(FONT_FAMILY, 'B', 11)
+    pdf.cell(155, 10, 'Gesamt inkl. MwSt.', 1, 0, 'R')
+    pdf.amount_cell(25, 10, f"{invoice_data['total_price']:.2f}EUR", 1)
@@ -0,0 +1,101 @@
+"""Process-wide cache for assets shared by every invoice PDF.
+
+The logo is decoded, downscaled to its printed size and compressed into a PDF
+image stream once; every document then reuses that prepared stream instead of
+decoding and recompressing the full-resolution PNG on each page.
+"""
+import os
+import threading
+import time
+
+from fpdf.fpdf import ImageInfo
+from fpdf.image_parsing import get_img_info
+from PIL import Image
+
+# Printed size of the logo in the page header
+LOGO_WIDTH_MM = 25
+LOGO_DPI = 300
+
+# How often (in seconds) the logo file is stat()ed for changes
+MTIME_CHECK_INTERVAL = 5.0
+
+_logo_caches = {}
+_registry_lock = threading.Lock()
+
+
+class LogoCache:
+    """Prepared PDF image stream for one logo file, invalidated on mtime change"""
+
+    def __init__(self, path, width_mm=LOGO_WIDTH_MM, dpi=LOGO_DPI):
+        self.path = path
+        self.width_mm = width_mm
+        self.dpi = dpi
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._name = None
+        self._info = None
+        self._checked_at = 0.0
+
+    def _prepare(self, mtime):
+        target_width = round(self.width_mm / 25.4 * self.dpi)
+        with Image.open(self.path) as img:
+            img.load()
+            if img.width > target_width:
+                target_height = round(img.height * target_width / img.width)
+                img = img.resize((target_width, target_height), resample=Image.LANCZOS)
+            else:
+                img = img.copy()
+        # Keep the stream self-contained; an ICC profile would have to be
+        # registered separately in every document
+        img.info.pop('icc_profile', None)
+
+        self._name = f'logo-{os.path.basename(self.path)}-{mtime}'
+        self._info = get_img_info(self._name, img, 'FlateDecode')
+        self._mtime = mtime
+
+    def _refresh(self):
+        now = time.monotonic()
+        if self._info is not None and now - self._checked_at < MTIME_CHECK_INTERVAL:
+            return
+        with self._lock:
+            if self._info is not None and now - self._checked_at < MTIME_CHECK_INTERVAL:
+                return
+            try:
+                mtime = os.stat(self.path).st_mtime_ns
+            except OSError:
+                self._mtime = self._name = self._info = None
+            else:
+                if mtime != self._mtime:
+                    self._prepare(mtime)
+            self._checked_at = now
+
+    def warm(self):
+        """Prepare the logo now instead of on the first rendered page"""
+        self._refresh()
+        return self._info is not None
+
+    def place(self, pdf, x, y, w=None):
+        """Draw the logo on the current page of `pdf`; returns False if there is no logo file"""
+        self._refresh()
+        name, info = self._name, self._info
+        if info is None:
+            return False
+        if name not in pdf.images:
+            # Register the prepared stream so FPDF.image() finds it without reading the file
+            entry = ImageInfo(info)
+            entry['i'] = len(pdf.images) + 1
+            entry['usages'] = 0
+            entry['iccp_i'] = None
+            pdf.images[name] = entry
+        pdf.image(name, x=x, y=y, w=w or self.width_mm)
+        return True
+
+
+def get_logo(path):
+    """Return the shared LogoCache for `path`"""
+    path = os.path.abspath(path)
+    cache = _logo_caches.get(path)
+    if cache is None:
+        with _registry_lock:
+            cache = _logo_caches.setdefault(path, LogoCache(path))
+    return cache
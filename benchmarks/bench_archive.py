@@ -0,0 +1,109 @@
+"""PDF archive pack versus one file per invoice: disk usage, write and random read time.
+
+Renders --invoices distinct invoices (with the logo, if static/glanzwerk_logo.png
+exists), writes them as single files and into a PDFArchive, then reads random
+invoices back from both.
+
+Usage: python benchmarks/bench_archive.py [--invoices 300] [--reads 2000]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from flask import Flask  # noqa: E402
+
+import invoice  # noqa: E402
+from pdf_archive import PDFArchive  # noqa: E402
+
+FIRST_NAMES = ('Jürgen', 'Anna', 'Petra', 'Lukas', 'Mehmet', 'Sofia', 'Jan', 'Leonie')
+LAST_NAMES = ('Müller', 'Schmidt', 'Özdemir', 'Weber', 'Becker', 'Hoffmann', 'Krämer')
+SERVICES = ('aussenreinigung', 'innenraumreinigung', 'lackpolitur', 'felgenreinigung')
+
+# Typical file system block; every small file occupies at least one
+BLOCK_SIZE = 4096
+
+
+def render(count):
+    app = Flask(__name__)
+    pdfs = []
+    for i in range(count):
+        with app.test_request_context():
+            invoice_data = invoice.build_invoice_data({
+                'customerName': f'{random.choice(FIRST_NAMES)} {random.choice(LAST_NAMES)}',
+                'vehicleNumber': f'NR-GW {random.randrange(1, 9999)}',
+                'selectedService': random.choice(SERVICES),
+                'additionalServices': 'Ozonbehandlung: 29.90' if i % 3 == 0 else '',
+                'isRegularCustomer': i % 4 == 0,
+            })
+        pdfs.append((f'2025-BENCH-{i:06d}', bytes(invoice.render_invoice_pdf(invoice_data, f'2025-BENCH-{i:06d}'))))
+    return pdfs
+
+
+def median_us(func, runs):
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter_ns()
+        func()
+        timings.append(time.perf_counter_ns() - started)
+    timings.sort()
+    return timings[len(timings) // 2] / 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--invoices', type=int, default=300)
+    parser.add_argument('--reads', type=int, default=2000)
+    args = parser.parse_args()
+
+    random.seed(1)
+    started = time.perf_counter()
+    pdfs = render(args.invoices)
+    print(f'{args.invoices} invoices rendered in {time.perf_counter() - started:.1f} s')
+    numbers = [number for number, _ in pdfs]
+
+    with tempfile.TemporaryDirectory() as directory:
+        started = time.perf_counter()
+        for number, pdf in pdfs:
+            with open(os.path.join(directory, f'{number}.pdf'), 'wb') as f:
+                f.write(pdf)
+        files_seconds = time.perf_counter() - started
+        files_bytes = sum(-(-len(pdf) // BLOCK_SIZE) * BLOCK_SIZE for _, pdf in pdfs)
+
+        archive = PDFArchive(os.path.join(directory, 'invoices.pack'))
+        started = time.perf_counter()
+        for number, pdf in pdfs:
+            archive.put(number, pdf)
+        archive_seconds = time.perf_counter() - started
+        archive_bytes = os.path.getsize(archive.path) + os.path.getsize(archive.index_path)
+
+        for label, size, seconds in (('files', files_bytes, files_seconds), ('archive', archive_bytes, archive_seconds)):
+            print(f'{label:>8}: {size / 1024 / 1024:7.2f} MiB on disk, {size / args.invoices / 1024:6.1f} KiB per invoice, '
+                  f'{seconds / args.invoices * 1000:.2f} ms per write')
+
+        def read_file():
+            with open(os.path.join(directory, f'{random.choice(numbers)}.pdf'), 'rb') as f:
+                f.read()
+
+        def read_archive():
+            archive.get(random.choice(numbers))
+
+        started = time.perf_counter()
+        opened = PDFArchive(archive.path)
+        opened.get(numbers[0])
+        print(f'open archive and read one invoice: {(time.perf_counter() - started) * 1000:.2f} ms')
+        for label, func in (('file read', read_file), ('archive read', read_archive)):
+            func()  # warm-up
+            print(f'{label:>13}: {median_us(func, args.reads):8.1f} us per invoice (median)')
+
+        started = time.perf_counter()
+        problems = archive.verify()
+        print(f'verify: {len(problems)} problems in {(time.perf_counter() - started) * 1000:.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
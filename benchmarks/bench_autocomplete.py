@@ -0,0 +1,110 @@
+"""Customer and plate autocomplete from the in-memory prefix index.
+
+Fills a temporary database like bench_search.py, loads the index, then types
+names and plates of random customers one character at a time and times every
+keystroke: straight against the index and through GET /api/search/customers.
+Finally stores a new customer through the write-behind queue and checks it is
+suggested once its batch is committed.
+
+Usage: python benchmarks/bench_autocomplete.py [--invoices 1000000] [--customers 50000]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from flask import Flask  # noqa: E402
+
+import invoice  # noqa: E402
+import invoice_store  # noqa: E402
+from bench_search import fill  # noqa: E402
+from customer_index import CustomerIndex, get_customer_index  # noqa: E402
+from extensions import db  # noqa: E402
+from invoice_store import init_invoice_store, store_invoice  # noqa: E402
+from search import search_bp  # noqa: E402
+
+
+def keystrokes(people, typed):
+    """Every prefix a user passes through while typing `typed` names and plates"""
+    random.seed(2)
+    prefixes = []
+    for _ in range(typed):
+        name, plate = random.choice(people)
+        for text in (name.split()[random.randrange(2)], name, plate):
+            prefixes.extend(text[:length] for length in range(1, len(text) + 1))
+    return prefixes
+
+
+def report(label, timings):
+    timings.sort()
+    def at(q):
+        return timings[min(len(timings) - 1, int(len(timings) * q))] * 1000
+    print(f'{label:>10}: {len(timings)} keystrokes, median {at(0.5):.3f} ms, p99 {at(0.99):.3f} ms, '
+          f'max {timings[-1] * 1000:.3f} ms')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--invoices', type=int, default=1000000)
+    parser.add_argument('--customers', type=int, default=50000)
+    parser.add_argument('--typed', type=int, default=300, help='names and plates typed')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(directory, 'bench.db')}"
+        db.init_app(app)
+        app.register_blueprint(search_bp, url_prefix='/api/search')
+        index = get_customer_index()
+        init_invoice_store(app, on_commit=lambda: index.refresh(db.session))
+        client = app.test_client()
+        with app.app_context():
+            people = fill(args.invoices, args.customers)
+            started = time.perf_counter()
+            index.refresh(db.session)
+            elapsed = time.perf_counter() - started
+            # A second copy, loaded under tracemalloc (which slows it down) for its size
+            tracemalloc.start()
+            copy = CustomerIndex()
+            copy.refresh(db.session)
+            memory = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            print(f'{len(index)} customers from {args.invoices} invoices loaded in {elapsed:.2f} s, '
+                  f'{memory / 1024 / 1024:.1f} MiB')
+
+        prefixes = keystrokes(people, args.typed)
+        timings = []
+        for prefix in prefixes:
+            started = time.perf_counter()
+            index.suggest(prefix)
+            timings.append(time.perf_counter() - started)
+        report('index', timings)
+
+        timings = []
+        for prefix in prefixes:
+            started = time.perf_counter()
+            response = client.get('/api/search/customers', query_string={'q': prefix})
+            timings.append(time.perf_counter() - started)
+            assert response.status_code == 200, response.data
+        report('endpoint', timings)
+
+        with app.test_request_context():
+            invoice_data = invoice.build_invoice_data({
+                'customerName': 'Zoë Quandt', 'vehicleNumber': 'NR-QQ 4711', 'selectedService': 'innenraumreinigung',
+            })
+        started = time.perf_counter()
+        store_invoice('BENCH-NEW', invoice_data)
+        while not index.suggest('zoe q'):
+            time.sleep(0.001)
+        print(f'new customer suggested {(time.perf_counter() - started) * 1000:.0f} ms after store_invoice '
+              f'(write-behind flush interval {invoice_store.WRITE_FLUSH_INTERVAL * 1000:.0f} ms)')
+        invoice_store._writer.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""Streaming export: time and peak Python memory for a small and a large export.
+
+Fills a temporary database with --invoices invoices, one per hour, then
+exports the first day (24 invoices) and all of them, as CSV, DATEV and gzipped
+CSV. The peak (tracemalloc) should be about the same for both; only the time grows.
+
+Usage: python benchmarks/bench_exports.py [--invoices 100000]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from flask import Flask  # noqa: E402
+
+import invoice_store  # noqa: E402
+from exports import iter_export  # noqa: E402
+from extensions import db  # noqa: E402
+from invoice_store import Invoice, init_invoice_store  # noqa: E402
+
+FIRST_DAY = datetime(2024, 1, 1)
+
+
+def fill(invoices):
+    rows = [{
+        'invoice_number': f'BENCH-{i}', 'invoice_date': FIRST_DAY + timedelta(hours=i),
+        'customer_name': f'Kunde {i % 5000}', 'vehicle_number': f'NR-GW {i % 5000}',
+        'service_key': 'lackpolitur', 'service_name': 'Lackpolitur & Glanzversiegelung', 'service_cents': 15000,
+        'net_cents': 15000, 'tax_cents': 2850, 'gross_cents': 17850, 'discount_percent': '10',
+        'discount_cents': 1785, 'total_cents': 16065, 'discount_sources': '["Stammkundenrabatt (10%)"]',
+    } for i in range(invoices)]
+    db.session.execute(Invoice.__table__.insert(), rows)
+    db.session.commit()
+
+
+def export(export_format, last_day, compress):
+    written = 0
+    for data in iter_export(db.session, export_format, FIRST_DAY.date(), last_day, compress):
+        written += len(data)
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--invoices', type=int, default=100000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(directory, 'bench.db')}"
+        db.init_app(app)
+        init_invoice_store(app)
+        with app.app_context():
+            fill(args.invoices)
+            for invoices in (min(24, args.invoices), args.invoices):
+                last_day = (FIRST_DAY + timedelta(hours=invoices - 1)).date()
+                for export_format, compress in (('csv', False), ('datev', False), ('csv', True)):
+                    started = time.perf_counter()
+                    written = export(export_format, last_day, compress)
+                    elapsed = time.perf_counter() - started
+                    tracemalloc.start()
+                    export(export_format, last_day, compress)
+                    peak = tracemalloc.get_traced_memory()[1]
+                    tracemalloc.stop()
+                    label = export_format + (' + gzip' if compress else '')
+                    print(f'{invoices:>8} invoices, {label:<10}: {elapsed * 1000:9.1f} ms, '
+                          f'{written / 1024:9.1f} KiB, peak {peak / 1024:7.1f} KiB')
+        invoice_store._writer.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+"""Render time of invoices with the core font versus the embedded DejaVu Sans.
+
+Compares, per invoice:
+  core      the latin-1 PDF core font (Helvetica), nothing embedded; what latin-1 invoices use
+  add_font  DejaVu Sans via FPDF.add_font(), which parses the TTF file every time
+  cached    DejaVu Sans from pdf_fonts, parsed once per process; what all other invoices use
+
+Usage: python benchmarks/bench_fonts.py [--runs N]
+"""
+import argparse
+import os
+import sys
+import time
+import warnings
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import invoice  # noqa: E402
+import pdf_fonts  # noqa: E402
+
+REPO_LOGO = os.path.join(os.path.dirname(__file__), '..', 'glanzwerk_logo.png')
+
+PAYLOADS = {
+    'latin': {
+        'customerName': 'Max Mustermann',
+        'vehicleNumber': 'NR-GW 123',
+        'selectedService': 'lackpolitur',
+        'additionalServices': 'Wachsbehandlung: 40\nSpezialreinigung: 25',
+    },
+    'unicode': {
+        'customerName': 'Łukasz Wójcik / محمد الأحمد',
+        'vehicleNumber': 'NR-ĄĘ 12',
+        'selectedService': 'lackpolitur',
+        'additionalServices': 'Wachsbehandlung: 40\nتلميع: 25',
+    },
+}
+
+
+def _uncached_fonts(pdf):
+    for style, filename in pdf_fonts.FONT_FILES.items():
+        pdf.add_font(pdf_fonts.FONT_FAMILY, style, os.path.join(pdf_fonts.FONT_DIR, filename))
+
+
+class CoreFontInvoicePDF(invoice.GlanzwerkInvoicePDF):
+    def __init__(self, use_template=True, core_font=True):
+        super().__init__(use_template, core_font=True)
+
+
+class CachedFontInvoicePDF(invoice.GlanzwerkInvoicePDF):
+    def __init__(self, use_template=True, core_font=False):
+        super().__init__(use_template, core_font=False)
+
+
+class UncachedFontInvoicePDF(invoice.GlanzwerkInvoicePDF):
+    def __init__(self, use_template=False, core_font=False):
+        invoice.FPDF.__init__(self)
+        self.set_auto_page_break(auto=True, margin=15)
+        self.use_template = use_template
+        _uncached_fonts(self)
+
+
+def bench(pdf_class, invoice_data, runs):
+    original = invoice.GlanzwerkInvoicePDF
+    invoice.GlanzwerkInvoicePDF = pdf_class
+    try:
+        invoice.render_invoice_pdf(invoice_data, '2025-BENCH')  # warm-up
+        timings = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            pdf_bytes = invoice.render_invoice_pdf(invoice_data, '2025-BENCH')
+            timings.append(time.perf_counter() - started)
+    finally:
+        invoice.GlanzwerkInvoicePDF = original
+    timings.sort()
+    return timings[len(timings) // 2] * 1000, len(pdf_bytes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=20)
+    args = parser.parse_args()
+
+    warnings.simplefilter('ignore')
+    invoice.LOGO_PATH = REPO_LOGO
+    invoice.get_logo(REPO_LOGO).warm()
+
+    # invoice.py already warmed pdf_fonts on import; time one more reduction of the regular style
+    started = time.perf_counter()
+    pdf_fonts.FontTables(os.path.join(pdf_fonts.FONT_DIR, pdf_fonts.FONT_FILES['']), '')
+    print(f'FontTables(): {(time.perf_counter() - started) * 1000:.0f} ms per style, once per process\n')
+
+    classes = (
+        ('core', CoreFontInvoicePDF),
+        ('add_font', UncachedFontInvoicePDF),
+        ('cached', CachedFontInvoicePDF),
+    )
+    for payload_name, payload in PAYLOADS.items():
+        invoice_data = invoice.build_invoice_data(payload)
+        for label, pdf_class in classes:
+            if label == 'core' and payload_name != 'latin':
+                continue  # the core font cannot print these names
+            median_ms, size = bench(pdf_class, invoice_data, args.runs)
+            print(f'{payload_name:>8} {label:>9}: {median_ms:8.2f} ms/invoice (median)  {size / 1024:9.1f} KiB')
+
+
+if __name__ == '__main__':
+    main()
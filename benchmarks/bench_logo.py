@@ -0,0 +1,68 @@
+"""Render time and output size of invoices with and without the logo cache.
+
+Usage: python benchmarks/bench_logo.py [--runs N]
+"""
+import argparse
+import os
+import sys
+import time
+import warnings
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import invoice  # noqa: E402
+
+REPO_LOGO = os.path.join(os.path.dirname(__file__), '..', 'glanzwerk_logo.png')
+
+PAYLOAD = {
+    'customerName': 'Max Mustermann',
+    'vehicleNumber': 'NR-GW 123',
+    'selectedService': 'lackpolitur',
+    'additionalServices': 'Wachsbehandlung: 40\nSpezialreinigung: 25',
+}
+
+
+class UncachedInvoicePDF(invoice.GlanzwerkInvoicePDF):
+    """The header as it was before the cache: decode the full PNG on every page"""
+
+    def header(self):
+        if os.path.exists(REPO_LOGO):
+            self.image(REPO_LOGO, x=10, y=8, w=25)
+        self.set_font('Arial', '', 10)
+        self.set_xy(45, 15)
+        self.cell(0, 5, 'Glanzwerk Rheinland, Krasnaer Str. 1, 56566 Neuwied, Deutschland', 0, 1, 'L')
+        self.ln(10)
+
+
+def bench(pdf_class, runs):
+    invoice_data = invoice.build_invoice_data(PAYLOAD)
+    original = invoice.GlanzwerkInvoicePDF
+    invoice.GlanzwerkInvoicePDF = pdf_class
+    try:
+        timings = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            pdf_bytes = invoice.render_invoice_pdf(invoice_data, '2025-BENCH')
+            timings.append(time.perf_counter() - started)
+    finally:
+        invoice.GlanzwerkInvoicePDF = original
+    timings.sort()
+    return timings[len(timings) // 2] * 1000, len(pdf_bytes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=20)
+    args = parser.parse_args()
+
+    warnings.simplefilter('ignore')
+    invoice.LOGO_PATH = REPO_LOGO
+    invoice.get_logo(REPO_LOGO).warm()
+
+    for label, pdf_class in (('uncached', UncachedInvoicePDF), ('cached', invoice.GlanzwerkInvoicePDF)):
+        median_ms, size = bench(pdf_class, args.runs)
+        print(f'{label:>9}: {median_ms:8.2f} ms/invoice (median)  {size / 1024:9.1f} KiB')
+
+
+if __name__ == '__main__':
+    main()
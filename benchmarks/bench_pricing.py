@@ -0,0 +1,60 @@
+"""Batch (NumPy, integer cents) pricing against looping the scalar Decimal path.
+
+Usage: python benchmarks/bench_pricing.py [--invoices N]
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from pricing import price_batch, price_invoice, to_cents  # noqa: E402
+
+DISCOUNTS = (0, 10, 12, 15, 20, 22, 25, 27.5, 30)
+
+
+def make_invoices(count, seed=2025):
+    rng = random.Random(seed)
+    invoices = []
+    for _ in range(count):
+        service_price = rng.choice((20, 25, 30, 40, 50, 60, 70, 80, 100, 150, 200, 300, 500))
+        additional = [round(rng.uniform(5, 120), 2) for _ in range(rng.randint(0, 4))]
+        invoices.append((service_price, additional, rng.choice(DISCOUNTS)))
+    return invoices
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--invoices', type=int, default=100000)
+    args = parser.parse_args()
+
+    invoices = make_invoices(args.invoices)
+
+    started = time.perf_counter()
+    scalar = [price_invoice(service, additional, discount) for service, additional, discount in invoices]
+    scalar_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    net_cents = [to_cents(service) + sum(to_cents(price) for price in additional) for service, additional, _ in invoices]
+    basis_points = [round(discount * 100) for _, _, discount in invoices]
+    prepared_seconds = time.perf_counter() - started
+    price_batch([0], [0])  # pricing imports NumPy on first use; keep that out of the timing
+    started = time.perf_counter()
+    batch = price_batch(net_cents, basis_points)
+    batch_seconds = time.perf_counter() - started
+
+    for key in ('net_price', 'tax_amount', 'gross_price', 'discount_amount', 'total_price'):
+        expected = [to_cents(result[key]) for result in scalar]
+        if expected != batch[key].tolist():
+            raise SystemExit(f'batch and scalar results differ in {key}')
+
+    print(f'{args.invoices} invoices, identical results')
+    print(f'  scalar loop: {scalar_seconds * 1000:9.1f} ms')
+    print(f'  batch:       {batch_seconds * 1000:9.1f} ms (+{prepared_seconds * 1000:.1f} ms building cent arrays)')
+    print(f'  speedup:     {scalar_seconds / batch_seconds:9.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,116 @@
+"""Report queries on the rollups versus aggregating the raw invoices table.
+
+Fills a temporary database with --years of invoices (--per-day per day) and
+times a one-year monthly revenue report from the rollup tables against the
+same sums computed with a GROUP BY over the invoices.
+
+Usage: python benchmarks/bench_reports.py [--years 5] [--per-day 60] [--runs 20]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from flask import Flask  # noqa: E402
+from sqlalchemy import func, select  # noqa: E402
+
+import invoice_store  # noqa: E402
+from extensions import db  # noqa: E402
+from invoice_store import Invoice, init_invoice_store, rebuild_rollups  # noqa: E402
+from reports import reports_bp  # noqa: E402
+
+SERVICES = ('aussenreinigung', 'innenraumreinigung', 'lackpolitur', 'felgenreinigung')
+
+
+def fill(years, per_day):
+    first_day = datetime(2026, 1, 1) - timedelta(days=365 * years)
+    rows = []
+    for day in range(365 * years):
+        for slot in range(per_day):
+            customer = random.randrange(5000)
+            rows.append({
+                'invoice_number': f'BENCH-{day}-{slot}',
+                'invoice_date': first_day + timedelta(days=day, minutes=8 * slot),
+                'customer_name': f'Kunde {customer}', 'vehicle_number': f'NR-GW {customer}',
+                'service_key': random.choice(SERVICES), 'service_name': 'Service', 'service_cents': 5000,
+                'net_cents': 5000, 'tax_cents': 950, 'gross_cents': 5950, 'discount_percent': '10',
+                'discount_cents': 595, 'total_cents': 5355,
+                'discount_sources': json.dumps(['Stammkundenrabatt (10%)']),
+            })
+        if len(rows) >= 50000:
+            db.session.execute(Invoice.__table__.insert(), rows)
+            rows = []
+    if rows:
+        db.session.execute(Invoice.__table__.insert(), rows)
+    db.session.commit()
+
+
+def median_ms(func, runs):
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return timings[len(timings) // 2] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--years', type=int, default=5)
+    parser.add_argument('--per-day', type=int, default=60)
+    parser.add_argument('--runs', type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(directory, 'bench.db')}"
+        db.init_app(app)
+        app.register_blueprint(reports_bp, url_prefix='/api/reports')
+        init_invoice_store(app)
+        client = app.test_client()
+        with app.app_context():
+            fill(args.years, args.per_day)
+            started = time.perf_counter()
+            invoices = rebuild_rollups()
+            print(f'{invoices} invoices over {args.years} years; rebuild {time.perf_counter() - started:.2f} s')
+
+            def rollup_report():
+                response = client.get('/api/reports/revenue?period=month&from=2025-01-01&to=2025-12-31')
+                assert response.status_code == 200, response.data
+
+            def raw_report():
+                db.session.execute(
+                    select(func.strftime('%Y-%m', Invoice.invoice_date), func.count(), func.sum(Invoice.total_cents))
+                    .where(Invoice.invoice_date.between(datetime(2025, 1, 1), datetime(2026, 1, 1)))
+                    .group_by(func.strftime('%Y-%m', Invoice.invoice_date))
+                ).all()
+
+            def raw_services_all_time():
+                db.session.execute(
+                    select(Invoice.service_key, func.sum(Invoice.total_cents)).group_by(Invoice.service_key)
+                ).all()
+
+            def rollup_services_all_time():
+                response = client.get('/api/reports/services?from=2000-01-01&to=2025-12-31')
+                assert response.status_code == 200, response.data
+
+            for label, func_ in (
+                ('rollups, 1 year by month', rollup_report),
+                ('invoices, 1 year by month', raw_report),
+                ('rollups, services all time', rollup_services_all_time),
+                ('invoices, services all time', raw_services_all_time),
+            ):
+                func_()  # warm-up
+                print(f'{label:>28}: {median_ms(func_, args.runs):8.2f} ms (median)')
+        invoice_store._writer.close()
+
+
+if __name__ == '__main__':
+    main()
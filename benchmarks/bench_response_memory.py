@@ -0,0 +1,82 @@
+"""Peak memory of sending a rendered invoice PDF, against a budget.
+
+Measures with tracemalloc what the response path allocates on top of the
+finished PDF, for the old str -> latin1 -> BytesIO route and for
+invoice.pdf_response(). Exits non-zero when pdf_response() needs more than
+--budget times the PDF size plus two chunks (the server still holds the chunk
+it wrote while the next one is sliced off); benchmarks/run.py runs the same
+check with the defaults.
+
+Usage: python benchmarks/bench_response_memory.py [--items N] [--budget 0.1]
+"""
+import argparse
+import io
+import os
+import sys
+import tracemalloc
+import warnings
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from flask import Flask, send_file  # noqa: E402
+
+import invoice  # noqa: E402
+
+
+def copying_response(pdf_output, filename):
+    # The route before pdf_response(): full copy to bytes, another into BytesIO
+    pdf_buffer = io.BytesIO()
+    pdf_buffer.write(bytes(pdf_output).decode('latin1').encode('latin1'))
+    pdf_buffer.seek(0)
+    return send_file(pdf_buffer, as_attachment=True, download_name=filename, mimetype='application/pdf')
+
+
+def peak_bytes(make_response, pdf_output):
+    app = Flask(__name__)
+    with app.test_request_context():
+        tracemalloc.start()
+        response = make_response(pdf_output, 'Rechnung.pdf')
+        response.direct_passthrough = False
+        for _ in response.iter_encoded():
+            pass
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        response.close()
+    return peak
+
+
+def response_memory(items=500, budget=0.1):
+    """(PDF size, copying response peak, pdf_response() peak, budget) in bytes, for an invoice with `items` extra lines"""
+    lines = '\n'.join(f'Zusatzleistung {i}: {i % 90 + 10}' for i in range(items))
+    invoice_data = invoice.build_invoice_data({
+        'customerName': 'Fuhrpark Neuwied GmbH',
+        'vehicleNumber': 'NR-GW 1',
+        'selectedService': 'aussenreinigung',
+        'additionalServices': lines,
+    })
+    pdf_output = invoice.build_invoice_pdf(invoice_data, '2025-BENCH').output()
+    size = len(pdf_output)
+    return (
+        size, peak_bytes(copying_response, pdf_output), peak_bytes(invoice.pdf_response, pdf_output),
+        size * budget + 2 * invoice.RESPONSE_CHUNK_SIZE,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--items', type=int, default=500, help='additional line items on the invoice')
+    parser.add_argument('--budget', type=float, default=0.1, help='allowed overhead as a fraction of the PDF size')
+    args = parser.parse_args()
+
+    warnings.simplefilter('ignore')
+    size, old_peak, new_peak, budget = response_memory(args.items, args.budget)
+
+    print(f'PDF size:         {size / 1024:9.1f} KiB')
+    print(f'copying response: {old_peak / 1024:9.1f} KiB peak')
+    print(f'pdf_response:     {new_peak / 1024:9.1f} KiB peak (budget {budget / 1024:.1f} KiB)')
+    if new_peak > budget:
+        sys.exit('pdf_response() exceeded its memory budget')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""Invoice full-text search (FTS5) over a synthetic multi-year archive.
+
+Fills a temporary database with --invoices invoices (names, plates, services
+and additional services drawn from small vocabularies, as at a real shop),
+indexed by the triggers as they are inserted, then times typical front-desk
+queries through GET /api/search/invoices.
+
+Usage: python benchmarks/bench_search.py [--invoices 1000000] [--runs 50]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from flask import Flask  # noqa: E402
+
+import invoice_store  # noqa: E402
+from extensions import db  # noqa: E402
+from invoice_store import Invoice, InvoiceItem, init_invoice_store  # noqa: E402
+from search import search_bp  # noqa: E402
+
+FIRST_NAMES = ('Anna', 'Jürgen', 'Petra', 'Lukas', 'Mehmet', 'Sofia', 'Jan', 'Leonie', 'Thomas', 'Katrin',
+               'Fatma', 'Stefan', 'Ursula', 'Markus', 'Elif', 'Dieter', 'Sabine', 'Andreas', 'Monika', 'Hans')
+LAST_NAMES = ('Müller', 'Schmidt', 'Schneider', 'Fischer', 'Weber', 'Meyer', 'Wagner', 'Becker', 'Schulz',
+              'Hoffmann', 'Schäfer', 'Koch', 'Bauer', 'Richter', 'Klein', 'Wolf', 'Schröder', 'Neumann',
+              'Schwarz', 'Zimmermann', 'Braun', 'Krüger', 'Hofmann', 'Hartmann', 'Lange', 'Özdemir', 'Yılmaz')
+CITY_CODES = ('NR', 'K', 'BN', 'KO', 'MYK', 'AK', 'WW', 'SU', 'EMS', 'MZ')
+SERVICES = ('Außenreinigung Premium', 'Innenraumreinigung', 'Lackpolitur & Glanzversiegelung', 'Felgenreinigung')
+EXTRAS = ('Ozonbehandlung', 'Tierhaarentfernung', 'Lederpflege', 'Scheinwerferaufbereitung', 'Motorwäsche',
+          'Cabrioverdeck imprägnieren', 'Kindersitz reinigen', 'Fleckenentfernung Rücksitz')
+
+QUERIES = ('müller', 'mül', 'schwarz anna', 'ozon', 'lederpflege becker', 'k', 'xyz')
+
+
+def fill(invoices, customers):
+    random.seed(1)
+    people = [
+        (f'{random.choice(FIRST_NAMES)} {random.choice(LAST_NAMES)}',
+         f'{random.choice(CITY_CODES)}-{chr(65 + random.randrange(26))}{chr(65 + random.randrange(26))} '
+         f'{random.randrange(1, 9999)}')
+        for _ in range(customers)
+    ]
+    first_day = datetime(2026, 1, 1) - timedelta(minutes=15 * invoices)
+    for start in range(0, invoices, 20000):
+        rows, items = [], []
+        for i in range(start, min(start + 20000, invoices)):
+            name, plate = random.choice(people)
+            rows.append({
+                'id': i + 1, 'invoice_number': f'BENCH-{i}', 'invoice_date': first_day + timedelta(minutes=15 * i),
+                'customer_name': name, 'vehicle_number': plate, 'service_key': 'x',
+                'service_name': random.choice(SERVICES), 'service_cents': 5000, 'net_cents': 5000,
+                'tax_cents': 950, 'gross_cents': 5950, 'discount_percent': '0', 'discount_cents': 0,
+                'total_cents': 5950, 'discount_sources': '[]',
+            })
+            for position in range(random.choice((0, 0, 1, 2))):
+                items.append({'invoice_id': i + 1, 'position': position, 'description': random.choice(EXTRAS),
+                              'price_cents': 1990})
+        db.session.execute(Invoice.__table__.insert(), rows)
+        if items:
+            db.session.execute(InvoiceItem.__table__.insert(), items)
+        db.session.commit()
+    return people
+
+
+def percentile_ms(func, runs, q):
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return timings[min(len(timings) - 1, int(len(timings) * q))] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--invoices', type=int, default=1000000)
+    parser.add_argument('--customers', type=int, default=50000)
+    parser.add_argument('--runs', type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(directory, 'bench.db')}"
+        db.init_app(app)
+        app.register_blueprint(search_bp, url_prefix='/api/search')
+        init_invoice_store(app)
+        client = app.test_client()
+        with app.app_context():
+            started = time.perf_counter()
+            people = fill(args.invoices, args.customers)
+            print(f'{args.invoices} invoices inserted and indexed in {time.perf_counter() - started:.1f} s, '
+                  f'database {os.path.getsize(os.path.join(directory, "bench.db")) / 1024 / 1024:.0f} MiB')
+
+        # A plate as typed, cut off while typing, and without separators
+        plate = people[0][1]
+        for query in QUERIES + (plate, plate[:-1], plate.replace('-', '').replace(' ', '')[:-1]):
+            def search():
+                response = client.get('/api/search/invoices', query_string={'q': query})
+                assert response.status_code == 200, response.data
+                return response.get_json()['invoices']
+
+            hits = len(search())
+            print(f'{query!r:>22}: {hits:3d} hits, median {percentile_ms(search, args.runs, 0.5):7.2f} ms, '
+                  f'p95 {percentile_ms(search, args.runs, 0.95):7.2f} ms')
+        invoice_store._writer.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""Cold-start time of the Streamlit front end (app.py), against a budget.
+
+Every round imports app.py in a fresh interpreter under `python -X importtime`
+and records the wall clock of the whole process plus the cumulative import
+time of `app`. Exits non-zero when the median of either goes over its budget,
+or when a module that should only load on download (pandas, fpdf, PIL, numpy)
+is imported at startup.
+
+Usage: python benchmarks/bench_startup.py [--rounds 5] [--budget-ms 1200] [--import-budget-ms 800]
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+REPO_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# Only needed once a PDF is downloaded or a batch is priced
+LAZY_MODULES = ('pandas', 'fpdf', 'PIL', 'numpy')
+
+
+def parse_importtime(stderr):
+    """module -> cumulative microseconds, plus (cumulative_us, module) for each direct import of app"""
+    modules = {}
+    children = app_children = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        _, cumulative_us, name = line[len('import time:'):].split('|')
+        # Nested imports are indented by two spaces per level and listed before their parent
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        name = name.strip()
+        modules.setdefault(name, int(cumulative_us))
+        if depth == 0:
+            if name == 'app':
+                app_children = children
+            children = []
+        elif depth == 1:
+            children.append((int(cumulative_us), name))
+    return modules, app_children
+
+
+def cold_import():
+    started = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', 'import app'],
+        cwd=REPO_DIR, capture_output=True, text=True
+    )
+    wall_ms = (time.perf_counter() - started) * 1000
+    if result.returncode != 0:
+        sys.exit(f'import app failed:\n{result.stderr[-2000:]}')
+    return (wall_ms,) + parse_importtime(result.stderr)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--budget-ms', type=float, default=1200, help='wall clock budget for the whole process')
+    parser.add_argument('--import-budget-ms', type=float, default=800, help='budget for the cumulative import of app')
+    parser.add_argument('--top', type=int, default=10, help='show this many of the slowest imports made by app.py')
+    args = parser.parse_args()
+
+    walls, imports = [], []
+    for _ in range(args.rounds):
+        wall_ms, modules, app_children = cold_import()
+        walls.append(wall_ms)
+        imports.append(modules['app'] / 1000)
+
+    wall_ms = statistics.median(walls)
+    import_ms = statistics.median(imports)
+    print(f'wall clock      median {wall_ms:8.1f} ms   (budget {args.budget_ms:.0f} ms)')
+    print(f'import app      median {import_ms:8.1f} ms   (budget {args.import_budget_ms:.0f} ms)')
+
+    print('\nSlowest imports made by app.py (last round):')
+    for cumulative, name in sorted(app_children, reverse=True)[:args.top]:
+        print(f'  {cumulative / 1000:8.1f} ms  {name}')
+
+    failures = []
+    if wall_ms > args.budget_ms:
+        failures.append(f'wall clock {wall_ms:.1f} ms > {args.budget_ms:.0f} ms')
+    if import_ms > args.import_budget_ms:
+        failures.append(f'import app {import_ms:.1f} ms > {args.import_budget_ms:.0f} ms')
+    for name in LAZY_MODULES:
+        if name in modules:
+            failures.append(f'{name} is imported at startup')
+    if failures:
+        print('\nStartup budget exceeded:')
+        for failure in failures:
+            print(f'  {failure}')
+        sys.exit(1)
+    print('\nWithin budget')
+
+
+if __name__ == '__main__':
+    main()
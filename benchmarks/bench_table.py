@@ -0,0 +1,106 @@
+"""Render time of the paginated service table against one cell() per field.
+
+Renders invoices with 10, 100 and 1000 additional services, once with the
+table layout engine (pdf_table.py) and once with the service table as it was
+drawn before: five FPDF.cell() calls per row, relying on auto page break.
+
+Usage: python benchmarks/bench_table.py [--runs N] [--items 10 100 1000]
+"""
+import argparse
+import os
+import sys
+import time
+import warnings
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+import invoice  # noqa: E402
+from pdf_fonts import FONT_FAMILY, text_shaping  # noqa: E402
+from pricing import price_line  # noqa: E402
+
+REPO_LOGO = os.path.join(os.path.dirname(__file__), '..', 'glanzwerk_logo.png')
+
+# Every tenth description gets this and wraps onto a second and third line
+LONG_SUFFIX = ' mit Polster-, Teppich- und Lederpflege sowie Geruchsneutralisierung durch Ozonbehandlung'
+
+
+def payload(items):
+    return {
+        'customerName': 'Fuhrpark Neuwied GmbH',
+        'vehicleNumber': 'NR-GW 123',
+        'selectedService': 'lackpolitur',
+        'additionalServices': '\n'.join(
+            f'Fahrzeug NR-FP {i} Innenraumreinigung{LONG_SUFFIX if i % 10 == 0 else ""}: {i % 90 + 10}.50'
+            for i in range(items)
+        ),
+        'discountCode': 'WINTER2025',
+    }
+
+
+class CellTableInvoicePDF(invoice.GlanzwerkInvoicePDF):
+    """The service table as it was before the layout engine"""
+
+    def service_table(self, invoice_data):
+        self.set_font(FONT_FAMILY, 'B', 11)
+        for heading, width, align in (('Beschreibung', 80, 'L'), ('Anzahl', 25, 'C'), ('Einzelpreis', 25, 'R'),
+                                      ('MwSt.', 25, 'R'), ('Gesamt', 25, 'R')):
+            self.cell(width, 8, heading, 1, 0, align)
+        self.ln(8)
+        self.set_font(FONT_FAMILY, '', 10)
+        lines = [{'description': invoice_data['service_name'], 'price': invoice_data['service_price']}]
+        for item in lines + invoice_data['additional_services']:
+            net, tax, gross = price_line(item['price'])
+            with text_shaping(self, item['description']):
+                self.cell(80, 8, item['description'], 1, 0, 'L')
+            self.cell(25, 8, '1', 1, 0, 'C')
+            self.cell(25, 8, f"{net:.2f}EUR", 1, 0, 'R')
+            self.cell(25, 8, f"{tax:.2f}EUR", 1, 0, 'R')
+            self.cell(25, 8, f"{gross:.2f}EUR", 1, 1, 'R')
+        self.set_font(FONT_FAMILY, 'B', 10)
+        self.cell(155, 8, 'Zwischensumme inkl. MwSt.', 1, 0, 'R')
+        self.cell(25, 8, f"{invoice_data['gross_price']:.2f}EUR", 1, 1, 'R')
+        self.set_font(FONT_FAMILY, 'B', 11)
+        self.cell(155, 10, 'Gesamt inkl. MwSt.', 1, 0, 'R')
+        self.cell(25, 10, f"{invoice_data['total_price']:.2f}EUR", 1, 1, 'R')
+        self.ln(8)
+
+
+def bench(pdf_class, invoice_data, runs):
+    original = invoice.GlanzwerkInvoicePDF
+    invoice.GlanzwerkInvoicePDF = pdf_class
+    try:
+        timings = []
+        for _ in range(runs):
+            started = time.perf_counter()
+            pdf = invoice.build_invoice_pdf(invoice_data, '2025-BENCH')
+            pdf.output()
+            timings.append(time.perf_counter() - started)
+    finally:
+        invoice.GlanzwerkInvoicePDF = original
+    timings.sort()
+    return timings[len(timings) // 2] * 1000, pdf.pages_count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--items', type=int, nargs='+', default=[10, 100, 1000])
+    args = parser.parse_args()
+
+    warnings.simplefilter('ignore')
+    invoice.LOGO_PATH = REPO_LOGO
+    invoice.warm_caches()
+
+    print(f'{"items":>6} {"cell() per field":>20} {"layout engine":>20} {"per extra item":>15}')
+    previous = None
+    for items in args.items:
+        invoice_data = invoice.build_invoice_data(payload(items))
+        cells_ms, cells_pages = bench(CellTableInvoicePDF, invoice_data, args.runs)
+        table_ms, table_pages = bench(invoice.GlanzwerkInvoicePDF, invoice_data, args.runs)
+        # Growth since the previous size; flat when render time is linear in the items
+        slope = f'{(table_ms - previous[1]) / (items - previous[0]):9.3f} ms' if previous else ''
+        print(f'{items:6d} {cells_ms:9.1f} ms {cells_pages:3d} pp {table_ms:9.1f} ms {table_pages:3d} pp {slope:>15}')
+        previous = items, table_ms
+
+if __name__ == '__main__':
+    main()
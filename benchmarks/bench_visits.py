@@ -0,0 +1,91 @@
+"""Regular-customer lookup: customer_visits counter versus COUNT(*) over all invoices.
+
+Fills a temporary database with --invoices invoices spread over --customers
+customers (several years of history for one shop), then times visit_count()
+against counting the invoices of the same customer.
+
+Usage: python benchmarks/bench_visits.py [--invoices 300000] [--customers 20000] [--runs 2000]
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from flask import Flask  # noqa: E402
+from sqlalchemy import func, select  # noqa: E402
+
+import invoice_store  # noqa: E402
+from extensions import db  # noqa: E402
+from invoice_store import Invoice, init_invoice_store, rebuild_customer_visits, visit_count  # noqa: E402
+
+
+def fill(invoices, customers):
+    started = datetime(2020, 1, 1)
+    rows = []
+    for i in range(invoices):
+        customer = random.randrange(customers)
+        rows.append({
+            'invoice_number': f'BENCH-{i}', 'invoice_date': started + timedelta(minutes=7 * i),
+            'customer_name': f'Kunde {customer}', 'vehicle_number': f'NR-GW {customer}',
+            'service_key': 'grundreinigung', 'service_name': 'Grundreinigung', 'service_cents': 5000,
+            'net_cents': 5000, 'tax_cents': 950, 'gross_cents': 5950, 'discount_percent': '0',
+            'discount_cents': 0, 'total_cents': 5950, 'discount_sources': '[]',
+        })
+    db.session.execute(Invoice.__table__.insert(), rows)
+    db.session.commit()
+
+
+def median_us(func, runs):
+    timings = []
+    for _ in range(runs):
+        started = time.perf_counter_ns()
+        func()
+        timings.append(time.perf_counter_ns() - started)
+    timings.sort()
+    return timings[len(timings) // 2] / 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--invoices', type=int, default=300000)
+    parser.add_argument('--customers', type=int, default=20000)
+    parser.add_argument('--runs', type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        app = Flask(__name__)
+        app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(directory, 'bench.db')}"
+        db.init_app(app)
+        init_invoice_store(app)
+        with app.app_context():
+            fill(args.invoices, args.customers)
+            started = time.perf_counter()
+            rebuild_customer_visits()
+            print(f'{args.invoices} invoices, {args.customers} customers; '
+                  f'rebuild_customer_visits() {time.perf_counter() - started:.2f} s')
+
+            def counter():
+                customer = random.randrange(args.customers)
+                visit_count(f'Kunde {customer}', f'NR-GW {customer}')
+
+            def count_star():
+                customer = random.randrange(args.customers)
+                db.session.execute(
+                    select(func.count()).select_from(Invoice)
+                    .where(Invoice.customer_name == f'Kunde {customer}')
+                    .where(Invoice.vehicle_number == f'NR-GW {customer}')
+                ).scalar()
+
+            for label, func_ in (('customer_visits', counter), ('COUNT(*)', count_star)):
+                func_()  # warm-up
+                print(f'{label:>16}: {median_us(func_, args.runs):8.1f} us per lookup (median)')
+        invoice_store._writer.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+"""Benchmark suite for the invoice hot paths, with regression thresholds.
+
+Usage:
+    python benchmarks/run.py                       # run, compare with baseline.json
+    python benchmarks/run.py --output results.json # also record the results
+    python benchmarks/run.py --update-baseline     # accept the current numbers
+
+Every case is timed over a number of rounds. The median and p95 per call are
+compared against the committed baseline, and the run fails (exit code 1) when
+either regresses by more than --tolerance (default 25%). It also fails when
+sending a rendered PDF allocates more than its memory budget
+(bench_response_memory.py).
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import warnings
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from flask import Flask  # noqa: E402
+
+import invoice  # noqa: E402
+from bench_response_memory import response_memory  # noqa: E402
+from pdf_archive import PDFArchive  # noqa: E402
+from pdf_cache import PDFCache  # noqa: E402
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baseline.json')
+REPO_LOGO = os.path.join(os.path.dirname(__file__), '..', 'glanzwerk_logo.png')
+
+DEFAULT_TOLERANCE = 0.25
+
+# Checked against its absolute budget, not the baseline
+MEMORY_CASE = 'pdf_response_memory[500]'
+
+
+def _payload(line_items):
+    return {
+        'customerName': 'Fuhrpark Neuwied GmbH',
+        'vehicleNumber': 'NR-GW 123',
+        'selectedService': 'lackpolitur',
+        'additionalServices': '\n'.join(f'Zusatzleistung {i}: {i % 90 + 10}.50' for i in range(line_items)),
+        'discountCode': 'WINTER2025',
+        'isRegularCustomer': True,
+        'manualDiscountPercent': '2.5',
+    }
+
+
+def _render_case(line_items):
+    invoice_data = invoice.build_invoice_data(_payload(line_items))
+    return lambda: invoice.render_invoice_pdf(invoice_data, '2025-BENCH')
+
+
+def _round_trip_case():
+    app = Flask(__name__)
+    app.register_blueprint(invoice.invoice_bp, url_prefix='/api/invoice')
+    client = app.test_client()
+    payload = _payload(3)
+
+    def round_trip():
+        response = client.post('/api/invoice/generate', json=payload)
+        assert response.status_code == 200, response.data
+        response.close()
+    return round_trip
+
+
+def build_cases():
+    """name -> (callable, rounds)"""
+    parse_text = _payload(20)['additionalServices']
+    pricing_payload = _payload(20)
+    # The same line items as JSON, the way the web client sends them
+    json_payload = dict(pricing_payload, additionalServices=[
+        {'description': item['description'], 'unitPrice': str(item['price']), 'quantity': item['quantity']}
+        for item in invoice.parse_additional_services(parse_text)[0]
+    ])
+    return {
+        'parse_additional_services[20]': (lambda: invoice.parse_additional_services(parse_text), 2000),
+        'build_invoice_data[20]': (lambda: invoice.build_invoice_data(pricing_payload), 2000),
+        'build_invoice_data[20 json]': (lambda: invoice.build_invoice_data(json_payload), 2000),
+        'render_pdf[1]': (_render_case(1), 100),
+        'render_pdf[20]': (_render_case(20), 50),
+        'render_pdf[500]': (_render_case(500), 10),
+        'api_generate_round_trip': (_round_trip_case(), 100),
+    }
+
+
+def measure(func, rounds):
+    func()  # warm-up
+    timings = []
+    for _ in range(rounds):
+        started = time.perf_counter_ns()
+        func()
+        timings.append(time.perf_counter_ns() - started)
+    timings.sort()
+    return {
+        'rounds': rounds,
+        'median_us': statistics.median(timings) / 1000,
+        'p95_us': timings[min(len(timings) - 1, int(len(timings) * 0.95))] / 1000,
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Returns a list of human-readable regressions"""
+    regressions = []
+    for name, result in results.items():
+        reference = baseline.get(name)
+        if reference is None:
+            continue
+        for metric in ('median_us', 'p95_us'):
+            limit = reference[metric] * (1 + tolerance)
+            if result[metric] > limit:
+                regressions.append(
+                    f'{name}: {metric} {result[metric]:.1f} > {limit:.1f} '
+                    f'(baseline {reference[metric]:.1f}, +{tolerance:.0%})'
+                )
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--output', help='write the results to this JSON file')
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help='allowed slowdown as a fraction (0.25 = 25%%)')
+    parser.add_argument('--update-baseline', action='store_true', help='overwrite the baseline with this run')
+    parser.add_argument('-k', dest='only', help='only run cases whose name contains this string')
+    args = parser.parse_args()
+
+    warnings.simplefilter('ignore')
+    invoice.LOGO_PATH = REPO_LOGO
+    invoice.pdf_cache = PDFCache(directory=None)
+    # Keep the round trip's invoices out of database/invoices.pack (removed at exit)
+    archive_directory = tempfile.TemporaryDirectory()
+    invoice.pdf_archive = PDFArchive(os.path.join(archive_directory.name, 'invoices.pack'))
+
+    results = {}
+    for name, (func, rounds) in build_cases().items():
+        if args.only and args.only not in name:
+            continue
+        results[name] = measure(func, rounds)
+        print(f'{name:32} median {results[name]["median_us"]:10.1f} us   p95 {results[name]["p95_us"]:10.1f} us')
+
+    over_budget = []
+    if not args.only or args.only in MEMORY_CASE:
+        _, _, peak, budget = response_memory()
+        print(f'{MEMORY_CASE:32} peak   {peak / 1024:10.1f} KiB  budget {budget / 1024:8.1f} KiB')
+        if peak > budget:
+            over_budget.append(f'{MEMORY_CASE}: peak {peak / 1024:.1f} KiB > budget {budget / 1024:.1f} KiB')
+
+    report = {
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+            f.write('\n')
+
+    if args.update_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+            f.write('\n')
+        print(f'Baseline written to {args.baseline}')
+        regressions = []
+    elif not os.path.exists(args.baseline):
+        print('No baseline to compare against (run with --update-baseline)')
+        regressions = []
+    else:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)['results']
+        regressions = compare(results, baseline, args.tolerance)
+    regressions += over_budget
+    if regressions:
+        print('\nPerformance regressions:')
+        for regression in regressions:
+            print(f'  {regression}')
+        sys.exit(1)
+    print(f'\nNo regressions beyond {args.tolerance:.0%} of the baseline')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+"""Service catalog and discount codes, loaded once and hot-reloaded from catalog.json.
+
+Lookups are served from an immutable in-memory snapshot. A background thread
+watches the file's mtime and, when it changes, parses the new file off the
+request path and swaps the snapshot in with a single reference assignment, so
+a request that grabbed a snapshot keeps a consistent price list until it is done.
+"""
+import json
+import logging
+import os
+import threading
+from types import MappingProxyType
+
+from pricing import to_money, to_percent
+
+CATALOG_PATH = os.path.join(os.path.dirname(__file__), 'catalog.json')
+
+# Seconds between mtime checks of the catalog file
+RELOAD_INTERVAL = 5.0
+
+logger = logging.getLogger(__name__)
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+class CatalogError(ValueError):
+    """Raised when the catalog file is missing required data"""
+
+
+class CatalogSnapshot:
+    """One immutable version of the service list and discount codes"""
+
+    __slots__ = ('services', 'discount_codes', 'version', 'mtime')
+
+    def __init__(self, services, discount_codes, version, mtime):
+        self.services = services
+        self.discount_codes = discount_codes
+        self.version = version
+        self.mtime = mtime
+
+    @classmethod
+    def from_file(cls, path):
+        mtime = os.stat(path).st_mtime_ns
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+
+        services = {}
+        for key, service in data.get('services', {}).items():
+            if 'name' not in service or 'price' not in service:
+                raise CatalogError(f'Service {key!r} needs a name and a price')
+            services[key] = MappingProxyType({
+                'name': service['name'],
+                'price': to_money(service['price']),
+                'description': service.get('description', ''),
+            })
+        if not services:
+            raise CatalogError('Catalog contains no services')
+
+        discount_codes = {
+            code.upper(): to_percent(percent)
+            for code, percent in data.get('discount_codes', {}).items()
+        }
+        return cls(
+            MappingProxyType(services),
+            MappingProxyType(discount_codes),
+            data.get('version'),
+            mtime,
+        )
+
+
+class CatalogRegistry:
+    """Holds the current CatalogSnapshot and swaps in new ones when the file changes"""
+
+    def __init__(self, path=CATALOG_PATH, reload_interval=RELOAD_INTERVAL):
+        self.path = path
+        self.reload_interval = reload_interval
+        self._snapshot = CatalogSnapshot.from_file(path)
+        self._stop = threading.Event()
+        self._watcher = None
+
+    @property
+    def snapshot(self):
+        return self._snapshot
+
+    def reload_if_changed(self):
+        """Load the file if its mtime moved; a broken file keeps the previous snapshot"""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+            if mtime == self._snapshot.mtime:
+                return False
+            snapshot = CatalogSnapshot.from_file(self.path)
+        except (OSError, ValueError, ArithmeticError) as e:
+            logger.warning('Keeping catalog version %s, reload failed: %s', self._snapshot.version, e)
+            return False
+        self._snapshot = snapshot
+        logger.info('Loaded catalog version %s', snapshot.version)
+        return True
+
+    def _watch(self):
+        while not self._stop.wait(self.reload_interval):
+            self.reload_if_changed()
+
+    def start_watcher(self):
+        if self._watcher is None or not self._watcher.is_alive():
+            self._stop.clear()
+            self._watcher = threading.Thread(target=self._watch, name='catalog-watcher', daemon=True)
+            self._watcher.start()
+
+    def stop_watcher(self):
+        self._stop.set()
+
+
+def get_registry():
+    """Process-wide registry, created and watched on first use"""
+    global _registry
+    if _registry is None:
+        with _registry_lock:
+            if _registry is None:
+                registry = CatalogRegistry()
+                registry.start_watcher()
+                _registry = registry
+    return _registry
+
+
+def get_catalog():
+    """The current catalog snapshot; hold on to it for the duration of a request"""
+    return get_registry().snapshot
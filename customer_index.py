@@ -0,0 +1,237 @@
+"""In-memory prefix index of known customers for autocomplete while typing.
+
+    GET /api/search/customers?q=mül&limit=8
+
+Every customer (customer_key() in invoice_store.py) is listed under the words
+of its name, its full name and its plate without separators, folded like the
+full-text search: case and diacritics do not matter, so 'mul', 'jurgen mu' and
+'nrgw1' all find 'Jürgen Müller' / 'NR-GW 123'. The keys sit in one sorted
+list, so a lookup is a bisect plus a short scan; prefixes shared by hundreds
+of customers ('m', 'thomas') are answered from a top list kept for each of
+them instead. Suggestions rank by visits, then by the latest visit.
+
+The index is loaded once per process from the invoices table and then follows
+it by invoices.id: the write-behind thread catches up right after each commit,
+and a lookup catches up with invoices stored by other workers at most every
+REFRESH_INTERVAL seconds. Lookups in between never touch SQLite.
+"""
+import heapq
+import os
+import threading
+import time
+import unicodedata
+from bisect import bisect_left
+
+from sqlalchemy import text
+
+from invoice_store import customer_key
+
+DEFAULT_LIMIT = 8
+MAX_LIMIT = 20
+
+# Seconds a lookup may lag behind invoices written by other worker processes
+REFRESH_INTERVAL = 2.0
+
+# Prefixes matching more keys than this when the index is loaded ('m', 'sch',
+# 'thomas') get a top list kept up to date; all others are a short scan
+CROWDED = 200
+
+# Keys looked at per scan, for prefixes that only became crowded after loading
+MAX_SCAN = 2000
+
+# One row per spelling of a customer; ORDER BY keeps the latest spelling last.
+# Every row is read anyway, so scanning the table beats walking the name index
+_LOAD_SQL = text("""
+    SELECT customer_name, vehicle_number, count(*) AS visits, max(invoice_date) AS last_visit, max(id) AS last_id
+    FROM invoices NOT INDEXED
+    GROUP BY customer_name, vehicle_number
+    ORDER BY last_id
+""")
+_CATCH_UP_SQL = text("""
+    SELECT customer_name, vehicle_number, 1 AS visits, invoice_date AS last_visit, id AS last_id
+    FROM invoices WHERE id > :last_id ORDER BY id
+""")
+
+
+def fold(value):
+    """Lower case without diacritics or repeated spaces: 'Jürgen  Müller' -> 'jurgen muller'"""
+    value = value or ''
+    if value.isascii():
+        return ' '.join(value.lower().split())
+    decomposed = unicodedata.normalize('NFKD', value)
+    return ' '.join(''.join(c for c in decomposed if not unicodedata.combining(c)).casefold().split())
+
+
+def _compact(value):
+    return fold(value).replace(' ', '').replace('-', '')
+
+
+class _Customer:
+    __slots__ = ('name', 'plate', 'visits', 'last_visit', 'keys')
+
+    def __init__(self):
+        self.name = self.plate = None
+        self.visits = 0
+        self.last_visit = ''
+        self.keys = set()
+
+    def rank(self):
+        return self.visits, self.last_visit
+
+
+class CustomerIndex:
+    """Sorted prefix keys over all customers; safe to share between request threads"""
+
+    def __init__(self, refresh_interval=REFRESH_INTERVAL):
+        self.refresh_interval = refresh_interval
+        self._customers = {}
+        self._keys = []
+        self._owners = []
+        self._top = {}
+        self._last_id = None
+        self._checked = 0.0
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._customers)
+
+    def refresh(self, session):
+        """Load the index, or add invoices stored since the last call; needs an app context"""
+        with self._refresh_lock:
+            self._checked = time.monotonic()
+            if self._last_id is None:
+                self._load(session.execute(_LOAD_SQL))
+            else:
+                rows = session.execute(_CATCH_UP_SQL, {'last_id': self._last_id}).all()
+                if rows:
+                    with self._lock:
+                        for row in rows:
+                            self._add(*row)
+
+    def refresh_if_due(self, session):
+        if self._last_id is None or time.monotonic() - self._checked >= self.refresh_interval:
+            self.refresh(session)
+
+    def suggest(self, query, limit=DEFAULT_LIMIT):
+        """Up to `limit` customers whose name, a word of it or the plate starts with `query`"""
+        prefixes = {fold(query), _compact(query)} - {''}
+        with self._lock:
+            found = set()
+            for prefix in prefixes:
+                listed = self._top.get(prefix)
+                found.update(listed if listed is not None else self._scan(prefix))
+            customers = heapq.nlargest(limit, (self._customers[key] for key in found), key=_Customer.rank)
+            return [
+                {'name': customer.name, 'plate': customer.plate,
+                 'visits': customer.visits, 'last_visit': customer.last_visit}
+                for customer in customers
+            ]
+
+    def _scan(self, prefix):
+        start = bisect_left(self._keys, prefix)
+        for position in range(start, min(start + MAX_SCAN, len(self._keys))):
+            if not self._keys[position].startswith(prefix):
+                break
+            yield self._owners[position]
+
+    def _load(self, rows):
+        # Built aside and swapped in, so lookups during a reload see the old index
+        customers = {}
+        last_id = 0
+        for name, plate, visits, last_visit, row_id in rows:
+            customer = customers.setdefault(customer_key(name, plate), _Customer())
+            customer.name, customer.plate = name, plate
+            customer.visits += visits
+            customer.last_visit = max(customer.last_visit, _iso(last_visit))
+            last_id = max(last_id, row_id)
+        for customer in customers.values():
+            customer.keys = _search_keys(customer)
+        entries = sorted((search_key, key) for key, customer in customers.items() for search_key in customer.keys)
+        keys = [search_key for search_key, _ in entries]
+        top = {prefix: [] for prefix in _crowded_prefixes(keys)}
+        for key, customer in sorted(customers.items(), key=lambda item: item[1].rank(), reverse=True):
+            for search_key in customer.keys:
+                for prefix in _prefixes(search_key):
+                    listed = top.get(prefix)
+                    if listed is None:
+                        break
+                    if len(listed) < MAX_LIMIT and key not in listed:
+                        listed.append(key)
+        with self._lock:
+            self._customers = customers
+            self._keys = keys
+            self._owners = [key for _, key in entries]
+            self._top = top
+            self._last_id = last_id
+
+    def _add(self, name, plate, visits, last_visit, row_id):
+        key = customer_key(name, plate)
+        customer = self._customers.get(key)
+        if customer is None:
+            customer = self._customers[key] = _Customer()
+        customer.name, customer.plate = name, plate
+        customer.visits += visits
+        customer.last_visit = max(customer.last_visit, _iso(last_visit))
+        self._last_id = max(self._last_id, row_id)
+        for search_key in _search_keys(customer) - customer.keys:
+            position = bisect_left(self._keys, search_key)
+            self._keys.insert(position, search_key)
+            self._owners.insert(position, key)
+            customer.keys.add(search_key)
+        # A new visit can move the customer up in every top list it could appear in
+        for search_key in customer.keys:
+            for prefix in _prefixes(search_key):
+                listed = self._top.get(prefix)
+                if listed is None:
+                    break
+                if key not in listed:
+                    if len(listed) >= MAX_LIMIT and self._customers[listed[-1]].rank() >= customer.rank():
+                        continue
+                    listed.append(key)
+                listed.sort(key=lambda listed_key: self._customers[listed_key].rank(), reverse=True)
+                del listed[MAX_LIMIT:]
+
+
+def _prefixes(search_key):
+    # Shortest first; once one is not crowded, no longer one is
+    return (search_key[:length] for length in range(1, len(search_key) + 1))
+
+
+def _crowded_prefixes(keys):
+    """Prefixes shared by more than CROWDED of the sorted `keys`"""
+    crowded = set()
+    for position in range(len(keys) - CROWDED):
+        # A prefix of both ends of a CROWDED + 1 long run of keys is a prefix of all of them
+        common = os.path.commonprefix((keys[position], keys[position + CROWDED]))
+        if common not in crowded:
+            crowded.update(common[:length] for length in range(1, len(common) + 1))
+    return crowded
+
+
+def _search_keys(customer):
+    name = fold(customer.name)
+    keys = set(name.split())
+    keys.add(name)
+    keys.add(_compact(customer.plate))
+    keys.discard('')
+    return keys
+
+
+def _iso(value):
+    # SQLite hands back the stored text, '2025-08-07 15:30:00.000000'
+    return str(value)[:19].replace(' ', 'T')
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_customer_index():
+    """The process-wide index; loaded on first refresh"""
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                _index = CustomerIndex()
+    return _index
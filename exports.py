@@ -0,0 +1,253 @@
+"""Streaming invoice export for the accountant, as CSV or DATEV Buchungsstapel.
+
+    GET /api/exports/invoices?format=csv|datev&quarter=2025-Q1[&gzip=1]
+    GET /api/exports/invoices?format=csv&from=2025-01-01&to=2025-03-31
+
+    python exports.py --format datev --quarter 2025-Q1 --output 2025-Q1.csv [--gzip]
+
+Invoices are read through a database cursor FETCH_SIZE rows at a time and
+written as they come: one chunk of CSV per fetch, optionally gzip-compressed on
+the fly, straight into the response or file. Nothing holds more than one chunk,
+so memory stays flat for ten invoices or a million.
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import re
+import sys
+import zlib
+from datetime import date, datetime, time, timedelta
+
+from flask import Blueprint, Response, jsonify, request, stream_with_context
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+
+# Same import root as main.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from extensions import db  # noqa: E402
+from invoice_store import Invoice  # noqa: E402
+
+exports_bp = Blueprint('exports', __name__)
+
+DATABASE_PATH = os.path.join(os.path.dirname(__file__), 'database', 'app.db')
+
+# Rows fetched from SQLite per round trip, and written per chunk
+FETCH_SIZE = 1000
+
+FORMATS = ('csv', 'datev')
+
+# DATEV Buchungsstapel: revenue booked from the cash account against the
+# 19% revenue account (SKR03); the advisor and client numbers come from the tax office setup
+DATEV_CASH_ACCOUNT = '1000'
+DATEV_REVENUE_ACCOUNT = '8400'
+DATEV_ADVISOR_NUMBER = '1001'
+DATEV_CLIENT_NUMBER = '1'
+DATEV_ACCOUNT_LENGTH = 4
+# DATEV reads ANSI; characters outside it (Arabic names) become '?'
+DATEV_ENCODING = 'cp1252'
+
+CSV_COLUMNS = (
+    'Rechnungsnummer', 'Rechnungsdatum', 'Kunde', 'Kennzeichen', 'Leistung',
+    'Netto', 'MwSt', 'Brutto', 'Rabatt %', 'Rabatt', 'Gesamt', 'Rabattarten',
+)
+DATEV_COLUMNS = (
+    'Umsatz (ohne Soll/Haben-Kz)', 'Soll/Haben-Kennzeichen', 'WKZ Umsatz', 'Konto',
+    'Gegenkonto (ohne BU-Schlüssel)', 'BU-Schlüssel', 'Belegdatum', 'Belegfeld 1', 'Buchungstext',
+)
+
+_QUARTER_RE = re.compile(r'^(\d{4})-?Q([1-4])$', re.IGNORECASE)
+
+# First characters of a CSV cell a spreadsheet evaluates as a formula
+_FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+# In this order; _csv_row and _datev_row unpack rows by position
+_EXPORT_COLUMNS = (
+    Invoice.invoice_number, Invoice.invoice_date, Invoice.customer_name, Invoice.vehicle_number,
+    Invoice.service_name, Invoice.net_cents, Invoice.tax_cents, Invoice.gross_cents,
+    Invoice.discount_percent, Invoice.discount_cents, Invoice.total_cents, Invoice.discount_sources,
+)
+
+
+class ExportError(ValueError):
+    """Bad export parameters"""
+
+
+def export_range(start=None, end=None, quarter=None, export_format='csv'):
+    """(first day, last day) from a quarter like 2025-Q1 or from/to ISO dates.
+
+    A DATEV Buchungsstapel belongs to one fiscal year (the calendar year here),
+    so a DATEV range must not cross a year boundary.
+    """
+    if quarter:
+        match = _QUARTER_RE.match(quarter.strip())
+        if not match:
+            raise ExportError('quarter must look like 2025-Q1')
+        year, number = int(match.group(1)), int(match.group(2))
+        first = date(year, 3 * number - 2, 1)
+        following = date(year + 1, 1, 1) if number == 4 else date(year, 3 * number + 1, 1)
+        return first, following - timedelta(days=1)
+    try:
+        start = date.fromisoformat(start) if start else date(1970, 1, 1)
+        end = date.fromisoformat(end) if end else date.today()
+    except ValueError:
+        raise ExportError('from and to must be dates like 2025-01-31') from None
+    if start > end:
+        raise ExportError('from must not be after to')
+    if export_format == 'datev' and start.year != end.year:
+        raise ExportError('DATEV exports cover one fiscal year: give a quarter, or from and to in the same year')
+    return start, end
+
+
+def _comma(cents):
+    # German decimal comma, no thousands separator; called several times per row, so no Decimal
+    sign = '-' if cents < 0 else ''
+    euros, cents = divmod(abs(cents), 100)
+    return f'{sign}{euros},{cents:02d}'
+
+
+def _text(value):
+    # Spreadsheets run a cell starting with one of these as a formula; the quote makes it text
+    return f"'{value}" if value and value[0] in _FORMULA_PREFIXES else value
+
+
+def _csv_row(row):
+    (number, invoice_date, customer_name, vehicle_number, service_name, net_cents, tax_cents,
+     gross_cents, discount_percent, discount_cents, total_cents, discount_sources) = row
+    return (
+        number, f'{invoice_date.day:02d}.{invoice_date.month:02d}.{invoice_date.year}', _text(customer_name),
+        _text(vehicle_number), _text(service_name), _comma(net_cents), _comma(tax_cents), _comma(gross_cents),
+        discount_percent.replace('.', ','), _comma(discount_cents), _comma(total_cents),
+        _text(', '.join(json.loads(discount_sources))) if discount_sources != '[]' else '',
+    )
+
+
+def _datev_row(row):
+    number, invoice_date, customer_name, vehicle_number = row[:4]
+    return (
+        _comma(row[-2]), 'S', 'EUR', DATEV_CASH_ACCOUNT, DATEV_REVENUE_ACCOUNT, '',
+        f'{invoice_date.day:02d}{invoice_date.month:02d}', number[:36], f'{customer_name} {vehicle_number}'[:60],
+    )
+
+
+def _datev_header(start, end):
+    """The EXTF metadata line DATEV expects above the column names (format 700, Buchungsstapel)"""
+    created = datetime.now().strftime('%Y%m%d%H%M%S%f')[:17]
+    fiscal_year_start = start.replace(month=1, day=1)
+    return (
+        'EXTF', '700', '21', 'Buchungsstapel', '13', created, '', 'RE', '', '',
+        DATEV_ADVISOR_NUMBER, DATEV_CLIENT_NUMBER, fiscal_year_start.strftime('%Y%m%d'),
+        str(DATEV_ACCOUNT_LENGTH), start.strftime('%Y%m%d'), end.strftime('%Y%m%d'),
+        'Rechnungen Glanzwerk', '', '1', '0', '0', 'EUR',
+    )
+
+
+def iter_export(session, export_format, start, end, compress=False):
+    """Yield the export as bytes chunks, FETCH_SIZE invoices at a time"""
+    if export_format not in FORMATS:
+        raise ExportError(f'format must be one of {", ".join(FORMATS)}')
+    datev = export_format == 'datev'
+    encoding = DATEV_ENCODING if datev else 'utf-8-sig'
+    format_row = _datev_row if datev else _csv_row
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, delimiter=';', lineterminator='\r\n')
+    # gzip container (wbits 31), sync-flushed per chunk so the client receives data as it is produced
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if compress else None
+
+    def flush():
+        nonlocal encoding
+        data = buffer.getvalue().encode(encoding, errors='replace')
+        # BOM only once, in front of the first chunk
+        if encoding == 'utf-8-sig':
+            encoding = 'utf-8'
+        buffer.seek(0)
+        buffer.truncate()
+        return compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH) if compressor else data
+
+    if datev:
+        writer.writerow(_datev_header(start, end))
+        writer.writerow(DATEV_COLUMNS)
+    else:
+        writer.writerow(CSV_COLUMNS)
+
+    query = (
+        select(*_EXPORT_COLUMNS)
+        .where(Invoice.invoice_date >= datetime.combine(start, time.min))
+        .where(Invoice.invoice_date < datetime.combine(end + timedelta(days=1), time.min))
+        .order_by(Invoice.invoice_date, Invoice.id)
+        .execution_options(yield_per=FETCH_SIZE)
+    )
+    for chunk in session.execute(query).partitions():
+        writer.writerows(format_row(row) for row in chunk)
+        data = flush()
+        if data:
+            yield data
+    data = flush()
+    if compressor:
+        data += compressor.flush()
+    if data:
+        yield data
+
+
+@exports_bp.route('/invoices', methods=['GET'])
+def export_invoices():
+    export_format = request.args.get('format', 'csv')
+    compress = request.args.get('gzip', '').lower() in ('1', 'true', 'yes')
+    try:
+        if export_format not in FORMATS:
+            raise ExportError(f'format must be one of {", ".join(FORMATS)}')
+        start, end = export_range(
+            request.args.get('from'), request.args.get('to'), request.args.get('quarter'), export_format
+        )
+    except ExportError as e:
+        return jsonify({'error': str(e)}), 400
+
+    filename = f'{"DATEV_" if export_format == "datev" else ""}Rechnungen_{start:%Y%m%d}-{end:%Y%m%d}.csv'
+    if compress:
+        filename += '.gz'
+        content_type = 'application/gzip'
+    else:
+        content_type = f'text/csv; charset={"windows-1252" if export_format == "datev" else "utf-8"}'
+    # The cursor is read while the response is sent, so the request context (and session) must stay open
+    return Response(
+        stream_with_context(iter_export(db.session, export_format, start, end, compress)),
+        content_type=content_type,
+        headers={'Content-Disposition': f'attachment; filename={filename}'}
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database', default=DATABASE_PATH, help='SQLite database with the stored invoices')
+    parser.add_argument('--format', choices=FORMATS, default='csv')
+    parser.add_argument('--quarter', help='e.g. 2025-Q1; instead of --from/--to')
+    parser.add_argument('--from', dest='start', help='first invoice date (ISO), default: all; DATEV: same year as --to')
+    parser.add_argument('--to', dest='end', help='last invoice date (ISO), default: today')
+    parser.add_argument('--gzip', action='store_true', help='compress the output with gzip')
+    parser.add_argument('--output', required=True, help="file to write, '-' for stdout")
+    args = parser.parse_args()
+
+    try:
+        start, end = export_range(args.start, args.end, args.quarter, args.format)
+    except ExportError as e:
+        parser.error(str(e))
+
+    engine = create_engine(f'sqlite:///{args.database}')
+    output = sys.stdout.buffer if args.output == '-' else open(args.output, 'wb')
+    written = 0
+    try:
+        with Session(engine) as session:
+            for data in iter_export(session, args.format, start, end, compress=args.gzip):
+                output.write(data)
+                written += len(data)
+    finally:
+        if output is not sys.stdout.buffer:
+            output.close()
+    print(f'{written / 1024:.1f} KiB written ({start} to {end})', file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,15 @@
+"""The app's Flask-SQLAlchemy instance, shared by the invoice modules.
+
+Deployed, the Flask template's src/models/user.py owns it and main.py binds it
+to the app. A plain checkout has no src/ package; the benchmarks and command
+line tools then get an instance of their own, bound with db.init_app() like
+main.py does.
+"""
+try:
+    from src.models.user import db
+except ModuleNotFoundError as e:
+    if e.name not in ('src', 'src.models', 'src.models.user'):
+        raise
+    from flask_sqlalchemy import SQLAlchemy
+
+    db = SQLAlchemy()
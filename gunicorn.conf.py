@@ -0,0 +1,67 @@
+"""gunicorn settings for production.
+
+    gunicorn -c gunicorn.conf.py main:app           # one worker per core
+    gunicorn -c gunicorn.conf.py -w 4 main:app      # or a fixed number
+
+The app is imported once in the master (preload_app), which then creates the
+tables and starts the write-behind thread (main.init), warms the catalog, logo,
+fonts and page template (main.warm) and freezes the heap before forking.
+Workers share that memory copy-on-write, so the first request after a deploy
+is as fast as the hundredth. Each worker opens its own database
+connections and restarts the write-behind and catalog threads (main.after_fork).
+
+State the workers must agree on is not kept per worker: render job status in
+SQLite, metrics added up from every worker's file in METRICS_DIR. Each worker
+starts its own render pool, so the master divides the cores among them.
+
+Reload: `kill -HUP <master>` replaces the workers gracefully with the same code.
+To deploy new code without dropping requests, `kill -USR2 <master>` starts a
+new master with the new code next to the old one; once /api/ready answers,
+`kill -TERM <old master>` lets the old workers finish their requests and exit.
+"""
+import gc
+import multiprocessing
+import os
+import shutil
+import tempfile
+
+bind = '0.0.0.0:5000'
+workers = multiprocessing.cpu_count()
+# Threads keep a worker responsive while one of its requests streams a large download
+worker_class = 'gthread'
+threads = 4
+preload_app = True
+
+# Long batch renders run on the render pool, but a single large invoice may take a while
+timeout = 120
+# Seconds in-flight requests get to finish on reload or shutdown
+graceful_timeout = 30
+keepalive = 5
+
+# Per-worker metric values, added up by GET /api/metrics; one directory per master
+METRICS_DIR = os.path.join(tempfile.gettempdir(), f'glanzwerk-metrics-{os.getpid()}')
+
+
+def when_ready(server):
+    # Runs in the master after the app is loaded and the socket is bound, before any worker exists
+    import main
+    import metrics
+    import render_jobs
+    main.init()
+    main.warm()
+    metrics.share_across_processes(METRICS_DIR)
+    # One render pool per worker: together they start one render process per core
+    render_jobs.share_render_workers(server.num_workers)
+    # Move the warmed objects out of the collector's generations, so collections
+    # in the workers do not write to (and copy) the pages they live on
+    gc.freeze()
+    server.log.info('Caches warmed, starting %d workers', server.num_workers)
+
+
+def post_fork(server, worker):
+    import main
+    main.after_fork()
+
+
+def on_exit(server):
+    shutil.rmtree(METRICS_DIR, ignore_errors=True)
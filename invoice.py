@@ -1,35 +1,116 @@
-from flask import Blueprint, request, jsonify, send_file
+from flask import Blueprint, Response, g, request, jsonify
 from fpdf import FPDF
+from assets import get_logo
+import pdf_fonts
+from pdf_fonts import FONT_FAMILY, FontSelection, core_font_covers, text_shaping
+from pdf_template import PageTemplate, register_template_fonts
+from pdf_table import Column, PagedTable
+from catalog import get_catalog
+from pricing import REGULAR_CUSTOMER_VISITS, price_invoice, price_line, resolve_discounts, to_money
+from line_items import LineItemError, line_total, parse_additional_services, structured_line_items
+from invoice_store import load_invoice, next_invoice_number, store_invoice, visit_count
+from pdf_cache import PDFCache, cache_key
+from pdf_archive import ArchiveError, PDFArchive
+from render_jobs import QueueFullError, RenderJobQueue, get_render_pool, render_pool_size
+from metrics import ERRORS, PDF_BYTES, RENDERS_IN_FLIGHT, REQUEST_SECONDS, REQUESTS, STAGE_SECONDS, stage
+from concurrent.futures import FIRST_COMPLETED, wait
 import os
-import tempfile
 from datetime import datetime, timedelta
 import io
+import json
+import logging
 import re
+import time
+import unicodedata
+import zipfile
+from urllib.parse import quote
 
 invoice_bp = Blueprint('invoice', __name__)
 
-class GlanzwerkInvoicePDF(FPDF):
-    def __init__(self):
+logger = logging.getLogger(__name__)
+
+LOGO_PATH = os.path.join(os.path.dirname(__file__), '..', 'static', 'glanzwerk_logo.png')
+
+# Decode and downscale the logo once per process, not on every page
+get_logo(LOGO_PATH).warm()
+
+# Reduce and parse the embedded fonts before the first request needs them
+pdf_fonts.warm()
+
+# Static page content, recorded once per process and replayed into every invoice;
+# one template for the embedded font and one for the core font, by core_font
+PAGE_TEMPLATES = {False: PageTemplate(), True: PageTemplate(core_font=True)}
+
+# Bump whenever the printed layout or static texts change, so cached PDFs are re-rendered
+TEMPLATE_VERSION = 6
+
+# Rendered PDFs by content hash, for repeat downloads; in memory only,
+# the PDFs of stored invoices are kept on disk in the archive
+pdf_cache = PDFCache(directory=None)
+
+# Every stored invoice's PDF in one deduplicated pack file (database/invoices.pack)
+pdf_archive = PDFArchive()
+
+# Height of the page footer; the service table continues on a new page above it
+FOOTER_HEIGHT = 40
+
+# Where the service table continues on a new page: below the logo (y 8, 25 mm high)
+TABLE_PAGE_TOP = 38
+
+# The due date line between payment terms and closing text: one 6 mm cell and 5 mm space
+DUE_DATE_HEIGHT = 11
+
+# Pages carry the net amounts: the subtotal is taxed once on the net sum, so the
+# rounded gross amounts of the rows need not add up to it
+SERVICE_TABLE = PagedTable((
+    Column('Beschreibung', 80, 'L'),
+    Column('Anzahl', 25, 'C'),
+    Column('Einzelpreis', 25, 'R'),
+    Column('MwSt.', 25, 'R'),
+    Column('Gesamt', 25, 'R'),
+), carry_label='Übertrag netto')
+
+class GlanzwerkInvoicePDF(FontSelection, FPDF):
+    def __init__(self, use_template=True, core_font=False):
         super().__init__()
-        self.set_auto_page_break(auto=True, margin=15)
+        # Flowing text breaks onto a new page above the footer, not into it
+        self.set_auto_page_break(auto=True, margin=FOOTER_HEIGHT)
+        self.use_template = use_template
+        # Latin-1 invoices print in the core font, everything else in embedded DejaVu Sans
+        self.core_font = core_font
+        self.page_template = PAGE_TEMPLATES[core_font]
+        if use_template:
+            self.page_template.register_fonts(self)
+        else:
+            register_template_fonts(self)
+    
+    def _static_block(self, name, draw, flowing=True):
+        if self.use_template:
+            self.page_template.replay(self, name, draw, flowing)
+        else:
+            draw(self)
         
     def header(self):
-        # Add logo
-        logo_path = os.path.join(os.path.dirname(__file__), '..', 'static', 'glanzwerk_logo.png')
-        if os.path.exists(logo_path):
-            self.image(logo_path, x=10, y=8, w=25)
+        # Add logo (prepared once per process, see assets.py)
+        get_logo(LOGO_PATH).place(self, x=10, y=8, w=25)
         
+        self._static_block('header', GlanzwerkInvoicePDF._draw_header, flowing=False)
+    
+    def _draw_header(self):
         # Company header line
-        self.set_font('Arial', '', 10)
+        self.set_font(FONT_FAMILY, '', 10)
         self.set_xy(45, 15)
         self.cell(0, 5, 'Glanzwerk Rheinland, Krasnaer Str. 1, 56566 Neuwied, Deutschland', 0, 1, 'L')
         self.ln(10)
         
     def footer(self):
-        self.set_y(-40)
+        self._static_block('footer', GlanzwerkInvoicePDF._draw_footer, flowing=False)
+    
+    def _draw_footer(self):
+        self.set_y(-FOOTER_HEIGHT)
         
         # Footer with company details
-        self.set_font('Arial', '', 9)
+        self.set_font(FONT_FAMILY, '', 9)
         
         # Left column
         self.cell(60, 4, 'Glanzwerk Rheinland', 0, 0, 'L')
@@ -50,19 +131,20 @@ class GlanzwerkInvoicePDF(FPDF):
         
     def customer_address(self, customer_name, vehicle_number):
         # Customer address section
-        self.set_font('Arial', '', 11)
-        self.cell(0, 6, customer_name, 0, 1, 'L')
+        self.set_font(FONT_FAMILY, '', 11)
+        with text_shaping(self, customer_name):
+            self.cell(0, 6, customer_name, 0, 1, 'L')
         self.cell(0, 6, f'Fahrzeug: {vehicle_number}', 0, 1, 'L')
         self.ln(5)
         
-    def invoice_header(self, invoice_number):
+    def invoice_header(self, invoice_number, invoice_date=None):
         # Invoice details in right column
-        current_date = datetime.now()
+        current_date = invoice_date or datetime.now()
         due_date = current_date + timedelta(days=14)
         
         # Position for right-aligned content
         self.set_xy(120, 35)
-        self.set_font('Arial', '', 11)
+        self.set_font(FONT_FAMILY, '', 11)
         
         self.cell(70, 6, f'Rechnungsnummer: {invoice_number}', 0, 1, 'L')
         self.set_x(120)
@@ -74,12 +156,18 @@ class GlanzwerkInvoicePDF(FPDF):
         self.set_xy(10, 70)
         
     def invoice_title(self):
-        self.set_font('Arial', 'B', 16)
+        self._static_block('invoice_title', GlanzwerkInvoicePDF._draw_invoice_title)
+    
+    def _draw_invoice_title(self):
+        self.set_font(FONT_FAMILY, 'B', 16)
         self.cell(0, 10, 'RECHNUNG', 0, 1, 'L')
         self.ln(5)
         
     def greeting_text(self):
-        self.set_font('Arial', '', 11)
+        self._static_block('greeting_text', GlanzwerkInvoicePDF._draw_greeting_text)
+    
+    def _draw_greeting_text(self):
+        self.set_font(FONT_FAMILY, '', 11)
         self.cell(0, 6, 'Sehr geehrte Damen und Herren,', 0, 1, 'L')
         self.ln(3)
         self.cell(0, 6, 'vielen Dank für Ihre Inanspruchnahme unserer Dienstleistungen bei Glanzwerk Rheinland.', 0, 1, 'L')
@@ -87,60 +175,55 @@ class GlanzwerkInvoicePDF(FPDF):
         self.ln(8)
         
     def service_table(self, invoice_data):
-        # Table header
-        self.set_font('Arial', 'B', 11)
-        self.cell(80, 8, 'Beschreibung', 1, 0, 'L')
-        self.cell(25, 8, 'Anzahl', 1, 0, 'C')
-        self.cell(25, 8, 'Einzelpreis', 1, 0, 'R')
-        self.cell(25, 8, 'MwSt.', 1, 0, 'R')
-        self.cell(25, 8, 'Gesamt', 1, 1, 'R')
-        
-        # Main service row
-        self.set_font('Arial', '', 10)
-        service_description = invoice_data['service_name']
-        service_net = invoice_data['service_price']
-        service_tax = service_net * 0.19
-        service_gross = service_net + service_tax
-        
-        self.cell(80, 8, service_description, 1, 0, 'L')
-        self.cell(25, 8, '1', 1, 0, 'C')
-        self.cell(25, 8, f"{service_net:.2f}EUR", 1, 0, 'R')
-        self.cell(25, 8, f"{service_tax:.2f}EUR", 1, 0, 'R')
-        self.cell(25, 8, f"{service_gross:.2f}EUR", 1, 1, 'R')
-        
-        # Additional services
-        for additional in invoice_data['additional_services']:
-            add_net = additional['price']
-            add_tax = add_net * 0.19
-            add_gross = add_net + add_tax
-            
-            self.cell(80, 8, additional['description'], 1, 0, 'L')
-            self.cell(25, 8, '1', 1, 0, 'C')
-            self.cell(25, 8, f"{add_net:.2f}EUR", 1, 0, 'R')
-            self.cell(25, 8, f"{add_tax:.2f}EUR", 1, 0, 'R')
-            self.cell(25, 8, f"{add_gross:.2f}EUR", 1, 1, 'R')
-        
-        # Subtotal
-        self.set_font('Arial', 'B', 10)
-        self.cell(155, 8, 'Zwischensumme inkl. MwSt.', 1, 0, 'R')
-        self.cell(25, 8, f"{invoice_data['gross_price']:.2f}EUR", 1, 1, 'R')
-        
-        # Discount rows if applicable
+        # Main service and additional services, one row each: unit price, tax and gross of the whole line
+        lines = [(invoice_data['service_name'], invoice_data['service_price'], 1)]
+        lines += [
+            (additional['description'], additional['price'], additional['quantity'])
+            for additional in invoice_data['additional_services']
+        ]
+        rows = []
+        for description, price, quantity in lines:
+            unit_price = to_money(price)
+            net, tax, gross = price_line(unit_price * quantity)
+            rows.append(((description, str(quantity), f"{unit_price:.2f}EUR", f"{tax:.2f}EUR", f"{gross:.2f}EUR"), net))
+        
+        # Subtotal, discount rows if applicable and total; kept together below the last row
+        closing_rows = [('Zwischensumme inkl. MwSt.', f"{invoice_data['gross_price']:.2f}EUR", 'B', 10, 8, 'R')]
         if invoice_data['total_discount_percent'] > 0:
             for discount_source in invoice_data['discount_sources']:
-                self.set_font('Arial', '', 10)
-                self.cell(155, 8, discount_source, 1, 0, 'L')
-                self.cell(25, 8, f"-{invoice_data['discount_amount']:.2f}EUR", 1, 1, 'R')
+                closing_rows.append((discount_source, f"-{invoice_data['discount_amount']:.2f}EUR", '', 10, 8, 'L'))
+        closing_rows.append(('Gesamt inkl. MwSt.', f"{invoice_data['total_price']:.2f}EUR", 'B', 11, 10, 'R'))
         
-        # Total row
-        self.set_font('Arial', 'B', 11)
-        self.cell(155, 10, 'Gesamt inkl. MwSt.', 1, 0, 'R')
-        self.cell(25, 10, f"{invoice_data['total_price']:.2f}EUR", 1, 1, 'R')
+        # Continues on further pages with repeated headings and carried totals (pdf_table.py)
+        SERVICE_TABLE.draw(
+            self, rows, closing_rows, bottom=self.h - FOOTER_HEIGHT, top=TABLE_PAGE_TOP, total=invoice_data['net_price']
+        )
         
         self.ln(8)
         
-    def payment_info(self):
-        self.set_font('Arial', '', 10)
+    def payment_info(self, invoice_date=None):
+        # Payment terms, due date and signature stay together: below a long
+        # service table they move to a new page instead of running into the footer
+        height = (
+            self.page_template.get('payment_terms', GlanzwerkInvoicePDF._draw_payment_terms).height
+            + DUE_DATE_HEIGHT
+            + self.page_template.get('closing_text', GlanzwerkInvoicePDF._draw_closing_text).height
+        )
+        if self.y + height > self.h - FOOTER_HEIGHT:
+            self.add_page()
+            self.set_y(TABLE_PAGE_TOP)
+        
+        self._static_block('payment_terms', GlanzwerkInvoicePDF._draw_payment_terms)
+        
+        due_date = ((invoice_date or datetime.now()) + timedelta(days=14)).strftime("%d.%m.%Y")
+        self.set_font(FONT_FAMILY, '', 10)
+        self.cell(0, 6, f'Bitte überweisen Sie den Betrag bis spätestens {due_date}', 0, 1, 'L')
+        self.ln(5)
+        
+        self._static_block('closing_text', GlanzwerkInvoicePDF._draw_closing_text)
+    
+    def _draw_payment_terms(self):
+        self.set_font(FONT_FAMILY, '', 10)
         
         # Payment method
         self.cell(0, 6, 'Bezahlung durch: [Bar / Überweisung / PayPal]', 0, 1, 'L')
@@ -150,10 +233,9 @@ class GlanzwerkInvoicePDF(FPDF):
         self.cell(0, 6, 'Sofern nichts anderes angegeben ist, entspricht der Monat des', 0, 1, 'L')
         self.cell(0, 6, 'Rechnungsdatums dem Leistungszeitpunkt.', 0, 1, 'L')
         self.ln(3)
-        
-        due_date = (datetime.now() + timedelta(days=14)).strftime("%d.%m.%Y")
-        self.cell(0, 6, f'Bitte überweisen Sie den Betrag bis spätestens {due_date}', 0, 1, 'L')
-        self.ln(5)
+    
+    def _draw_closing_text(self):
+        self.set_font(FONT_FAMILY, '', 10)
         
         # Closing text
         self.cell(0, 6, 'Bei Fragen stehen wir Ihnen gerne zur Verfügung.', 0, 1, 'L')
@@ -164,158 +246,482 @@ class GlanzwerkInvoicePDF(FPDF):
         self.cell(0, 6, 'Mit freundlichen Grüßen,', 0, 1, 'L')
         self.cell(0, 6, 'Glanzwerk Rheinland', 0, 1, 'L')
 
-def parse_additional_services(text):
-    """Parse additional services from text format"""
-    if not text or not text.strip():
-        return []
+# Batch rendering limits
+BATCH_MAX_INVOICES = 1000
+# Renders kept in flight per render process of this app process's pool
+BATCH_IN_FLIGHT_PER_RENDERER = 2
+
+# Slice size for streaming PDF responses
+RESPONSE_CHUNK_SIZE = 64 * 1024
+
+class InvoiceValidationError(ValueError):
+    """Raised when an invoice payload cannot be turned into invoice data"""
+
+
+def build_invoice_data(data, catalog=None):
+    """Validate an invoice payload and calculate its prices"""
+    if catalog is None:
+        catalog = get_catalog()
+    if not isinstance(data, dict):
+        raise InvoiceValidationError('Invalid invoice payload')
+    
+    # Validate required fields
+    required_fields = ['customerName', 'vehicleNumber', 'selectedService']
+    for field in required_fields:
+        if field not in data:
+            raise InvoiceValidationError(f'Missing required field: {field}')
+    
+    service = catalog.services.get(data['selectedService'])
+    if not service:
+        raise InvoiceValidationError('Invalid service selected')
+    
+    # Additional services: a list of line items, or the 'Beschreibung: Preis' text format (line_items.py)
+    additional = data.get('additionalServices') or ''
+    if isinstance(additional, str):
+        additional_services, rejected = parse_additional_services(additional)
+        if rejected:
+            raise InvoiceValidationError('Unreadable additional services (expected "Beschreibung: Preis"): ' + ', '.join(
+                f'line {number} {line!r}' for number, line in rejected
+            ))
+    else:
+        try:
+            additional_services = structured_line_items(additional, catalog.services)
+        except LineItemError as e:
+            raise InvoiceValidationError(str(e)) from None
+
+    # Calculate discounts
+    manual_discount = data.get('manualDiscountPercent')
+    if not (manual_discount and str(manual_discount).replace('.', '').isdigit()):
+        manual_discount = None
+    # Regular after REGULAR_CUSTOMER_VISITS stored invoices; staff can still grant it by hand
+    is_regular_customer = (
+        data.get('isRegularCustomer', False)
+        or visit_count(data['customerName'], data['vehicleNumber']) >= REGULAR_CUSTOMER_VISITS
+    )
+    total_discount_percent, discount_sources = resolve_discounts(
+        catalog.discount_codes,
+        is_regular_customer=is_regular_customer,
+        discount_code=data.get('discountCode', ''),
+        manual_discount=manual_discount
+    )
+    
+    # Calculate prices
+    prices = price_invoice(
+        service['price'],
+        [line_total(item) for item in additional_services],
+        total_discount_percent
+    )
+    
+    return {
+        'customer_name': data['customerName'],
+        'vehicle_number': data['vehicleNumber'],
+        'service_key': data['selectedService'],
+        'service_name': service['name'],
+        'service_price': prices['service_price'],
+        'additional_services': additional_services,
+        'net_price': prices['net_price'],
+        'tax_amount': prices['tax_amount'],
+        'gross_price': prices['gross_price'],
+        'total_discount_percent': prices['total_discount_percent'],
+        'discount_sources': discount_sources,
+        'discount_amount': prices['discount_amount'],
+        'total_price': prices['total_price'],
+        'invoice_date': datetime.now()
+    }
+
+
+def invoice_texts(invoice_data, invoice_number):
+    """The variable texts printed on an invoice; the static ones are all latin-1"""
+    yield invoice_number
+    yield invoice_data['customer_name']
+    yield invoice_data['vehicle_number']
+    yield invoice_data['service_name']
+    for additional in invoice_data['additional_services']:
+        yield additional['description']
+    yield from invoice_data['discount_sources']
+
+
+def build_invoice_pdf(invoice_data, invoice_number, core_font=None):
+    """Lay out a complete invoice document.
+    
+    It is printed in the core font if all its texts are latin-1, unless
+    `core_font` says otherwise.
+    """
+    if core_font is None:
+        core_font = core_font_covers(*invoice_texts(invoice_data, invoice_number))
+    pdf = GlanzwerkInvoicePDF(core_font=core_font)
+    pdf.add_page()
+    
+    # Customer address
+    pdf.customer_address(invoice_data['customer_name'], invoice_data['vehicle_number'])
+    
+    # Invoice header with numbers and dates
+    pdf.invoice_header(invoice_number, invoice_data.get('invoice_date'))
+    
+    # Invoice title
+    pdf.invoice_title()
+    
+    # Greeting text
+    pdf.greeting_text()
+    
+    # Service table
+    with stage('service_table'):
+        pdf.service_table(invoice_data)
+    
+    # Payment information
+    pdf.payment_info(invoice_data.get('invoice_date'))
+    
+    return pdf
+
+
+def render_invoice_pdf(invoice_data, invoice_number):
+    """Render an invoice to PDF bytes (runs inside the render worker processes)"""
+    return build_invoice_pdf(invoice_data, invoice_number).output()
+
+
+# Blank invoice rendered once per font to record the page templates and load fontTools' subsetter
+_WARM_UP_INVOICE = {
+    'customer_name': '', 'vehicle_number': '', 'service_name': '',
+    'service_price': 0, 'additional_services': [], 'net_price': 0, 'gross_price': 0,
+    'total_discount_percent': 0, 'discount_sources': [], 'discount_amount': 0,
+    'total_price': 0,
+}
+
+
+def warm_caches():
+    """Load the catalog, logo, fonts and page template now instead of on the first request"""
+    get_catalog()
+    get_logo(LOGO_PATH).warm()
+    pdf_fonts.warm()
+    for core_font in PAGE_TEMPLATES:
+        build_invoice_pdf(_WARM_UP_INVOICE, '', core_font).output()
+
+
+def archive_pdf(invoice_number, key, pdf_bytes):
+    """Add a rendered invoice to the archive; failures are logged, the invoice is served anyway"""
+    try:
+        pdf_archive.put(invoice_number, pdf_bytes, key)
+    except (ArchiveError, OSError):
+        logger.exception('Could not archive invoice %s', invoice_number)
+
+
+def _job_rendered(job):
+    # Runs on the pool's callback thread once an async render succeeded
+    PDF_BYTES.observe(len(job.pdf))
+    store_invoice(job.invoice_number, job.invoice_data)
+    key = cache_key(job.invoice_number, job.invoice_data, TEMPLATE_VERSION)
+    pdf_cache.put(key, job.pdf)
+    archive_pdf(job.invoice_number, key, job.pdf)
+
+
+# Async render jobs (POST /jobs), rendered on the shared process pool
+render_jobs = RenderJobQueue(render_invoice_pdf, on_success=_job_rendered)
+
+
+# Replaced by '_' in download names: whitespace, control characters, quotes and path separators
+_FILENAME_UNSAFE = re.compile(r'[\s\x00-\x1f\x7f"\\/:*?<>|]')
+
+
+def invoice_filename(invoice_number, customer_name):
+    return f'Rechnung_{invoice_number}_{_FILENAME_UNSAFE.sub("_", customer_name)}.pdf'
+
+
+def pdf_response(pdf_data, filename, etag=None):
+    """Send a rendered PDF as a download without intermediate buffers.
     
-    services = []
-    for line in text.strip().split('\n'):
-        # Match pattern: "Description: Price" or "Description: Price€"
-        match = re.match(r'^(.+?):\s*(\d+(?:\.\d{1,2})?)€?$', line.strip(), re.IGNORECASE)
-        if match:
-            services.append({
-                'description': match.group(1).strip(),
-                'price': float(match.group(2))
-            })
+    `pdf_data` is the bytearray from FPDF.output() (or cached bytes). It is
+    sent through a memoryview in RESPONSE_CHUNK_SIZE slices with an explicit
+    Content-Length, so at most one chunk is copied at a time and large
+    documents stream out.
+    """
+    view = memoryview(pdf_data)
     
-    return services
+    def chunks():
+        started = time.perf_counter()
+        try:
+            for start in range(0, len(view), RESPONSE_CHUNK_SIZE):
+                # WSGI servers only accept bytes, so each slice is copied once on its way out
+                yield bytes(view[start:start + RESPONSE_CHUNK_SIZE])
+        finally:
+            # Runs when the server has written the last chunk or closed the stream
+            STAGE_SECONDS.observe(time.perf_counter() - started, 'send')
+    
+    response = Response(chunks(), mimetype='application/pdf', direct_passthrough=True)
+    response.headers['Content-Length'] = str(len(view))
+    # Headers.set() quotes the name; non-ASCII names also get an RFC 5987 filename*
+    try:
+        filename.encode('ascii')
+        disposition = {'filename': filename}
+    except UnicodeEncodeError:
+        disposition = {
+            'filename': unicodedata.normalize('NFKD', filename).encode('ascii', 'ignore').decode('ascii'),
+            'filename*': f"UTF-8''{quote(filename, safe='')}",
+        }
+    response.headers.set('Content-Disposition', 'attachment', **disposition)
+    if etag:
+        response.set_etag(etag)
+        response.cache_control.no_cache = True
+    return response
+
+
+class _ZipStreamBuffer(io.RawIOBase):
+    """Write-only, non-seekable sink that hands out what ZipFile wrote so far"""
+    
+    def __init__(self):
+        super().__init__()
+        self._chunks = []
+    
+    def writable(self):
+        return True
+    
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+    
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def _stream_invoice_zip(prepared, manifest):
+    """Render prepared invoices on the worker pool and yield the ZIP as members finish"""
+    sink = _ZipStreamBuffer()
+    archive = zipfile.ZipFile(sink, mode='w', compression=zipfile.ZIP_DEFLATED)
+    pool = get_render_pool()
+    max_in_flight = BATCH_IN_FLIGHT_PER_RENDERER * render_pool_size()
+    pending = {}
+    queued = iter(prepared)
+    try:
+        while True:
+            # Keep a bounded number of renders in flight so finished PDFs never pile up
+            for index, invoice_number, invoice_data in queued:
+                future = pool.submit(render_invoice_pdf, invoice_data, invoice_number)
+                RENDERS_IN_FLIGHT.inc()
+                future.add_done_callback(lambda _: RENDERS_IN_FLIGHT.dec())
+                pending[future] = (index, invoice_number, invoice_data)
+                if len(pending) >= max_in_flight:
+                    break
+            if not pending:
+                break
+            
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                index, invoice_number, invoice_data = pending.pop(future)
+                try:
+                    pdf_bytes = future.result()
+                except Exception as e:
+                    manifest.append({'index': index, 'status': 'error', 'error': str(e)})
+                    continue
+                
+                PDF_BYTES.observe(len(pdf_bytes))
+                store_invoice(invoice_number, invoice_data)
+                key = cache_key(invoice_number, invoice_data, TEMPLATE_VERSION)
+                pdf_cache.put(key, pdf_bytes)
+                archive_pdf(invoice_number, key, pdf_bytes)
+                filename = invoice_filename(invoice_number, invoice_data['customer_name'])
+                archive.writestr(filename, pdf_bytes)
+                manifest.append({
+                    'index': index,
+                    'status': 'ok',
+                    'invoiceNumber': invoice_number,
+                    'file': filename
+                })
+                yield sink.drain()
+        
+        manifest.sort(key=lambda entry: entry['index'])
+        archive.writestr('manifest.json', json.dumps({
+            'total': len(manifest),
+            'succeeded': sum(1 for entry in manifest if entry['status'] == 'ok'),
+            'failed': sum(1 for entry in manifest if entry['status'] == 'error'),
+            'items': manifest
+        }, ensure_ascii=False, indent=2))
+        archive.close()
+        yield sink.drain()
+    finally:
+        # Client went away or the stream finished: drop renders nobody will read
+        for future in pending:
+            future.cancel()
+
+
+@invoice_bp.before_request
+def _start_request_timer():
+    g.invoice_request_started = time.perf_counter()
+
+
+@invoice_bp.after_request
+def _record_request_metrics(response):
+    endpoint = request.endpoint or 'unknown'
+    REQUESTS.inc(endpoint, str(response.status_code))
+    if response.status_code >= 400:
+        ERRORS.inc(endpoint)
+    started = g.get('invoice_request_started')
+    if started is not None:
+        REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint)
+    return response
+
 
 @invoice_bp.route('/generate', methods=['POST'])
 def generate_invoice():
     try:
-        data = request.get_json()
-        
-        # Validate required fields
-        required_fields = ['customerName', 'vehicleNumber', 'selectedService']
-        for field in required_fields:
-            if field not in data:
-                return jsonify({'error': f'Missing required field: {field}'}), 400
-        
-        # All 15 services
-        services = {
-            'aussenreinigung': {'name': 'Außenreinigung per Hand', 'price': 50},
-            'felgenreinigung': {'name': 'Felgenreinigung & Flugrostentfernung', 'price': 30},
-            'innenraumreinigung': {'name': 'Innenraumreinigung', 'price': 70},
-            'lederreinigung': {'name': 'Lederreinigung & -pflege', 'price': 60},
-            'lederreparatur': {'name': 'Lederreparatur', 'price': 100},
-            'polsterreinigung': {'name': 'Polster- & Teppichreinigung', 'price': 80},
-            'scheibenreinigung': {'name': 'Scheibenreinigung innen & außen', 'price': 20},
-            'lackpolitur': {'name': 'Lackpolitur & Glanzversiegelung', 'price': 150},
-            'nanokeramik': {'name': 'Nano-Keramik-Versiegelung', 'price': 300},
-            'motorraumreinigung': {'name': 'Motorraumreinigung', 'price': 40},
-            'geruchsneutralisierung': {'name': 'Geruchsneutralisierung & Ozonbehandlung', 'price': 50},
-            'tierhaarentfernung': {'name': 'Tierhaarentfernung', 'price': 40},
-            'hagelschaden': {'name': 'Hagelschaden- und Dellenentfernung', 'price': 200},
-            'folierung': {'name': 'Auto Folierung', 'price': 500},
-            'abholservice': {'name': 'Abhol- und Bringservice', 'price': 25}
-        }
-        
-        # Discount codes
-        discount_codes = {
-            'NEUKUNDE': 15,
-            'STAMMKUNDE': 10,
-            'WINTER2025': 20,
-            'SOMMER2025': 12
-        }
-        
-        service = services.get(data['selectedService'])
-        if not service:
-            return jsonify({'error': 'Invalid service selected'}), 400
-        
-        # Parse additional services
-        additional_services = parse_additional_services(data.get('additionalServices', ''))
-        
-        # Calculate prices
-        service_price = service['price']
-        additional_total = sum(item['price'] for item in additional_services)
-        net_price = service_price + additional_total
-        
-        tax_rate = 0.19
-        tax_amount = net_price * tax_rate
-        gross_price = net_price + tax_amount
-        
-        # Calculate discounts
-        total_discount_percent = 0
-        discount_sources = []
-        
-        # Regular customer discount
-        if data.get('isRegularCustomer', False):
-            total_discount_percent += 10
-            discount_sources.append('Stammkundenrabatt (10%)')
+        with stage('parse_json'):
+            data = request.get_json()
         
-        # Discount code
-        discount_code = data.get('discountCode', '').upper()
-        if discount_code and discount_code in discount_codes:
-            code_discount = discount_codes[discount_code]
-            total_discount_percent += code_discount
-            discount_sources.append(f'Code {discount_code} ({code_discount}%)')
-        
-        # Manual discount
-        manual_discount = data.get('manualDiscountPercent')
-        if manual_discount and str(manual_discount).replace('.', '').isdigit():
-            manual_discount = float(manual_discount)
-            total_discount_percent += manual_discount
-            discount_sources.append(f'Manueller Rabatt ({manual_discount}%)')
-        
-        discount_amount = gross_price * (total_discount_percent / 100)
-        total_price = gross_price - discount_amount
+        try:
+            with stage('pricing'):
+                invoice_data = build_invoice_data(data)
+        except InvoiceValidationError as e:
+            return jsonify({'error': str(e)}), 400
         
         # Generate invoice number
-        invoice_number = f"2025-{datetime.now().strftime('%m%d%H%M')}"
-        
-        # Prepare invoice data
-        invoice_data = {
-            'customer_name': data['customerName'],
-            'vehicle_number': data['vehicleNumber'],
-            'service_name': service['name'],
-            'service_price': service_price,
-            'additional_services': additional_services,
-            'net_price': net_price,
-            'tax_amount': tax_amount,
-            'gross_price': gross_price,
-            'total_discount_percent': total_discount_percent,
-            'discount_sources': discount_sources,
-            'discount_amount': discount_amount,
-            'total_price': total_price
-        }
-        
-        # Generate PDF
-        pdf = GlanzwerkInvoicePDF()
-        pdf.add_page()
-        
-        # Customer address
-        pdf.customer_address(invoice_data['customer_name'], invoice_data['vehicle_number'])
+        invoice_number = next_invoice_number(invoice_data['invoice_date'])
+        
+        # Generate PDF (FPDF.output() hands back its own bytearray, no copy)
+        with RENDERS_IN_FLIGHT.track():
+            with stage('layout'):
+                pdf = build_invoice_pdf(invoice_data, invoice_number)
+            with stage('output'):
+                pdf_output = pdf.output()
+        PDF_BYTES.observe(len(pdf_output))
+        
+        # Keep the invoice for reprints (written in the background)
+        store_invoice(invoice_number, invoice_data)
+        key = cache_key(invoice_number, invoice_data, TEMPLATE_VERSION)
+        pdf_cache.put(key, pdf_output)
+        archive_pdf(invoice_number, key, pdf_output)
         
-        # Invoice header with numbers and dates
-        pdf.invoice_header(invoice_number)
-        
-        # Invoice title
-        pdf.invoice_title()
-        
-        # Greeting text
-        pdf.greeting_text()
-        
-        # Service table
-        pdf.service_table(invoice_data)
-        
-        # Payment information
-        pdf.payment_info()
+        # Return the PDF file
+        return pdf_response(pdf_output, invoice_filename(invoice_number, data['customerName']))
         
-        # Create a BytesIO object to store the PDF
-        pdf_buffer = io.BytesIO()
-        pdf_output = pdf.output(dest='S').encode('latin1')
-        pdf_buffer.write(pdf_output)
-        pdf_buffer.seek(0)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@invoice_bp.route('/batch', methods=['POST'])
+def generate_invoice_batch():
+    """Render many invoices in one call and stream them back as a ZIP archive.
+    
+    Accepts either a JSON list of invoice payloads or {"invoices": [...]}.
+    Invalid payloads and failed renders are reported in manifest.json inside
+    the archive instead of failing the whole batch.
+    """
+    data = request.get_json(silent=True)
+    payloads = data.get('invoices') if isinstance(data, dict) else data
+    if not isinstance(payloads, list) or not payloads:
+        return jsonify({'error': 'Expected a non-empty list of invoices'}), 400
+    if len(payloads) > BATCH_MAX_INVOICES:
+        return jsonify({'error': f'Too many invoices in one batch (max {BATCH_MAX_INVOICES})'}), 400
+    
+    # Validate and price everything up front so workers only render,
+    # all against the same catalog snapshot
+    catalog = get_catalog()
+    batch_number = next_invoice_number()
+    prepared = []
+    manifest = []
+    for index, payload in enumerate(payloads):
+        try:
+            invoice_data = build_invoice_data(payload, catalog)
+        except InvoiceValidationError as e:
+            manifest.append({'index': index, 'status': 'error', 'error': str(e)})
+            continue
+        prepared.append((index, f'{batch_number}-{index + 1:04d}', invoice_data))
+    
+    return Response(
+        _stream_invoice_zip(prepared, manifest),
+        mimetype='application/zip',
+        headers={'Content-Disposition': f'attachment; filename=Rechnungen_{batch_number}.zip'}
+    )
+
+
+@invoice_bp.route('/jobs', methods=['POST'])
+def create_render_job():
+    """Queue an invoice for rendering and return a job id right away"""
+    try:
+        data = request.get_json(silent=True)
+        
+        try:
+            invoice_data = build_invoice_data(data)
+        except InvoiceValidationError as e:
+            return jsonify({'error': str(e)}), 400
+        
+        invoice_number = next_invoice_number(invoice_data['invoice_date'])
+        try:
+            job = render_jobs.submit(
+                invoice_number,
+                invoice_data,
+                invoice_filename(invoice_number, invoice_data['customer_name'])
+            )
+        except QueueFullError as e:
+            return jsonify({'error': str(e)}), 503
+        
+        response = jsonify(job.to_dict())
+        response.status_code = 202
+        response.headers['Location'] = f'{request.base_url}/{job.id}'
+        return response
         
-        # Return the PDF file
-        return send_file(
-            pdf_buffer,
-            as_attachment=True,
-            download_name=f'Rechnung_{invoice_number}_{data["customerName"].replace(" ", "_")}.pdf',
-            mimetype='application/pdf'
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+
+@invoice_bp.route('/jobs/<job_id>', methods=['GET'])
+def get_render_job(job_id):
+    """Job status while queued or rendering; the PDF itself once it is done"""
+    job = render_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if job.status == 'failed':
+        return jsonify(job.to_dict()), 500
+    if job.status != 'done':
+        return jsonify(job.to_dict()), 202
+    
+    return pdf_response(job.pdf, job.filename)
+
+
+@invoice_bp.route('/cache/stats', methods=['GET'])
+def pdf_cache_stats():
+    return jsonify(pdf_cache.stats())
+
+
+@invoice_bp.route('/<invoice_number>', methods=['GET'])
+def get_invoice(invoice_number):
+    """Re-serve a stored invoice as PDF without re-entering its data.
+    
+    The response carries the PDF's content hash as ETag; a matching
+    If-None-Match is answered with 304 before anything is rendered or read.
+    """
+    try:
+        invoice_data = load_invoice(invoice_number)
+        if invoice_data is None:
+            return jsonify({'error': 'Invoice not found'}), 404
+        
+        key = cache_key(invoice_number, invoice_data, TEMPLATE_VERSION)
+        if key in request.if_none_match:
+            response = Response(status=304)
+            response.set_etag(key)
+            return response
+        
+        pdf_bytes = pdf_cache.get(key)
+        if pdf_bytes is None:
+            try:
+                pdf_bytes = pdf_archive.get(invoice_number, key)
+            except ArchiveError:
+                logger.exception('Archived PDF of invoice %s is damaged, rendering it again', invoice_number)
+            if pdf_bytes is None:
+                with RENDERS_IN_FLIGHT.track():
+                    with stage('layout'):
+                        pdf = build_invoice_pdf(invoice_data, invoice_number)
+                    with stage('output'):
+                        pdf_bytes = pdf.output()
+                PDF_BYTES.observe(len(pdf_bytes))
+                # Stored before the archive existed, or rendered with an older template
+                archive_pdf(invoice_number, key, pdf_bytes)
+            pdf_cache.put(key, pdf_bytes)
+        
+        return pdf_response(
+            pdf_bytes,
+            invoice_filename(invoice_number, invoice_data['customer_name']),
+            etag=key
         )
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
-
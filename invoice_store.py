@@ -0,0 +1,563 @@
+"""Persistent invoice store on the app's SQLite database.
+
+Generated invoices are handed to a write-behind queue and written in batches by
+a single background thread, so the generate call never waits on SQLite. Until
+a batch is committed, its invoices are served from the pending map.
+
+Every stored invoice also counts as a visit of its customer and vehicle. The
+count lives in customer_visits, one row per customer_key() that is bumped in
+the same transaction as the invoice, so the regular-customer check is a single
+primary key lookup instead of a COUNT(*) over the visit history. The revenue
+rollups behind the reports (rollups.py) are updated the same way.
+"""
+import atexit
+import json
+import logging
+import multiprocessing
+import queue
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import Counter
+from datetime import datetime
+from decimal import Decimal
+
+from sqlalchemy import delete, event, func, select, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Engine
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+
+from extensions import db
+from pricing import discount_source_key
+from rollups import clear_rollups, rollups_empty, update_rollups
+from search_index import create_search_index, rebuild_search_index, search_index_empty
+
+# Write-behind tuning: invoices per transaction and how long to wait for a batch to fill
+WRITE_BATCH_SIZE = 50
+WRITE_FLUSH_INTERVAL = 0.2
+
+# Rows per INSERT when customer_visits is rebuilt
+REBUILD_CHUNK_SIZE = 1000
+
+# Columns added to existing tables after their first release; create_all() only creates missing tables
+_ADDED_COLUMNS = {
+    'invoice_items': (
+        ('quantity', 'INTEGER NOT NULL DEFAULT 1'),
+        ('service_key', 'VARCHAR(60)'),
+    ),
+}
+
+# Numbers tried when reserving one that another process on the same database already took
+RESERVE_ATTEMPTS = 20
+
+logger = logging.getLogger(__name__)
+
+_writer = None
+
+# [YYYYMMDDHHMM of the last number, sequence within that minute] in shared memory, so
+# gunicorn workers forked from one master never hand out the same number
+_number_state = multiprocessing.Array('q', 2)
+
+
+@event.listens_for(Engine, 'connect')
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    # WAL lets readers run while the writer commits; NORMAL is durable enough with WAL
+    cursor.execute('PRAGMA journal_mode=WAL')
+    cursor.execute('PRAGMA synchronous=NORMAL')
+    cursor.execute('PRAGMA busy_timeout=5000')
+    cursor.execute('PRAGMA foreign_keys=ON')
+    cursor.close()
+
+
+def _cents(amount):
+    return int(amount * 100)
+
+
+def _euros(cents):
+    return Decimal(cents).scaleb(-2)
+
+
+def customer_key(customer_name, vehicle_number):
+    """Visit counter key: case, spacing and plate separators do not matter.
+
+    'Max  Müller' / 'NR-GW 123' and 'max müller' / 'nr gw123' are the same visitor.
+    """
+    name = ' '.join(unicodedata.normalize('NFKC', customer_name or '').casefold().split())
+    plate = re.sub(r'[\s-]+', '', unicodedata.normalize('NFKC', vehicle_number or '')).upper()
+    return f'{name}|{plate}'
+
+
+class Invoice(db.Model):
+    __tablename__ = 'invoices'
+
+    id = db.Column(db.Integer, primary_key=True)
+    invoice_number = db.Column(db.String(40), unique=True, nullable=False)
+    invoice_date = db.Column(db.DateTime, nullable=False, index=True)
+    customer_name = db.Column(db.String(200), nullable=False, index=True)
+    vehicle_number = db.Column(db.String(40), nullable=False, index=True)
+    service_key = db.Column(db.String(60), nullable=False)
+    service_name = db.Column(db.String(200), nullable=False)
+    service_cents = db.Column(db.Integer, nullable=False)
+    net_cents = db.Column(db.Integer, nullable=False)
+    tax_cents = db.Column(db.Integer, nullable=False)
+    gross_cents = db.Column(db.Integer, nullable=False)
+    discount_percent = db.Column(db.String(10), nullable=False, default='0')
+    discount_cents = db.Column(db.Integer, nullable=False, default=0)
+    total_cents = db.Column(db.Integer, nullable=False)
+    discount_sources = db.Column(db.Text, nullable=False, default='[]')
+    items = db.relationship(
+        'InvoiceItem', backref='invoice', order_by='InvoiceItem.position',
+        cascade='all, delete-orphan', lazy='selectin'
+    )
+
+    @classmethod
+    def from_invoice_data(cls, invoice_number, invoice_data):
+        return cls(
+            invoice_number=invoice_number,
+            invoice_date=invoice_data['invoice_date'],
+            customer_name=invoice_data['customer_name'],
+            vehicle_number=invoice_data['vehicle_number'],
+            service_key=invoice_data['service_key'],
+            service_name=invoice_data['service_name'],
+            service_cents=_cents(invoice_data['service_price']),
+            net_cents=_cents(invoice_data['net_price']),
+            tax_cents=_cents(invoice_data['tax_amount']),
+            gross_cents=_cents(invoice_data['gross_price']),
+            discount_percent=str(invoice_data['total_discount_percent']),
+            discount_cents=_cents(invoice_data['discount_amount']),
+            total_cents=_cents(invoice_data['total_price']),
+            discount_sources=json.dumps(invoice_data['discount_sources'], ensure_ascii=False),
+            items=[
+                InvoiceItem(
+                    position=position, description=item['description'], price_cents=_cents(item['price']),
+                    quantity=item['quantity'], service_key=item['service_key']
+                )
+                for position, item in enumerate(invoice_data['additional_services'])
+            ]
+        )
+
+    def to_invoice_data(self):
+        return {
+            'customer_name': self.customer_name,
+            'vehicle_number': self.vehicle_number,
+            'service_key': self.service_key,
+            'service_name': self.service_name,
+            'service_price': _euros(self.service_cents),
+            'additional_services': [
+                {
+                    'description': item.description, 'price': _euros(item.price_cents),
+                    'quantity': item.quantity, 'service_key': item.service_key
+                }
+                for item in self.items
+            ],
+            'net_price': _euros(self.net_cents),
+            'tax_amount': _euros(self.tax_cents),
+            'gross_price': _euros(self.gross_cents),
+            'total_discount_percent': Decimal(self.discount_percent),
+            'discount_sources': json.loads(self.discount_sources),
+            'discount_amount': _euros(self.discount_cents),
+            'total_price': _euros(self.total_cents),
+            'invoice_date': self.invoice_date
+        }
+
+
+class InvoiceItem(db.Model):
+    __tablename__ = 'invoice_items'
+
+    id = db.Column(db.Integer, primary_key=True)
+    invoice_id = db.Column(db.Integer, db.ForeignKey('invoices.id', ondelete='CASCADE'), nullable=False, index=True)
+    position = db.Column(db.Integer, nullable=False)
+    description = db.Column(db.String(200), nullable=False)
+    # Unit price; the line amounts to price_cents * quantity
+    price_cents = db.Column(db.Integer, nullable=False)
+    quantity = db.Column(db.Integer, nullable=False, default=1, server_default='1')
+    # Catalog service the line item was picked from, None for free text
+    service_key = db.Column(db.String(60))
+
+
+class InvoiceNumber(db.Model):
+    """Every invoice number handed out, reserved by next_invoice_number() before the PDF is rendered"""
+    __tablename__ = 'invoice_numbers'
+    __table_args__ = {'sqlite_with_rowid': False}
+
+    invoice_number = db.Column(db.String(40), primary_key=True)
+    reserved_at = db.Column(db.DateTime, nullable=False)
+
+
+class CustomerVisits(db.Model):
+    """Number of stored invoices per customer_key(), kept up to date by InvoiceWriter"""
+    __tablename__ = 'customer_visits'
+    # Clustered on the key: a lookup is one B-tree descent, no separate index
+    __table_args__ = {'sqlite_with_rowid': False}
+
+    customer_key = db.Column(db.String(260), primary_key=True)
+    visit_count = db.Column(db.Integer, nullable=False)
+    last_visit = db.Column(db.DateTime, nullable=False)
+
+
+def _count_visits(records):
+    """customer_key -> [visits, last visit] for (customer_name, vehicle_number, invoice_date) records"""
+    visits = {}
+    for customer_name, vehicle_number, invoice_date in records:
+        entry = visits.setdefault(customer_key(customer_name, vehicle_number), [0, invoice_date])
+        entry[0] += 1
+        entry[1] = max(entry[1], invoice_date)
+    return visits
+
+
+def _split_discount(discount_cents, discount_sources):
+    """(source, cents) per discount label, the discount split in proportion to the percentages"""
+    sources = [discount_source_key(label) for label in discount_sources]
+    total_percent = sum(percent for _, percent in sources)
+    split = []
+    remaining = discount_cents
+    for index, (source, percent) in enumerate(sources):
+        if index == len(sources) - 1:
+            cents = remaining
+        else:
+            cents = int(discount_cents * percent / total_percent) if total_percent else 0
+        remaining -= cents
+        split.append((source, cents))
+    return split
+
+
+def _rollup_record(invoice_date, customer_name, vehicle_number, service_key, cents, discount_sources):
+    return dict(
+        cents,
+        day=invoice_date.date(),
+        service_key=service_key,
+        customer_key=customer_key(customer_name, vehicle_number),
+        customer_name=customer_name,
+        vehicle_number=vehicle_number,
+        discounts=_split_discount(cents['discount_cents'], discount_sources),
+    )
+
+
+def _rollup_record_from_invoice_data(invoice_data):
+    return _rollup_record(
+        invoice_data['invoice_date'], invoice_data['customer_name'], invoice_data['vehicle_number'],
+        invoice_data['service_key'],
+        {
+            'service_cents': _cents(invoice_data['service_price']),
+            'net_cents': _cents(invoice_data['net_price']),
+            'tax_cents': _cents(invoice_data['tax_amount']),
+            'gross_cents': _cents(invoice_data['gross_price']),
+            'discount_cents': _cents(invoice_data['discount_amount']),
+            'total_cents': _cents(invoice_data['total_price']),
+        },
+        invoice_data['discount_sources'],
+    )
+
+
+class InvoiceWriter:
+    """Single background writer that commits queued invoices in batches"""
+
+    def __init__(self, app, batch_size=WRITE_BATCH_SIZE, flush_interval=WRITE_FLUSH_INTERVAL, on_commit=None):
+        self.app = app
+        # Called in the writer thread, in an app context, after each written batch
+        self.on_commit = on_commit
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue()
+        self._pending = {}
+        self._pending_visits = Counter()
+        self._pending_lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, name='invoice-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, invoice_number, invoice_data):
+        key = customer_key(invoice_data['customer_name'], invoice_data['vehicle_number'])
+        with self._pending_lock:
+            self._pending[invoice_number] = invoice_data
+            self._pending_visits[key] += 1
+        self._queue.put((invoice_number, invoice_data))
+
+    def pending(self, invoice_number):
+        with self._pending_lock:
+            return self._pending.get(invoice_number)
+
+    def pending_visits(self, key):
+        """Queued invoices for `key` that are not counted in customer_visits yet"""
+        with self._pending_lock:
+            return self._pending_visits.get(key, 0)
+
+    def close(self):
+        """Write everything still queued and stop the thread"""
+        if self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join()
+
+    def _run(self):
+        stopping = False
+        while not stopping:
+            record = self._queue.get()
+            if record is None:
+                break
+            batch = [record]
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    record = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if record is None:
+                    stopping = True
+                    break
+                batch.append(record)
+            self._write(batch)
+
+    def _write(self, batch):
+        with self.app.app_context():
+            try:
+                self._insert(batch)
+            except SQLAlchemyError:
+                db.session.rollback()
+                # Retry one by one so a single bad record cannot drop the whole batch
+                for record in batch:
+                    try:
+                        self._insert([record])
+                    except IntegrityError:
+                        # The number was reserved before the PDF went out, so a clash means
+                        # two invoices carry the same number; never renumber a sent invoice
+                        db.session.rollback()
+                        logger.critical('Invoice %s was NOT stored: its invoice number is already taken',
+                                        record[0], exc_info=True)
+                    except SQLAlchemyError:
+                        db.session.rollback()
+                        logger.exception('Could not store invoice %s', record[0])
+            finally:
+                db.session.remove()
+        if self.on_commit is not None:
+            with self.app.app_context():
+                try:
+                    self.on_commit()
+                except Exception:
+                    logger.exception('on_commit hook failed')
+                finally:
+                    db.session.remove()
+        with self._pending_lock:
+            for invoice_number, invoice_data in batch:
+                self._pending.pop(invoice_number, None)
+                key = customer_key(invoice_data['customer_name'], invoice_data['vehicle_number'])
+                self._pending_visits[key] -= 1
+                if self._pending_visits[key] <= 0:
+                    del self._pending_visits[key]
+
+    def _insert(self, batch):
+        db.session.add_all([
+            Invoice.from_invoice_data(invoice_number, invoice_data)
+            for invoice_number, invoice_data in batch
+        ])
+        visits = _count_visits(
+            (invoice_data['customer_name'], invoice_data['vehicle_number'], invoice_data['invoice_date'])
+            for _, invoice_data in batch
+        )
+        update_rollups(db.session, [_rollup_record_from_invoice_data(invoice_data) for _, invoice_data in batch])
+        # Same transaction as the invoices, so the counters never drift from them
+        insert = sqlite_insert(CustomerVisits)
+        db.session.execute(insert.on_conflict_do_update(
+            index_elements=[CustomerVisits.customer_key],
+            set_={
+                'visit_count': CustomerVisits.visit_count + insert.excluded.visit_count,
+                'last_visit': func.max(CustomerVisits.last_visit, insert.excluded.last_visit),
+            }
+        ), [
+            {'customer_key': key, 'visit_count': count, 'last_visit': last_visit}
+            for key, (count, last_visit) in visits.items()
+        ])
+        db.session.commit()
+
+
+def init_invoice_store(app, on_commit=None):
+    """Create the invoice tables and start the write-behind thread for `app`.
+
+    `on_commit` is called in the writer thread after every written batch.
+    """
+    global _writer
+    with app.app_context():
+        db.create_all()
+        _add_missing_columns()
+        # Invoices stored before the counter existed
+        if (db.session.query(CustomerVisits.customer_key).first() is None
+                and db.session.query(Invoice.id).first() is not None):
+            rebuild_customer_visits()
+        if rollups_empty(db.session) and db.session.query(Invoice.id).first() is not None:
+            rebuild_rollups()
+        create_search_index(db.session)
+        if search_index_empty(db.session) and db.session.query(Invoice.id).first() is not None:
+            logger.info('Indexed %d invoices for search', rebuild_search_index(db.session))
+        db.session.commit()
+    if _writer is None:
+        _writer = InvoiceWriter(app, on_commit=on_commit)
+        atexit.register(_writer.close)
+    return _writer
+
+
+def _add_missing_columns():
+    for table, columns in _ADDED_COLUMNS.items():
+        existing = {row[1] for row in db.session.execute(text(f'PRAGMA table_info({table})'))}
+        for name, definition in columns:
+            if name not in existing:
+                db.session.execute(text(f'ALTER TABLE {table} ADD COLUMN {name} {definition}'))
+                logger.info('Added column %s.%s', table, name)
+
+
+def rebuild_customer_visits():
+    """Recount customer_visits from all stored invoices; needs an app context"""
+    records = db.session.execute(
+        select(Invoice.customer_name, Invoice.vehicle_number, Invoice.invoice_date)
+        .execution_options(yield_per=REBUILD_CHUNK_SIZE)
+    )
+    rows = [
+        {'customer_key': key, 'visit_count': count, 'last_visit': last_visit}
+        for key, (count, last_visit) in _count_visits(records).items()
+    ]
+    db.session.execute(delete(CustomerVisits))
+    for start in range(0, len(rows), REBUILD_CHUNK_SIZE):
+        db.session.execute(sqlite_insert(CustomerVisits), rows[start:start + REBUILD_CHUNK_SIZE])
+    db.session.commit()
+    logger.info('Rebuilt visit counts for %d customers', len(rows))
+    return len(rows)
+
+
+def rebuild_rollups():
+    """Recompute the revenue rollups from all stored invoices; needs an app context"""
+    rows = db.session.execute(
+        select(
+            Invoice.invoice_date, Invoice.customer_name, Invoice.vehicle_number, Invoice.service_key,
+            Invoice.service_cents, Invoice.net_cents, Invoice.tax_cents, Invoice.gross_cents,
+            Invoice.discount_cents, Invoice.total_cents, Invoice.discount_sources,
+        ).execution_options(yield_per=REBUILD_CHUNK_SIZE)
+    )
+    clear_rollups(db.session)
+    invoices = 0
+    for chunk in rows.partitions():
+        update_rollups(db.session, [
+            _rollup_record(
+                row.invoice_date, row.customer_name, row.vehicle_number, row.service_key,
+                {
+                    'service_cents': row.service_cents, 'net_cents': row.net_cents, 'tax_cents': row.tax_cents,
+                    'gross_cents': row.gross_cents, 'discount_cents': row.discount_cents,
+                    'total_cents': row.total_cents,
+                },
+                json.loads(row.discount_sources),
+            )
+            for row in chunk
+        ])
+        invoices += len(chunk)
+    db.session.commit()
+    logger.info('Rebuilt revenue rollups from %d invoices', invoices)
+    return invoices
+
+
+def restart_writer_after_fork():
+    """Give a forked worker process its own write-behind thread; threads do not survive fork()"""
+    global _writer
+    if _writer is not None:
+        _writer = InvoiceWriter(_writer.app, on_commit=_writer.on_commit)
+        atexit.register(_writer.close)
+    return _writer
+
+
+def _highest_sequence(prefix):
+    """Highest sequence within the minute `prefix` among reserved and stored invoice numbers"""
+    # Every number of the minute sorts between 'prefix' and 'prefix.' ('.' follows '-');
+    # invoices stored before numbers were reserved only show up in invoices
+    numbers = []
+    for column in (InvoiceNumber.invoice_number, Invoice.invoice_number):
+        numbers.extend(db.session.execute(
+            select(column).where(column >= prefix, column < prefix + '.')
+        ).scalars())
+    highest = 0
+    for number in numbers:
+        if number == prefix:
+            highest = max(highest, 1)
+            continue
+        # '-2' of a single invoice, '-2-0001' of a batch
+        sequence = number[len(prefix) + 1:].split('-')[0]
+        if number[len(prefix)] == '-' and sequence.isdigit():
+            highest = max(highest, int(sequence))
+    return highest
+
+
+def next_invoice_number(invoice_date=None):
+    """Invoice numbers are YYYY-MMDDHHMM; later invoices in the same minute get -2, -3, ...
+
+    Each number is reserved in invoice_numbers before it is returned, that is
+    before the PDF carrying it is rendered. A number another process on the same
+    database already reserved is skipped, and the first number of a minute
+    continues after the ones already reserved, so a restart within the same
+    minute never hands out a number again.
+    """
+    prefix = (invoice_date or datetime.now()).strftime('%Y-%m%d%H%M')
+    minute = int(prefix.replace('-', ''))
+    with _number_state.get_lock():
+        if _writer is None:
+            return _advance(prefix, minute, 0)
+        with _writer.app.app_context():
+            try:
+                highest = None if _number_state[0] == minute else _highest_sequence(prefix)
+                for _ in range(RESERVE_ATTEMPTS):
+                    number = _advance(prefix, minute, highest)
+                    highest = None
+                    if _reserve(number):
+                        return number
+            finally:
+                db.session.remove()
+    raise RuntimeError(f"No free invoice number in {prefix} after {RESERVE_ATTEMPTS} attempts")
+
+
+def _advance(prefix, minute, highest):
+    """Next number of the minute in _number_state; `highest` restarts the sequence after it"""
+    if _number_state[0] != minute:
+        _number_state[0] = minute
+        _number_state[1] = highest or 0
+    _number_state[1] += 1
+    return prefix if _number_state[1] == 1 else f'{prefix}-{_number_state[1]}'
+
+
+def _reserve(invoice_number):
+    """Insert `invoice_number` into invoice_numbers; False if it is already taken"""
+    try:
+        with db.engine.begin() as connection:
+            connection.execute(InvoiceNumber.__table__.insert().values(
+                invoice_number=invoice_number, reserved_at=datetime.now()
+            ))
+    except IntegrityError:
+        return False
+    return True
+
+
+def store_invoice(invoice_number, invoice_data):
+    """Queue an invoice for writing; a no-op when no store is configured"""
+    if _writer is not None:
+        _writer.submit(invoice_number, invoice_data)
+
+
+def load_invoice(invoice_number):
+    """Return the stored invoice data for `invoice_number`, or None"""
+    if _writer is not None:
+        invoice_data = _writer.pending(invoice_number)
+        if invoice_data is not None:
+            return invoice_data
+    invoice = Invoice.query.filter_by(invoice_number=invoice_number).first()
+    return invoice.to_invoice_data() if invoice else None
+
+
+def visit_count(customer_name, vehicle_number):
+    """Stored and queued invoices of this customer and vehicle; 0 when no store is configured"""
+    if _writer is None:
+        return 0
+    key = customer_key(customer_name, vehicle_number)
+    visits = db.session.execute(
+        select(CustomerVisits.visit_count).where(CustomerVisits.customer_key == key)
+    ).scalar()
+    return (visits or 0) + _writer.pending_visits(key)
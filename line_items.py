@@ -0,0 +1,119 @@
+"""Additional line items of an invoice, as JSON or in the text format.
+
+The API takes them as a list, one object per line item:
+
+    "additionalServices": [
+        {"description": "Fußmatten waschen", "unitPrice": 5, "quantity": 4},
+        {"serviceKey": "felgenreinigung", "quantity": 2}
+    ]
+
+A serviceKey takes description and unit price from the catalog; either can
+still be given to override it. The text format, one 'Beschreibung: Preis' per
+line with an optional quantity in front ('4x Fußmatten waschen: 5€'), is still
+accepted. It is read in a single pass with one compiled pattern, and lines it
+cannot read are reported instead of being dropped.
+
+Every line item is a dict of description, price (the net unit price),
+quantity and service_key (None for free text).
+"""
+import re
+from decimal import Decimal, InvalidOperation
+
+from pricing import to_money
+
+# invoice_items.description is a VARCHAR(200)
+MAX_DESCRIPTION_LENGTH = 200
+MAX_QUANTITY = 9999
+
+# '[<quantity>x ]<description>: <price>[€]', prices with a decimal point or comma
+LINE_PATTERN = re.compile(r'(?:(\d+)\s*[x×]\s+)?(.+?):\s*(\d+(?:[.,]\d{1,2})?)\s*€?', re.IGNORECASE)
+
+
+class LineItemError(ValueError):
+    """Raised when a structured line item is incomplete or out of range"""
+
+
+def line_item(description, price, quantity=1, service_key=None):
+    return {'description': description, 'price': price, 'quantity': quantity, 'service_key': service_key}
+
+
+def line_total(item):
+    """Net amount of a line item: unit price times quantity"""
+    return item['price'] * item['quantity']
+
+
+def parse_additional_services(text):
+    """Line items from the text format.
+
+    Returns (items, rejected) where rejected holds (line number, line) for
+    every non-blank line that does not read as a line item.
+    """
+    items = []
+    rejected = []
+    for number, line in enumerate((text or '').splitlines(), 1):
+        line = line.strip()
+        if not line:
+            continue
+        match = LINE_PATTERN.fullmatch(line)
+        if match is None:
+            rejected.append((number, line))
+            continue
+        quantity, description, price = match.groups()
+        quantity = int(quantity) if quantity else 1
+        description = description.strip()
+        if not 1 <= quantity <= MAX_QUANTITY or len(description) > MAX_DESCRIPTION_LENGTH:
+            rejected.append((number, line))
+            continue
+        items.append(line_item(description, to_money(price.replace(',', '.')), quantity))
+    return items, rejected
+
+
+def structured_line_items(entries, services):
+    """Line items from the API's JSON list; `services` is the catalog's services by key"""
+    if not isinstance(entries, list):
+        raise LineItemError('additionalServices must be a list of line items or text')
+    items = []
+    for position, entry in enumerate(entries, 1):
+        if not isinstance(entry, dict):
+            raise LineItemError(f'Line item {position}: expected an object')
+        service_key = entry.get('serviceKey') or None
+        service = None
+        if service_key is not None:
+            service = services.get(service_key) if isinstance(service_key, str) else None
+            if service is None:
+                raise LineItemError(f'Line item {position}: unknown service {service_key!r}')
+
+        description = entry.get('description') or (service['name'] if service else None)
+        if not isinstance(description, str) or not description.strip():
+            raise LineItemError(f'Line item {position}: missing description')
+        description = description.strip()
+        if len(description) > MAX_DESCRIPTION_LENGTH:
+            raise LineItemError(f'Line item {position}: description longer than {MAX_DESCRIPTION_LENGTH} characters')
+
+        price = _amount(entry.get('unitPrice', service['price'] if service else None))
+        if price is None:
+            raise LineItemError(f'Line item {position}: unitPrice must be a non-negative amount')
+
+        quantity = entry.get('quantity', 1)
+        if isinstance(quantity, str) and quantity.strip().isdigit():
+            quantity = int(quantity)
+        if isinstance(quantity, float) and quantity.is_integer():
+            quantity = int(quantity)
+        if isinstance(quantity, bool) or not isinstance(quantity, int) or not 1 <= quantity <= MAX_QUANTITY:
+            raise LineItemError(f'Line item {position}: quantity must be a whole number from 1 to {MAX_QUANTITY}')
+
+        items.append(line_item(description, price, quantity, service_key))
+    return items
+
+
+def _amount(value):
+    """`value` as a Decimal rounded to cents, or None unless it is a finite, non-negative number"""
+    if isinstance(value, bool) or not isinstance(value, (int, float, str, Decimal)):
+        return None
+    try:
+        amount = Decimal(str(value).strip().replace(',', '.'))
+    except InvalidOperation:
+        return None
+    if not amount.is_finite() or amount < 0:
+        return None
+    return to_money(amount)
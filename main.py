@@ -3,11 +3,21 @@ import sys
 # DON'T CHANGE THIS !!!
 sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
 
-from flask import Flask, send_from_directory
+from flask import Flask, jsonify
 from flask_cors import CORS
 from src.models.user import db
 from src.routes.user import user_bp
-from src.routes.invoice import invoice_bp
+from src.routes.invoice import invoice_bp, render_jobs, warm_caches
+from invoice_store import init_invoice_store, restart_writer_after_fork
+from catalog import get_registry
+from metrics import metrics_bp, restart_metrics_after_fork
+from reports import reports_bp
+from exports import exports_bp
+from search import search_bp
+from customer_index import get_customer_index
+from static_assets import StaticManifest
+from sqlalchemy import text
+from sqlalchemy.exc import SQLAlchemyError
 
 app = Flask(__name__, static_folder=os.path.join(os.path.dirname(__file__), 'static'))
 app.config['SECRET_KEY'] = 'asdf#FGSgvasgf$5$WGT'
@@ -17,13 +27,78 @@ CORS(app)
 
 app.register_blueprint(user_bp, url_prefix='/api')
 app.register_blueprint(invoice_bp, url_prefix='/api/invoice')
+app.register_blueprint(metrics_bp, url_prefix='/api')
+app.register_blueprint(reports_bp, url_prefix='/api/reports')
+app.register_blueprint(exports_bp, url_prefix='/api/exports')
+app.register_blueprint(search_bp, url_prefix='/api/search')
 
 # uncomment if you need to use database
 app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(os.path.dirname(__file__), 'database', 'app.db')}"
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
+# SQLite runs in WAL mode (see invoice_store.py); pooled connections are shared across threads
+app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {
+    'pool_size': 10,
+    'max_overflow': 20,
+    'pool_timeout': 30,
+    'connect_args': {'timeout': 30, 'check_same_thread': False},
+}
 db.init_app(app)
-with app.app_context():
-    db.create_all()
+
+# Set by warm(); /api/ready answers 503 until then
+ready = False
+
+# Scanned and precompressed by init(); restart after deploying a new front-end build
+static_manifest = None
+
+
+def _refresh_customer_index():
+    # In the writer thread, right after a batch is committed
+    get_customer_index().refresh(db.session)
+
+
+def init():
+    """Create the tables and start the write-behind thread; under gunicorn this runs once, before forking
+
+    Not done on import: render processes started by `python main.py` import this
+    module again as __mp_main__, and must not start a second app there.
+    """
+    global static_manifest
+    with app.app_context():
+        db.create_all()
+    init_invoice_store(app, on_commit=_refresh_customer_index)
+    # Job status and finished PDFs in SQLite, so any worker can answer GET /api/invoice/jobs/<id>
+    render_jobs.init_app(app)
+    static_manifest = StaticManifest(app.static_folder)
+
+
+def warm():
+    """Load caches before the first request; under gunicorn this runs once, before forking (gunicorn.conf.py)"""
+    global ready
+    warm_caches()
+    with app.app_context():
+        get_customer_index().refresh(db.session)
+    ready = True
+
+
+def after_fork():
+    """Per-worker state that must not be shared across fork(): DB connections and background threads"""
+    with app.app_context():
+        # Connections opened by create_all() in the master stay with the master
+        db.engine.dispose(close=False)
+    restart_writer_after_fork()
+    restart_metrics_after_fork()
+    get_registry().start_watcher()
+
+
+@app.route('/api/ready')
+def readiness():
+    if not ready:
+        return jsonify({'status': 'starting'}), 503
+    try:
+        db.session.execute(text('SELECT 1'))
+    except SQLAlchemyError:
+        return jsonify({'status': 'database unavailable'}), 503
+    return jsonify({'status': 'ready', 'pid': os.getpid()})
 
 @app.route('/', defaults={'path': ''})
 @app.route('/<path:path>')
@@ -32,15 +107,17 @@ def serve(path):
     if static_folder_path is None:
             return "Static folder not configured", 404
 
-    if path != "" and os.path.exists(os.path.join(static_folder_path, path)):
-        return send_from_directory(static_folder_path, path)
-    else:
-        index_path = os.path.join(static_folder_path, 'index.html')
-        if os.path.exists(index_path):
-            return send_from_directory(static_folder_path, 'index.html')
-        else:
+    asset = static_manifest.get(path) if path != "" else None
+    if asset is None:
+        # Client-side routes fall back to the single-page app
+        asset = static_manifest.get('index.html')
+        if asset is None:
             return "index.html not found", 404
+    return asset.response()
 
 
 if __name__ == '__main__':
+    # Development server; production runs under gunicorn -c gunicorn.conf.py main:app
+    init()
+    warm()
     app.run(host='0.0.0.0', port=5000, debug=True)
@@ -0,0 +1,310 @@
+"""In-process counters, gauges and histograms exposed in Prometheus text format.
+
+Recording is a perf_counter() call, a bisect over a short bucket list and a few
+integer additions under a lock, cheap enough to stay on in production.
+Values are recorded in the process that observes them. Under gunicorn every
+worker also writes its values to a file in a directory the master set up
+(share_across_processes), at least every EXPORT_INTERVAL seconds, and
+GET /api/metrics adds up all files, so any worker answers for the whole
+server. Without that directory the values of this process are rendered.
+The Streamlit app records into the same metrics when it renders a PDF; it has
+no routes of its own, so serve_metrics() exposes them on a separate port.
+"""
+import atexit
+import glob
+import json
+import os
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from contextlib import contextmanager
+
+# Flask is only installed with the API; the Streamlit app records metrics without it
+try:
+    from flask import Blueprint, Response
+except ImportError:
+    Blueprint = None
+
+# Seconds, from sub-millisecond JSON parsing up to multi-second bulk renders
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Bytes, from a one-page invoice without logo up to long fleet invoices
+SIZE_BUCKETS = (4096, 16384, 65536, 131072, 262144, 524288, 1048576, 4194304)
+
+# Seconds between two writes of a worker's values to the shared directory
+EXPORT_INTERVAL = 5
+
+_registry = []
+
+# Directory of the per-process value files; None keeps metrics process-local
+_directory = None
+
+# This process's file there, '<pid>-<token>.json': a new token per start, so a
+# worker that is given a dead worker's pid does not overwrite that one's values
+_snapshot_file = None
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labelnames, labelvalues, extra=None):
+    pairs = list(zip(labelnames, labelvalues))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _header(self):
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type}']
+
+    def snapshot(self):
+        """[labelvalues, value] pairs as JSON can hold them"""
+        with self._lock:
+            return [[list(labelvalues), list(value) if isinstance(value, list) else value]
+                    for labelvalues, value in self._values.items()]
+
+
+class Counter(_Metric):
+    type = 'counter'
+
+    def inc(self, *labelvalues, amount=1):
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def render(self, items=None):
+        lines = self._header()
+        if items is None:
+            with self._lock:
+                items = sorted(self._values.items())
+        if not items and not self.labelnames:
+            items = [((), 0)]
+        for labelvalues, value in items:
+            lines.append(f'{self.name}{_format_labels(self.labelnames, labelvalues)} {_format_value(value)}')
+        return lines
+
+
+class Gauge(Counter):
+    type = 'gauge'
+
+    def dec(self, *labelvalues, amount=1):
+        self.inc(*labelvalues, amount=-amount)
+
+    @contextmanager
+    def track(self, *labelvalues):
+        self.inc(*labelvalues)
+        try:
+            yield
+        finally:
+            self.dec(*labelvalues)
+
+
+class Histogram(_Metric):
+    type = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=STAGE_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labelvalues):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(labelvalues)
+            if series is None:
+                # Per-bucket counts (last one is +Inf), then sum and count
+                series = self._values[labelvalues] = [0] * (len(self.buckets) + 1) + [0.0, 0]
+            series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def time(self, *labelvalues):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labelvalues)
+
+    def render(self, items=None):
+        lines = self._header()
+        if items is None:
+            with self._lock:
+                items = sorted((labelvalues, list(series)) for labelvalues, series in self._values.items())
+        for labelvalues, series in items:
+            cumulative = 0
+            for upper, count in zip(self.buckets + (float('inf'),), series):
+                cumulative += count
+                labels = _format_labels(self.labelnames, labelvalues, ('le', _format_value(float(upper))))
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labelnames, labelvalues)
+            lines.append(f'{self.name}_sum{labels} {_format_value(series[-2])}')
+            lines.append(f'{self.name}_count{labels} {series[-1]}')
+        return lines
+
+
+def _snapshot():
+    return {metric.name: metric.snapshot() for metric in _registry}
+
+
+def _write_snapshot():
+    global _snapshot_file
+    if _snapshot_file is None:
+        _snapshot_file = f'{os.getpid()}-{uuid.uuid4().hex}.json'
+    path = os.path.join(_directory, _snapshot_file)
+    try:
+        with open(path + '.tmp', 'w') as f:
+            json.dump(_snapshot(), f)
+        os.replace(path + '.tmp', path)
+    except OSError:
+        pass
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def _read_snapshots():
+    """(values, process alive) for every process that wrote its values to the directory"""
+    snapshots = []
+    for path in glob.glob(os.path.join(_directory, '*.json')):
+        try:
+            pid = int(os.path.basename(path).split('-')[0])
+            with open(path) as f:
+                snapshots.append((json.load(f), _process_alive(pid)))
+        except (OSError, ValueError):
+            continue
+    return snapshots
+
+
+def _merge(metric, snapshots):
+    # Counters and histograms of workers that have exited still count; gauges only of live ones
+    merged = {}
+    for values, alive in snapshots:
+        if metric.type == 'gauge' and not alive:
+            continue
+        for labelvalues, value in values.get(metric.name, ()):
+            labelvalues = tuple(labelvalues)
+            if isinstance(value, list):
+                series = merged.setdefault(labelvalues, [0] * len(value))
+                for index, count in enumerate(value):
+                    series[index] += count
+            else:
+                merged[labelvalues] = merged.get(labelvalues, 0) + value
+    return sorted(merged.items())
+
+
+def render_all():
+    lines = []
+    if _directory is None:
+        for metric in _registry:
+            lines.extend(metric.render())
+    else:
+        _write_snapshot()
+        snapshots = _read_snapshots()
+        for metric in _registry:
+            lines.extend(metric.render(_merge(metric, snapshots)))
+    return '\n'.join(lines) + '\n'
+
+
+def share_across_processes(directory):
+    """Add up the metrics of all processes forked from here (gunicorn master, before forking)"""
+    global _directory
+    os.makedirs(directory, exist_ok=True)
+    _directory = directory
+
+
+def restart_metrics_after_fork():
+    """Start a forked worker from zero and write its values to the shared directory from now on"""
+    global _snapshot_file
+    _snapshot_file = None
+    for metric in _registry:
+        # Values and locks are copies of the master's; its values are not this worker's
+        metric._values = {}
+        metric._lock = threading.Lock()
+    if _directory is None:
+        return
+
+    def export():
+        while True:
+            _write_snapshot()
+            time.sleep(EXPORT_INTERVAL)
+
+    threading.Thread(target=export, name='metrics-export', daemon=True).start()
+    atexit.register(_write_snapshot)
+
+
+# Invoice metrics; the Flask API records all of them, the Streamlit app the render ones
+REQUESTS = Counter('invoice_requests_total', 'Invoice API requests by endpoint and status code.', ('endpoint', 'status'))
+ERRORS = Counter('invoice_errors_total', 'Invoice API requests that ended with a 4xx or 5xx status.', ('endpoint',))
+REQUEST_SECONDS = Histogram('invoice_request_seconds', 'Invoice API request handling time.', ('endpoint',))
+STAGE_SECONDS = Histogram(
+    'invoice_stage_seconds',
+    'Time spent per invoice generation stage (parse_json, pricing, layout, service_table, output, send).',
+    ('stage',)
+)
+PDF_BYTES = Histogram('invoice_pdf_bytes', 'Size of rendered invoice PDFs.', buckets=SIZE_BUCKETS)
+RENDERS_IN_FLIGHT = Gauge('invoice_renders_in_flight', 'Invoice PDFs currently being rendered.')
+
+
+def stage(name):
+    """Context manager timing one generation stage into STAGE_SECONDS"""
+    return STAGE_SECONDS.time(name)
+
+
+CONTENT_TYPE = 'text/plain; version=0.0.4'
+
+if Blueprint is not None:
+    metrics_bp = Blueprint('metrics', __name__)
+
+    @metrics_bp.route('/metrics', methods=['GET'])
+    def prometheus_metrics():
+        return Response(render_all(), mimetype=CONTENT_TYPE)
+
+
+def serve_metrics(port, host='0.0.0.0'):
+    """Answer GET /metrics on `port` from a daemon thread, for processes without a Flask app"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = render_all().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', CONTENT_TYPE)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    return server
@@ -0,0 +1,468 @@
+"""Append-only pack file for rendered invoice PDFs.
+
+Instead of one file per invoice, every PDF is appended to a single pack. The
+larger stream bodies of a PDF (logo, its soft mask, font subsets) are stored
+once as content-addressed blobs and referenced; the rest of the document is
+zlib-compressed into the invoice's own record. Since an invoice is rebuilt by
+concatenating its pieces, the PDF comes back byte for byte whatever the split.
+
+Pack layout: HEADER (magic, pack id), then records of RECORD (kind, flags,
+name length, digest, payload length, crc32) followed by the name and payload.
+Blob records are named by the sha256 of their content; invoice records by
+invoice number, with the cache key of the rendered data as digest. A newer
+record for the same invoice supersedes the older one. The pack is never
+rewritten in place, only by compact().
+
+The index next to the pack (`.idx`) lists every record with its offset, so
+opening the archive reads no PDFs; records it does not cover yet (another
+process appended, or a crash before the index was written) are found by
+walking the record headers from its end. Reads go through an mmap of the pack
+and touch only the invoice's record and the blobs it references.
+
+    python pdf_archive.py stats|verify|compact [--archive database/invoices.pack]
+    python pdf_archive.py get 2025-08071530-2 --output Rechnung.pdf
+    python pdf_archive.py import archive/     # a directory written by rerender.py
+"""
+import argparse
+import hashlib
+import mmap
+import os
+import struct
+import sys
+import threading
+import zlib
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:  # Windows: only one process may write to the archive
+    fcntl = None
+
+ARCHIVE_PATH = os.path.join(os.path.dirname(__file__), 'database', 'invoices.pack')
+
+MAGIC = b'GWPACK\x00\x01'
+INDEX_MAGIC = b'GWPIDX\x00\x01'
+# Pack and index header: magic, random pack id (new with every compaction)
+HEADER = struct.Struct('<8s16s')
+# kind, flags, name length, digest, payload length, crc32 of name + payload
+RECORD = struct.Struct('<BBH32sII')
+# kind, name length, record offset, record end, digest; the name follows
+INDEX_ENTRY = struct.Struct('<BHQQ32s')
+# An invoice payload is a list of segments: literal bytes (length follows) or a blob (its record offset)
+SEGMENT = struct.Struct('<BQ')
+
+KIND_BLOB = 1
+KIND_INVOICE = 2
+FLAG_ZLIB = 1
+SEGMENT_LITERAL = 0
+SEGMENT_BLOB = 1
+NO_KEY = bytes(32)
+
+# Stream bodies from this size on are stored as shared blobs
+SHARED_MIN_BYTES = 512
+ZLIB_LEVEL = 6
+
+
+class ArchiveError(Exception):
+    """The pack file is not an archive or is damaged"""
+
+
+def _split(pdf):
+    """(shared, bytes) pieces whose concatenation is `pdf`; shared pieces are the larger stream bodies"""
+    position = literal_start = 0
+    while True:
+        start = pdf.find(b'stream\n', position)
+        if start < 0:
+            break
+        start += 7
+        end = pdf.find(b'\nendstream', start)
+        if end < 0:
+            break
+        if end - start >= SHARED_MIN_BYTES:
+            yield False, pdf[literal_start:start]
+            yield True, pdf[start:end]
+            literal_start = end
+        position = end + 10
+    yield False, pdf[literal_start:]
+
+
+class PDFArchive:
+    """Append-only, deduplicated pack of rendered invoices, safe to share between processes"""
+
+    def __init__(self, path=ARCHIVE_PATH):
+        self.path = path
+        self.index_path = f'{path}.idx'
+        self.lock_path = f'{path}.lock'
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self._map = None
+        self._inode = None
+        self._pack_id = None
+        # End of the last complete record seen, and of the records covered by the index file
+        self._end = 0
+        self._indexed_end = 0
+        # Bytes of the index file read so far; 0 while there is no valid index
+        self._index_position = 0
+        # invoice number -> (record offset, cache key digest)
+        self._invoices = {}
+        # content sha256 -> record offset
+        self._blobs = {}
+        self._superseded = 0
+        self._damaged = None
+
+    @contextmanager
+    def _locked(self):
+        # Exclusive across processes; opened per write so forked workers don't share the lock
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.lock_path, 'a') as lock:
+            if fcntl:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+
+    def _refresh(self, create=False):
+        """Map the pack and pick up records appended since; reopen it after a compaction"""
+        if create and not os.path.exists(self.path):
+            with open(self.path, 'xb') as f:
+                f.write(HEADER.pack(MAGIC, os.urandom(16)))
+        try:
+            f = open(self.path, 'rb')
+        except FileNotFoundError:
+            self._reset()
+            return
+        with f:
+            stat = os.fstat(f.fileno())
+            if stat.st_ino != self._inode:
+                self._reset()
+                self._inode = stat.st_ino
+            if stat.st_size < HEADER.size:
+                return
+            if self._map is None or stat.st_size > len(self._map):
+                self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._pack_id is None:
+            magic, self._pack_id = HEADER.unpack_from(self._map)
+            if magic != MAGIC:
+                raise ArchiveError(f'{self.path} is not a PDF archive')
+            self._end = self._indexed_end = HEADER.size
+        self._read_index()
+        for offset, end, kind, name, digest in self._walk(self._end, len(self._map)):
+            self._add(offset, end, kind, name, digest)
+
+    def _read_index(self):
+        try:
+            with open(self.index_path, 'rb') as f:
+                if not self._index_position:
+                    if f.read(HEADER.size) != HEADER.pack(INDEX_MAGIC, self._pack_id):
+                        # Torn or left over from before a compaction; the pack is walked instead
+                        return
+                    self._index_position = HEADER.size
+                f.seek(self._index_position)
+                data = f.read()
+        except FileNotFoundError:
+            return
+        position = 0
+        while position + INDEX_ENTRY.size <= len(data):
+            kind, name_length, offset, end, digest = INDEX_ENTRY.unpack_from(data, position)
+            name_end = position + INDEX_ENTRY.size + name_length
+            if name_end > len(data) or end > len(self._map) or offset != self._indexed_end:
+                break
+            if offset >= self._end:
+                self._add(offset, end, kind, data[position + INDEX_ENTRY.size:name_end].decode('utf-8'), digest)
+            self._indexed_end = end
+            position = name_end
+        self._index_position += position
+
+    def _walk(self, start, stop, check=True):
+        """(offset, end, kind, name, digest) of the records in pack[start:stop].
+
+        Stops at the first incomplete record (a torn write) or, with `check`,
+        at the first one failing its checksum; that offset is left in _damaged.
+        """
+        pack = self._map
+        offset = start
+        if check:
+            self._damaged = None
+        while offset + RECORD.size <= stop:
+            kind, flags, name_length, digest, length, crc = RECORD.unpack_from(pack, offset)
+            name_start = offset + RECORD.size
+            end = name_start + name_length + length
+            if kind not in (KIND_BLOB, KIND_INVOICE) or end > stop:
+                return
+            if check and zlib.crc32(pack[name_start:end]) != crc:
+                self._damaged = offset
+                return
+            yield offset, end, kind, pack[name_start:name_start + name_length].decode('utf-8'), digest
+            offset = end
+
+    def _add(self, offset, end, kind, name, digest):
+        if kind == KIND_BLOB:
+            self._blobs.setdefault(digest, offset)
+        else:
+            if name in self._invoices:
+                self._superseded += 1
+            self._invoices[name] = (offset, digest)
+        self._end = end
+
+    def _append(self, f, kind, digest, name, payload, flags=0):
+        name = name.encode('utf-8')
+        offset = self._end
+        f.write(RECORD.pack(kind, flags, len(name), digest, len(payload), zlib.crc32(name + payload)))
+        f.write(name)
+        f.write(payload)
+        self._add(offset, offset + RECORD.size + len(name) + len(payload), kind, name.decode('utf-8'), digest)
+        return offset
+
+    def _write_index(self):
+        """Append index entries for all records not covered yet (ours and those of crashed writers)"""
+        with open(self.index_path, 'r+b' if self._index_position else 'wb') as f:
+            if not self._index_position:
+                f.write(HEADER.pack(INDEX_MAGIC, self._pack_id))
+                self._index_position = HEADER.size
+                self._indexed_end = HEADER.size
+            # Drops a torn entry left by a writer that crashed
+            f.seek(self._index_position)
+            f.truncate()
+            entries = bytearray()
+            for offset, end, kind, name, digest in self._walk(self._indexed_end, self._end, check=False):
+                name = name.encode('utf-8')
+                entries += INDEX_ENTRY.pack(kind, len(name), offset, end, digest) + name
+            f.write(entries)
+        self._index_position += len(entries)
+        self._indexed_end = self._end
+
+    def put(self, invoice_number, pdf, key=None):
+        """Append a rendered invoice; False if it is archived already with the same cache key"""
+        digest = bytes.fromhex(key) if key else NO_KEY
+        pieces = list(_split(bytes(pdf)))
+        with self._lock, self._locked():
+            self._refresh(create=True)
+            entry = self._invoices.get(invoice_number)
+            if key and entry is not None and entry[1] == digest:
+                return False
+            if self._damaged is not None:
+                # Appending after it would hide everything behind the damaged record
+                raise ArchiveError(f'damaged record at offset {self._damaged}; run `python pdf_archive.py verify`')
+            with open(self.path, 'r+b') as f:
+                # Anything after the last complete record is a torn write of a crashed writer
+                f.seek(self._end)
+                f.truncate()
+                recipe = bytearray()
+                for shared, piece in pieces:
+                    if not shared:
+                        recipe += SEGMENT.pack(SEGMENT_LITERAL, len(piece))
+                        recipe += piece
+                        continue
+                    blob_digest = hashlib.sha256(piece).digest()
+                    offset = self._blobs.get(blob_digest)
+                    if offset is None:
+                        # Most streams are deflated already; compress only what shrinks noticeably
+                        compressed = zlib.compress(piece, ZLIB_LEVEL)
+                        if len(compressed) < len(piece) * 0.9:
+                            offset = self._append(f, KIND_BLOB, blob_digest, '', compressed, FLAG_ZLIB)
+                        else:
+                            offset = self._append(f, KIND_BLOB, blob_digest, '', piece)
+                    recipe += SEGMENT.pack(SEGMENT_BLOB, offset)
+                self._append(f, KIND_INVOICE, digest, invoice_number, zlib.compress(recipe, ZLIB_LEVEL), FLAG_ZLIB)
+            # Remap to cover the new records, then index them
+            self._refresh()
+            self._write_index()
+        return True
+
+    def _payload(self, pack, offset, kind):
+        record_kind, flags, name_length, _, length, _ = RECORD.unpack_from(pack, offset)
+        if record_kind != kind:
+            raise ArchiveError(f'no record of kind {kind} at offset {offset}')
+        start = offset + RECORD.size + name_length
+        payload = pack[start:start + length]
+        return zlib.decompress(payload) if flags & FLAG_ZLIB else payload
+
+    def _read(self, pack, offset):
+        try:
+            recipe = memoryview(self._payload(pack, offset, KIND_INVOICE))
+            pieces = []
+            position = 0
+            while position < len(recipe):
+                segment, value = SEGMENT.unpack_from(recipe, position)
+                position += SEGMENT.size
+                if segment == SEGMENT_LITERAL:
+                    pieces.append(recipe[position:position + value])
+                    position += value
+                else:
+                    pieces.append(self._payload(pack, value, KIND_BLOB))
+        except (zlib.error, struct.error) as e:
+            raise ArchiveError(f'damaged record at offset {offset}: {e}') from None
+        return b''.join(pieces)
+
+    def get(self, invoice_number, key=None):
+        """PDF bytes of an archived invoice, or None; with `key`, only if archived with that cache key"""
+        digest = bytes.fromhex(key) if key else None
+        with self._lock:
+            entry = self._invoices.get(invoice_number)
+            if entry is None or (digest and entry[1] != digest):
+                # Maybe written by another process since
+                self._refresh()
+                entry = self._invoices.get(invoice_number)
+            if entry is None or (digest and entry[1] != digest):
+                return None
+            pack = self._map
+        return self._read(pack, entry[0])
+
+    def key(self, invoice_number):
+        """Cache key the invoice was archived with, or None"""
+        with self._lock:
+            self._refresh()
+            entry = self._invoices.get(invoice_number)
+        if entry is None or entry[1] == NO_KEY:
+            return None
+        return entry[1].hex()
+
+    def __contains__(self, invoice_number):
+        with self._lock:
+            if invoice_number not in self._invoices:
+                self._refresh()
+            return invoice_number in self._invoices
+
+    def stats(self):
+        with self._lock:
+            self._refresh()
+            pack_bytes = self._end if self._map is not None else 0
+            return {
+                'invoices': len(self._invoices),
+                'superseded': self._superseded,
+                'blobs': len(self._blobs),
+                'packBytes': pack_bytes,
+                'bytesPerInvoice': pack_bytes // len(self._invoices) if self._invoices else 0,
+            }
+
+    def compact(self):
+        """Rewrite the pack with only the latest record of each invoice and the blobs still used.
+
+        The new pack and index are written next to the old ones and swapped in
+        with os.replace(); processes reading the old pack notice the new inode
+        on their next refresh. Returns (bytes before, bytes after).
+        """
+        with self._lock, self._locked():
+            self._refresh()
+            if self._map is None:
+                return 0, 0
+            before = self._end
+            compacted = PDFArchive(f'{self.path}.compact')
+            for path in (compacted.path, compacted.index_path):
+                if os.path.exists(path):
+                    os.unlink(path)
+            for invoice_number, (offset, digest) in sorted(self._invoices.items(), key=lambda item: item[1][0]):
+                compacted.put(invoice_number, self._read(self._map, offset), None if digest == NO_KEY else digest.hex())
+            after = compacted._end
+            for path in (compacted.path, compacted.index_path):
+                with open(path, 'rb') as f:
+                    os.fsync(f.fileno())
+            # Index first: a reader that sees the new index with the old pack ignores it (pack id differs)
+            os.replace(compacted.index_path, self.index_path)
+            os.replace(compacted.path, self.path)
+            os.unlink(compacted.lock_path)
+            self._refresh()
+        return before, after
+
+    def verify(self):
+        """Check every record and every archived invoice; returns a list of problems, empty if intact"""
+        problems = []
+        with self._lock:
+            self._refresh()
+            if self._map is None:
+                return problems
+            pack = self._map
+            blobs = set()
+            offset = HEADER.size
+            while offset < len(pack):
+                if offset + RECORD.size > len(pack):
+                    kind = end = None
+                else:
+                    kind, _, name_length, digest, length, crc = RECORD.unpack_from(pack, offset)
+                    end = offset + RECORD.size + name_length + length
+                if kind not in (KIND_BLOB, KIND_INVOICE) or end > len(pack):
+                    problems.append(f'{len(pack) - offset} bytes from offset {offset} on are not a complete record '
+                                    '(torn write or damage)')
+                    break
+                if zlib.crc32(pack[offset + RECORD.size:end]) != crc:
+                    problems.append(f'record at {offset}: checksum mismatch')
+                elif kind == KIND_BLOB:
+                    blobs.add(offset)
+                    if hashlib.sha256(self._payload(pack, offset, KIND_BLOB)).digest() != digest:
+                        problems.append(f'blob at {offset}: content does not match its hash')
+                offset = end
+            invoices = dict(self._invoices)
+
+        for invoice_number, (offset, _) in invoices.items():
+            try:
+                recipe = self._payload(pack, offset, KIND_INVOICE)
+                position = 0
+                while position < len(recipe):
+                    segment, value = SEGMENT.unpack_from(recipe, position)
+                    position += SEGMENT.size + (value if segment == SEGMENT_LITERAL else 0)
+                    if segment == SEGMENT_BLOB and value not in blobs:
+                        raise ArchiveError(f'references a missing or damaged blob at {value}')
+                pdf = self._read(pack, offset)
+                if not pdf.startswith(b'%PDF-') or not pdf.rstrip().endswith(b'%%EOF'):
+                    raise ArchiveError('not a complete PDF')
+            except (ArchiveError, zlib.error, struct.error) as e:
+                problems.append(f'{invoice_number} at {offset}: {e}')
+        return problems
+
+    def close(self):
+        with self._lock:
+            if self._map is not None:
+                self._map.close()
+            self._reset()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('command', choices=('stats', 'verify', 'compact', 'get', 'import'))
+    parser.add_argument('argument', nargs='?', help='invoice number (get) or directory of PDFs (import)')
+    parser.add_argument('--archive', default=ARCHIVE_PATH, help='pack file')
+    parser.add_argument('--output', help="file for 'get', default: stdout")
+    args = parser.parse_args()
+    archive = PDFArchive(args.archive)
+
+    if args.command == 'stats':
+        for name, value in archive.stats().items():
+            print(f'{name}: {value}')
+    elif args.command == 'verify':
+        problems = archive.verify()
+        for problem in problems:
+            print(problem, file=sys.stderr)
+        print(f"{archive.stats()['invoices']} invoices, {len(problems)} problems")
+        sys.exit(1 if problems else 0)
+    elif args.command == 'compact':
+        before, after = archive.compact()
+        print(f'{before / 1024 / 1024:.1f} MiB -> {after / 1024 / 1024:.1f} MiB')
+    elif args.command == 'get':
+        pdf = archive.get(args.argument or '')
+        if pdf is None:
+            sys.exit(f'{args.argument}: not in the archive')
+        if args.output:
+            with open(args.output, 'wb') as f:
+                f.write(pdf)
+        else:
+            sys.stdout.buffer.write(pdf)
+    else:
+        if not args.argument or not os.path.isdir(args.argument):
+            parser.error('import needs a directory of <invoice number>.pdf files')
+        # rerender.py records the cache key of every PDF it wrote
+        keys = {}
+        state_path = os.path.join(args.argument, '.rerender-state')
+        if os.path.exists(state_path):
+            with open(state_path, encoding='utf-8') as f:
+                keys = dict(line.split() for line in f if len(line.split()) == 2)
+        imported = 0
+        for filename in sorted(os.listdir(args.argument)):
+            if filename.endswith('.pdf'):
+                with open(os.path.join(args.argument, filename), 'rb') as f:
+                    imported += archive.put(filename[:-4], f.read(), keys.get(filename[:-4]))
+        stats = archive.stats()
+        print(f"{imported} PDFs imported; {stats['invoices']} invoices, {stats['packBytes'] / 1024 / 1024:.1f} MiB")
+
+
+if __name__ == '__main__':
+    main()
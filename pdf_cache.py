@@ -0,0 +1,119 @@
+"""Content-addressed cache for rendered invoice PDFs.
+
+Entries are keyed by a hash of the normalized invoice data, the invoice number
+and the template version, so the key doubles as a strong ETag. A size-capped
+in-memory LRU tier sits in front of an on-disk tier; repeat downloads are
+served from either without any fpdf work.
+"""
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+
+# Byte budget of the in-memory tier
+MEMORY_CACHE_BYTES = 32 * 1024 * 1024
+
+CACHE_DIR = os.path.join(os.path.dirname(__file__), 'database', 'pdf_cache')
+
+
+def cache_key(invoice_number, invoice_data, template_version):
+    """Hash of everything that ends up on the rendered page"""
+    normalized = json.dumps(
+        {'number': invoice_number, 'template': template_version, 'invoice': invoice_data},
+        sort_keys=True, ensure_ascii=False, separators=(',', ':'), default=str
+    )
+    return hashlib.sha256(normalized.encode('utf-8')).hexdigest()
+
+
+class PDFCache:
+    """Two-tier (memory LRU + disk) store of rendered PDFs by cache_key()"""
+
+    def __init__(self, max_memory_bytes=MEMORY_CACHE_BYTES, directory=CACHE_DIR):
+        self.max_memory_bytes = max_memory_bytes
+        self.directory = directory
+        self._entries = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def _path(self, key):
+        return os.path.join(self.directory, key[:2], f'{key}.pdf')
+
+    def _remember(self, key, data):
+        # Caller holds the lock
+        if len(data) > self.max_memory_bytes:
+            return
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._memory_bytes -= len(previous)
+        self._entries[key] = data
+        self._memory_bytes += len(data)
+        while self._memory_bytes > self.max_memory_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._memory_bytes -= len(evicted)
+            self.evictions += 1
+
+    def get(self, key):
+        with self._lock:
+            data = self._entries.get(key)
+            if data is not None:
+                self._entries.move_to_end(key)
+                self.memory_hits += 1
+                return data
+
+        if self.directory:
+            try:
+                with open(self._path(key), 'rb') as f:
+                    data = f.read()
+            except OSError:
+                pass
+            else:
+                with self._lock:
+                    self.disk_hits += 1
+                    self._remember(key, data)
+                return data
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, key, data):
+        # A read-only view keeps FPDF's output buffer without copying it
+        data = memoryview(data).toreadonly()
+        with self._lock:
+            self._remember(key, data)
+        if not self.directory:
+            return
+        path = self._path(key)
+        if os.path.exists(path):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temp file first so readers never see a half-written PDF
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+
+    def stats(self):
+        with self._lock:
+            hits = self.memory_hits + self.disk_hits
+            lookups = hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'memoryBytes': self._memory_bytes,
+                'maxMemoryBytes': self.max_memory_bytes,
+                'memoryHits': self.memory_hits,
+                'diskHits': self.disk_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hitRate': hits / lookups if lookups else 0.0,
+            }
@@ -0,0 +1,244 @@
+"""Embedded TrueType fonts for the invoice PDFs, parsed once per process.
+
+The PDF core fonts only cover latin-1, so names like "Łukasz Wójcik" or
+"محمد" cannot be printed with them. Invoices with such texts use DejaVu Sans
+(fonts/) instead, embedded as a subset of the glyphs each document actually
+uses. Subsetting and embedding makes a render about seven times slower, so
+documents whose texts are all latin-1 keep the core font (FontSelection).
+
+FPDF.add_font() re-reads and re-parses the whole TTF file for every document.
+Here each font file is reduced once to the scripts in UNICODE_RANGES, and its
+tables and glyph metrics are parsed once; every document gets a CachedTTFFont
+that shares them and only tracks its own used glyphs. When the PDF is written,
+fpdf2 subsets that reduced font instead of the full 6000-glyph file.
+"""
+import copy
+import io
+import os
+import threading
+import unicodedata
+from contextlib import contextmanager
+
+from fontTools import subset as ftsubset
+from fontTools import ttLib
+from fpdf.fonts import SubsetMap, TTFFont
+
+try:
+    import uharfbuzz as hb
+except ImportError:  # right-to-left text is then printed unshaped
+    hb = None
+
+FONT_DIR = os.path.join(os.path.dirname(__file__), 'fonts')
+FONT_FAMILY = 'DejaVuSans'
+FONT_FILES = {
+    '': 'DejaVuSans.ttf',
+    'B': 'DejaVuSans-Bold.ttf',
+}
+
+# Printed instead of FONT_FAMILY in documents whose texts are all latin-1
+CORE_FONT = 'helvetica'
+
+# Scripts kept in the per-process font: Latin (German, Polish, Turkish, ...) with
+# combining accents, Greek, Cyrillic, Hebrew, Arabic with its presentation forms,
+# punctuation, currency, letterlike symbols (™, №), number forms and arrows.
+# DejaVu Sans has more (maths, box drawing, dingbats, Armenian, Georgian, ...);
+# those are left out to keep the font small and print as missing glyphs, which
+# fpdf2 logs as a warning.
+UNICODE_RANGES = (
+    (0x0000, 0x036F),
+    (0x0370, 0x04FF),
+    (0x0590, 0x06FF),
+    (0x1E00, 0x1EFF),
+    (0x2000, 0x21FF),
+    (0xFB1D, 0xFDFF),
+    (0xFE70, 0xFEFF),
+)
+
+# OpenType layout tables, only needed for shaping
+LAYOUT_TABLES = ('GDEF', 'GPOS', 'GSUB', 'JSTF', 'BASE')
+
+# Per-font data the documents share read-only with the parsed prototype
+_SHARED_ATTRIBUTES = ('type', 'name', 'up', 'ut', 'cw', 'emphasis', 'scale', 'cmap', 'glyph_ids')
+
+_font_tables = {}
+_registry_lock = threading.Lock()
+
+
+def _in_ranges(codepoint):
+    return any(start <= codepoint <= end for start, end in UNICODE_RANGES)
+
+
+def _save(font):
+    output = io.BytesIO()
+    font.save(output)
+    return output.getvalue()
+
+
+def _reduce(path):
+    """The font at `path` cut down to UNICODE_RANGES, as TTF bytes for HarfBuzz and for fpdf2.
+
+    Both share one glyph order. The HarfBuzz copy keeps the layout tables (Arabic
+    joining forms); fpdf2 drops those itself, so its copy goes without them.
+    """
+    font = ttLib.TTFont(path, recalcTimestamp=False)
+    options = ftsubset.Options(
+        layout_features=['*'], name_IDs=['*'], name_languages=['*'],
+        notdef_outline=True, recommended_glyphs=True, glyph_names=False
+    )
+    options.drop_tables += ['FFTM']
+    subsetter = ftsubset.Subsetter(options)
+    subsetter.populate(unicodes=[codepoint for codepoint in font.getBestCmap() if _in_ranges(codepoint)])
+    subsetter.subset(font)
+    shaping_data = _save(font)
+    for tag in LAYOUT_TABLES:
+        if tag in font:
+            del font[tag]
+    return shaping_data, _save(font)
+
+
+class _NoDocument:
+    # The two attributes TTFFont.__init__ reads from its FPDF
+    fonts = {}
+    str_alias_nb_pages = None
+
+
+class FontTables:
+    """One font file, reduced and parsed once per process"""
+
+    def __init__(self, path, style):
+        self.path = path
+        shaping_data, self.data = _reduce(path)
+        # fpdf2's own parser fills in metrics, cmap and widths; documents copy from it
+        self.prototype = TTFFont(_NoDocument(), io.BytesIO(self.data), '', style)
+        # Without a post table of names fontTools derives them while parsing; documents
+        # reuse them instead of deriving them again for every PDF
+        self.glyph_order = tuple(self.prototype.ttfont.getGlyphOrder())
+        self.prototype.ttfont.close()
+        self.hb_face = hb.Face(hb.Blob(shaping_data)) if hb else None
+
+
+class CachedTTFFont(TTFFont):
+    """A document's view of shared FontTables; only its glyph subset is its own"""
+
+    __slots__ = ('tables', '_ttfont')
+
+    def __init__(self, pdf, tables, fontkey, template=None):
+        # Deliberately not calling TTFFont.__init__, which would parse the file again
+        prototype = tables.prototype
+        for name in _SHARED_ATTRIBUTES:
+            setattr(self, name, getattr(prototype, name))
+        self.i = len(pdf.fonts) + 1
+        self.fontkey = fontkey
+        self.ttffile = tables.path
+        # fpdf2 stores the object id and font stream on the descriptor while writing
+        self.desc = copy.copy(prototype.desc)
+        self.missing_glyphs = []
+        self.tables = tables
+        self._ttfont = None
+        if tables.hb_face is not None:
+            self.hbfont = hb.Font(tables.hb_face)
+
+        reserved = '\x00 \r\n'
+        if pdf.str_alias_nb_pages:
+            reserved += '0123456789' + pdf.str_alias_nb_pages
+        self.subset = SubsetMap(self, [ord(char) for char in reserved])
+        if template is not None:
+            # Pick the template's glyphs in the same order, so they get the same codes
+            # and text recorded with `template` can be replayed into this document
+            for glyph, _ in sorted(template.subset.items(), key=lambda item: item[1]):
+                self.subset.pick_glyph(glyph)
+
+    @property
+    def ttfont(self):
+        # fpdf2 subsets this in place while writing the PDF, so every document gets its own.
+        # Subsetting keeps outlines unchanged, which makes recalculating bounding boxes moot.
+        if self._ttfont is None:
+            self._ttfont = ttLib.TTFont(
+                io.BytesIO(self.tables.data), recalcTimestamp=False, recalcBBoxes=False, lazy=True
+            )
+            self._ttfont.setGlyphOrder(list(self.tables.glyph_order))
+        return self._ttfont
+
+    def close(self):
+        if self._ttfont is not None:
+            self._ttfont.close()
+            self._ttfont = None
+        self.hbfont = None
+
+
+def get_font_tables(style=''):
+    """Return the shared FontTables for FONT_FAMILY in `style`"""
+    tables = _font_tables.get(style)
+    if tables is None:
+        with _registry_lock:
+            tables = _font_tables.get(style)
+            if tables is None:
+                tables = _font_tables[style] = FontTables(os.path.join(FONT_DIR, FONT_FILES[style]), style)
+    return tables
+
+
+def add_font(pdf, style='', template_pdf=None):
+    """Make FONT_FAMILY in `style` available to set_font() on `pdf`.
+
+    With `template_pdf`, glyphs already used there keep their codes in `pdf`.
+    """
+    fontkey = f'{FONT_FAMILY.lower()}{style}'
+    if fontkey in pdf.fonts:
+        return
+    template = template_pdf.fonts.get(fontkey) if template_pdf is not None else None
+    pdf.fonts[fontkey] = CachedTTFFont(pdf, get_font_tables(style), fontkey, template)
+
+
+def add_fonts(pdf):
+    """Register every style of FONT_FAMILY on `pdf`"""
+    for style in FONT_FILES:
+        add_font(pdf, style)
+
+
+def core_font_covers(*texts):
+    """True if the latin-1 core font can print all of `texts`"""
+    try:
+        for text in texts:
+            str(text).encode('latin-1')
+    except UnicodeEncodeError:
+        return False
+    return True
+
+
+class FontSelection:
+    """FPDF mixin printing FONT_FAMILY in CORE_FONT when `core_font` is set.
+
+    Nothing is embedded for the core font, so those documents render as fast
+    as before DejaVu Sans. Set it before the first set_font() of a document.
+    """
+
+    core_font = False
+
+    def set_font(self, family=None, style='', size=0):
+        if self.core_font and family == FONT_FAMILY:
+            family = CORE_FONT
+        super().set_font(family, style, size)
+
+
+def warm():
+    """Parse every style now instead of during the first render"""
+    for style in FONT_FILES:
+        get_font_tables(style)
+
+
+def needs_shaping(text):
+    """True for right-to-left scripts such as Arabic, whose letters join and reorder"""
+    return any(unicodedata.bidirectional(char) in ('R', 'AL') for char in text)
+
+
+@contextmanager
+def text_shaping(pdf, text):
+    """Shape `text` with HarfBuzz while it is drawn, if it needs it and uharfbuzz is installed"""
+    if hb is None or not needs_shaping(text):
+        yield
+        return
+    pdf.set_text_shaping(True)
+    try:
+        yield
+    finally:
+        pdf.set_text_shaping(False)
@@ -3,22 +3,27 @@ try:
 except ImportError:
     print("مكتبة FPDF غير مثبتة. يرجى تثبيتها باستخدام: pip install fpdf2")
     raise ImportError("fpdf2 library is required")
-import os
 import tempfile
 from datetime import datetime, timedelta
+from assets import get_logo
+from pdf_fonts import FONT_FAMILY, FontSelection, add_fonts, core_font_covers, text_shaping
 
-class GlanzwerkInvoicePDF(FPDF):
-    def __init__(self):
+class GlanzwerkInvoicePDF(FontSelection, FPDF):
+    def __init__(self, core_font=False):
         super().__init__()
         self.set_auto_page_break(auto=True, margin=15)
+        # Latin-1 invoices print in the core font; embedded DejaVu Sans only for the others
+        self.core_font = core_font
+        if not core_font:
+            add_fonts(self)
         
     def header(self):
-        # Add logo
-        if hasattr(self, 'logo_path') and os.path.exists(self.logo_path):
-            self.image(self.logo_path, x=10, y=8, w=25)
+        # Add logo (prepared once per process, see assets.py)
+        if hasattr(self, 'logo_path'):
+            get_logo(self.logo_path).place(self, x=10, y=8, w=25)
         
         # Company header line with better positioning
-        self.set_font('Arial', '', 10)
+        self.set_font(FONT_FAMILY, '', 10)
         self.set_xy(45, 15)  # Position after logo
         self.cell(0, 5, 'Glanzwerk Rheinland, Krasnaer Str. 1, 56566 Neuwied, Deutschland', 0, 1, 'L')
         self.ln(10)
@@ -27,7 +32,7 @@ class GlanzwerkInvoicePDF(FPDF):
         self.set_y(-40)
         
         # Footer with company details
-        self.set_font('Arial', '', 9)
+        self.set_font(FONT_FAMILY, '', 9)
         
         # Left column
         self.cell(60, 4, 'Glanzwerk Rheinland', 0, 0, 'L')
@@ -48,8 +53,9 @@ class GlanzwerkInvoicePDF(FPDF):
         
     def customer_address(self, customer_name, vehicle_number):
         # Customer address section
-        self.set_font('Arial', '', 11)
-        self.cell(0, 6, customer_name, 0, 1, 'L')
+        self.set_font(FONT_FAMILY, '', 11)
+        with text_shaping(self, customer_name):
+            self.cell(0, 6, customer_name, 0, 1, 'L')
         self.cell(0, 6, f'Fahrzeug: {vehicle_number}', 0, 1, 'L')
         self.ln(5)
         
@@ -60,7 +66,7 @@ class GlanzwerkInvoicePDF(FPDF):
         
         # Position for right-aligned content
         self.set_xy(120, 35)
-        self.set_font('Arial', '', 11)
+        self.set_font(FONT_FAMILY, '', 11)
         
         self.cell(70, 6, f'Rechnungsnummer: {invoice_number}', 0, 1, 'L')
         self.set_x(120)
@@ -72,12 +78,12 @@ class GlanzwerkInvoicePDF(FPDF):
         self.set_xy(10, 70)
         
     def invoice_title(self):
-        self.set_font('Arial', 'B', 16)
+        self.set_font(FONT_FAMILY, 'B', 16)
         self.cell(0, 10, 'RECHNUNG', 0, 1, 'L')
         self.ln(5)
         
     def greeting_text(self):
-        self.set_font('Arial', '', 11)
+        self.set_font(FONT_FAMILY, '', 11)
         self.cell(0, 6, 'Sehr geehrte Damen und Herren,', 0, 1, 'L')
         self.ln(3)
         self.cell(0, 6, 'vielen Dank für Ihre Inanspruchnahme unserer Dienstleistungen bei Glanzwerk Rheinland.', 0, 1, 'L')
@@ -86,7 +92,7 @@ class GlanzwerkInvoicePDF(FPDF):
         
     def service_table(self, invoice_data):
         # Table header
-        self.set_font('Arial', 'B', 11)
+        self.set_font(FONT_FAMILY, 'B', 11)
         self.cell(80, 8, 'Beschreibung', 1, 0, 'L')
         self.cell(25, 8, 'Anzahl/Art', 1, 0, 'C')
         self.cell(25, 8, 'Einzelpreis', 1, 0, 'R')
@@ -94,7 +100,7 @@ class GlanzwerkInvoicePDF(FPDF):
         self.cell(25, 8, 'Gesamt', 1, 1, 'R')
         
         # Service row
-        self.set_font('Arial', '', 10)
+        self.set_font(FONT_FAMILY, '', 10)
         service_description = self.get_service_description(invoice_data['service'])
         gross_before_discount = invoice_data['net_price'] + invoice_data['tax_amount']
         
@@ -113,7 +119,7 @@ class GlanzwerkInvoicePDF(FPDF):
             self.cell(25, 8, f"-{invoice_data['discount_amount']:.2f}EUR", 1, 1, 'R')
         
         # Total row
-        self.set_font('Arial', 'B', 11)
+        self.set_font(FONT_FAMILY, 'B', 11)
         self.cell(155, 10, 'Gesamt inkl. MwSt.', 1, 0, 'R')
         self.cell(25, 10, f"{invoice_data['total_price']:.2f}EUR", 1, 1, 'R')
         
@@ -128,7 +134,7 @@ class GlanzwerkInvoicePDF(FPDF):
         return descriptions.get(service, service)
         
     def payment_info(self):
-        self.set_font('Arial', '', 10)
+        self.set_font(FONT_FAMILY, '', 10)
         
         # Payment method
         self.cell(0, 6, 'Bezahlung durch: [Bar / Überweisung / PayPal]', 0, 1, 'L')
@@ -154,12 +160,13 @@ class GlanzwerkInvoicePDF(FPDF):
 
 def generate_invoice_pdf_new(invoice_data):
     """Generiert eine PDF-Rechnung im neuen Design"""
-    pdf = GlanzwerkInvoicePDF()
+    core_font = core_font_covers(invoice_data['customer_name'], invoice_data['vehicle_number'], invoice_data['service'])
+    pdf = GlanzwerkInvoicePDF(core_font)
     pdf.logo_path = "/home/ubuntu/glanzz-main/glanzz-main/glanzwerk_logo.png"
     pdf.add_page()
     
     # Generiere Rechnungsnummer basierend auf Zeitstempel
-    invoice_number = f"2025-{datetime.now().strftime('%m%d%H%M')}"
+    invoice_number = datetime.now().strftime('%Y-%m%d%H%M')
     
     # Customer address
     pdf.customer_address(invoice_data['customer_name'], invoice_data['vehicle_number'])
@@ -0,0 +1,308 @@
+"""Paginated table layout for the invoice service table.
+
+A table is laid out in three passes instead of one FPDF.cell() per field:
+
+1. measure: every row's texts are measured once from the font's glyph widths,
+   long descriptions are wrapped to their column, and the row height follows
+   from the number of lines;
+2. paginate: pages are filled with as many rows as fit, keeping room at the
+   bottom for the carry-over line, and for the closing rows on the last page;
+3. draw: each page is written in one go, all borders as one path and all texts
+   in one text object, like the static blocks in pdf_template.py.
+
+Every page repeats the column headings. A page that continues on the next one
+ends with "Übertrag auf Seite n" and the running total of the rows so far,
+and the next page starts with it again ("Übertrag von Seite n-1"). What is
+carried is up to the caller; draw() can check it against the expected total.
+Values wider than their column in the document's font, such as large totals
+in DejaVu Sans Bold, are printed in a smaller size so they stay inside it.
+
+Text that needs shaping (Arabic) is measured and drawn through FPDF itself,
+so HarfBuzz still joins its letters; that is the slow path, row by row.
+"""
+import math
+
+from fpdf.util import escape_parens
+
+import pdf_fonts
+from pdf_fonts import FONT_FAMILY, needs_shaping, text_shaping
+
+
+class Column:
+    """Heading, width (mm) and alignment ('L', 'C' or 'R') of one table column"""
+
+    __slots__ = ('heading', 'width', 'align')
+
+    def __init__(self, heading, width, align):
+        self.heading = heading
+        self.width = width
+        self.align = align
+
+
+class _Row:
+    __slots__ = ('cells', 'lines', 'height', 'amount', 'shaped')
+
+    def __init__(self, cells, lines, height, amount, shaped):
+        # Texts of the columns after the first; the first is in `lines`
+        self.cells = cells
+        self.lines = lines
+        self.height = height
+        self.amount = amount
+        self.shaped = shaped
+
+
+class _Font:
+    """A document's font in one style and size, measuring and encoding text for it"""
+
+    def __init__(self, pdf, style, size):
+        pdf.set_font(FONT_FAMILY, style, size)
+        self.font = pdf.current_font
+        self.size = size
+        self.size_mm = pdf.font_size
+        self._width = size * 0.001 / pdf.k
+        self._codes = {}
+        # Core font widths are keyed by character, TrueType widths by code point
+        self._core = self.font.type == 'core'
+
+    def width(self, text):
+        cw = self.font.cw
+        if self._core:
+            return sum(cw[char] for char in text) * self._width
+        return sum(cw[ord(char)] for char in text) * self._width
+
+    def encode(self, text):
+        if self._core:
+            return escape_parens(text)
+        # Glyph codes in the document's font subset, as fpdf2 writes them for TTF fonts
+        codes = self._codes
+        mapped = []
+        for char in text:
+            code = codes.get(char)
+            if code is None:
+                code = codes[char] = chr(self.font.subset.pick(ord(char)) or 0)
+            if code != '\x00':
+                mapped.append(code)
+        return escape_parens(''.join(mapped).encode('utf-16-be').decode('latin-1'))
+
+
+class PagedTable:
+    """A bordered table that continues over as many pages as its rows need.
+
+    `columns` are Column objects; the first column holds the (wrapped)
+    description, the others single-line values.
+    """
+
+    def __init__(self, columns, font_size=10, heading_size=11, row_height=8, line_height=5, carry_label='Übertrag'):
+        self.columns = columns
+        self.carry_label = carry_label
+        self.font_size = font_size
+        self.heading_size = heading_size
+        self.row_height = row_height
+        self.line_height = line_height
+
+    def draw(self, pdf, rows, closing_rows, bottom, top=0, total=None):
+        """Lay out `rows` from the current position, continuing on new pages between `top` and `bottom` (mm).
+
+        `rows` are (cells, amount) pairs: the texts for every column and the
+        amount added to the carried total. `closing_rows` follow the last row
+        and stay together on one page: (label, value, style, font size, height,
+        label alignment), the label spanning every column but the last.
+        With `total`, the amounts must add up to it, or ValueError is raised
+        before anything is drawn.
+        """
+        if total is not None:
+            carried = sum((amount for _, amount in rows), 0)
+            if carried != total:
+                raise ValueError(f'Table rows add up to {carried}, expected {total}')
+        regular = _Font(pdf, '', self.font_size)
+        fonts = {('', self.font_size): regular}
+        measured = [self._measure(pdf, regular, cells, amount) for cells, amount in rows]
+        closing_height = sum(row[4] for row in closing_rows)
+
+        first = measured[0].height if measured else closing_height
+        if pdf.y + self.row_height + first + self.row_height > bottom:
+            self._next_page(pdf, top)
+        carried = 0
+        position = 0
+        while True:
+            writer = _PageWriter(pdf, fonts, self.row_height, self.line_height)
+            y = self._heading(writer, pdf.y)
+            if position:
+                y = self._carry(writer, y, f'{self.carry_label} von Seite {pdf.page - 1}', carried)
+            # At least one row per page, and room for the carry-over line below the last
+            start = position
+            while position < len(measured) and (
+                    position == start or y + measured[position].height + self.row_height <= bottom):
+                y = self._row(writer, y, measured[position])
+                carried += measured[position].amount
+                position += 1
+            done = position == len(measured) and y + closing_height <= bottom
+            if done:
+                for label, value, style, size, height, align in closing_rows:
+                    y = self._closing(writer, y, label, value, style, size, height, align)
+            else:
+                y = self._carry(writer, y, f'{self.carry_label} auf Seite {pdf.page + 1}', carried)
+            writer.flush()
+            pdf.set_xy(pdf.l_margin, y)
+            if done:
+                return
+            self._next_page(pdf, top)
+
+    @staticmethod
+    def _next_page(pdf, top):
+        pdf.add_page()
+        pdf.set_y(max(pdf.y, top))
+
+    def _measure(self, pdf, font, cells, amount):
+        description = cells[0]
+        width = self.columns[0].width - 2 * pdf.c_margin
+        shaped = pdf_fonts.hb is not None and needs_shaping(description)
+        if shaped:
+            pdf.set_font(FONT_FAMILY, '', self.font_size)
+
+            def measure(text):
+                with text_shaping(pdf, text):
+                    return pdf.get_string_width(text)
+        else:
+            measure = font.width
+        lines = _wrap(description, width, measure)
+        height = max(self.row_height, len(lines) * self.line_height + self.row_height - self.line_height)
+        return _Row(cells[1:], lines, height, amount, shaped)
+
+    def _heading(self, writer, y):
+        x = writer.pdf.l_margin
+        for column in self.columns:
+            writer.cell(x, y, column.width, self.row_height, column.heading, column.align, 'B', self.heading_size)
+            x += column.width
+        return y + self.row_height
+
+    def _carry(self, writer, y, label, amount):
+        return self._closing(writer, y, label, f'{amount:.2f}EUR', '', self.font_size, self.row_height, 'R')
+
+    def _closing(self, writer, y, label, value, style, size, height, align):
+        x = writer.pdf.l_margin
+        label_width = sum(column.width for column in self.columns[:-1])
+        writer.cell(x, y, label_width, height, label, align, style, size)
+        writer.cell(x + label_width, y, self.columns[-1].width, height, value, 'R', style, size)
+        return y + height
+
+    def _row(self, writer, y, row):
+        pdf = writer.pdf
+        x = pdf.l_margin
+        first = self.columns[0]
+        writer.box(x, y, first.width, row.height)
+        for index, line in enumerate(row.lines):
+            line_y = y + index * self.line_height
+            if row.shaped:
+                writer.live(x, line_y, first.width, line, self.font_size)
+            else:
+                writer.text(x, line_y, first.width, line, first.align, '', self.font_size)
+        x += first.width
+        for column, text in zip(self.columns[1:], row.cells):
+            writer.box(x, y, column.width, row.height)
+            writer.text(x, y, column.width, text, column.align, '', self.font_size)
+            x += column.width
+        return y + row.height
+
+
+class _PageWriter:
+    """Collects one page of the table and writes it as a single path and text object"""
+
+    def __init__(self, pdf, fonts, row_height, line_height):
+        self.pdf = pdf
+        self.fonts = fonts
+        self.row_height = row_height
+        self.line_height = line_height
+        self._boxes = []
+        self._texts = []
+        self._live = []
+        self._font = None
+
+    def _get_font(self, style, size):
+        font = self.fonts.get((style, size))
+        if font is None:
+            font = self.fonts[(style, size)] = _Font(self.pdf, style, size)
+        return font
+
+    def box(self, x, y, width, height):
+        pdf = self.pdf
+        self._boxes.append(f'{x * pdf.k:.2f} {(pdf.h - y) * pdf.k:.2f} {width * pdf.k:.2f} {-height * pdf.k:.2f} re')
+
+    def text(self, x, y, width, text, align, style, size):
+        """`text` on the first line of a cell at (x, y), as FPDF.cell() would place it"""
+        if not text:
+            return
+        pdf = self.pdf
+        font = self._get_font(style, size)
+        text_width = font.width(text)
+        available = width - 2 * pdf.c_margin
+        if text_width > available:
+            # Wider than its column in this font (large bold totals): print it smaller
+            size = math.floor(size * available / text_width * 10) / 10
+            font = self._get_font(style, size)
+            text_width = font.width(text)
+        if font is not self._font:
+            self._texts.append(f'/F{font.font.i} {size:.2f} Tf')
+            self._font = font
+        if align == 'R':
+            x += width - pdf.c_margin - text_width
+        elif align == 'C':
+            x += (width - text_width) / 2
+        else:
+            x += pdf.c_margin
+        # Baseline of a single text line centred in a row_height cell, like FPDF.cell()
+        baseline = y + self.row_height / 2 + 0.3 * font.size_mm
+        self._texts.append(f'1 0 0 1 {x * pdf.k:.2f} {(pdf.h - baseline) * pdf.k:.2f} Tm ({font.encode(text)}) Tj')
+
+    def cell(self, x, y, width, height, text, align, style, size):
+        self.box(x, y, width, height)
+        # Texts of taller cells (the total) are centred vertically
+        self.text(x, y + (height - self.row_height) / 2, width, text, align, style, size)
+
+    def live(self, x, y, width, text, size):
+        self._live.append((x, y, width, text, size))
+
+    def flush(self):
+        pdf = self.pdf
+        # Wrapped in q ... Q, so FPDF's idea of the current font stays right
+        operators = ['q']
+        if self._boxes:
+            operators.append(' '.join(self._boxes) + ' S')
+        if self._texts:
+            operators.append('BT')
+            operators.extend(self._texts)
+            operators.append('ET')
+        operators.append('Q')
+        pdf._out('\n'.join(operators))
+        for x, y, width, text, size in self._live:
+            pdf.set_font(FONT_FAMILY, '', size)
+            pdf.set_xy(x, y + (self.row_height - self.line_height) / 2)
+            with text_shaping(pdf, text):
+                pdf.cell(width, self.line_height, text, align='L')
+
+
+def _wrap(text, width, measure):
+    """`text` broken into lines no wider than `width`, at spaces or, for overlong words, anywhere"""
+    lines = []
+    line = ''
+    space = measure(' ')
+    line_width = 0
+    for word in text.split():
+        word_width = measure(word)
+        if line and line_width + space + word_width <= width:
+            line += ' ' + word
+            line_width += space + word_width
+            continue
+        if line:
+            lines.append(line)
+        while word_width > width and len(word) > 1:
+            cut = len(word) - 1
+            while cut > 1 and measure(word[:cut]) > width:
+                cut -= 1
+            lines.append(word[:cut])
+            word = word[cut:]
+            word_width = measure(word)
+        line, line_width = word, word_width
+    if line or not lines:
+        lines.append(line)
+    return lines
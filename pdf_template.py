@@ -0,0 +1,151 @@
+"""Precompiled static page content for the invoice PDF classes.
+
+Static blocks (letterhead, footer, greeting, payment terms, signature) are drawn
+once per process into a scratch document. The resulting content-stream
+operators are kept in memory and replayed into every invoice page, so a render
+only lays out the variable fields: customer, number, dates and the service
+table.
+
+fpdf2 has no public API for form XObjects, so fragments are replayed inline.
+Each one is wrapped in ``q ... Q`` with a translation matrix: the block can be
+placed at any height, and the graphics state (font, colours) is restored
+afterwards to what FPDF's own bookkeeping expects.
+
+With embedded TrueType fonts, text in a fragment is written as glyph codes of
+the recording document's font subset. Documents therefore register their fonts
+through PageTemplate.register_fonts(), which starts their subsets with the same
+codes; fragments recorded after that are drawn live in that document instead.
+Documents in the core font (pdf_fonts.FontSelection) need a PageTemplate of
+their own, recorded in the core font.
+"""
+import threading
+
+from fpdf import FPDF
+
+import pdf_fonts
+
+# Every font the static blocks use, registered in this order in both the scratch
+# document and each invoice so the /F<n> resource names in the fragments match
+TEMPLATE_FONTS = (
+    (pdf_fonts.FONT_FAMILY, ''),
+    (pdf_fonts.FONT_FAMILY, 'B'),
+)
+
+
+def _forget_font(pdf):
+    # Forget the selection so the next set_font() always writes its Tf operator
+    pdf.font_family = ''
+    pdf.font_style = ''
+    pdf.current_font = None
+
+
+def register_template_fonts(pdf, template_pdf=None):
+    """Register TEMPLATE_FONTS on `pdf` without changing its current font.
+
+    Embedded fonts start with the glyph codes already used in `template_pdf`.
+    """
+    for family, style in TEMPLATE_FONTS:
+        if family == pdf_fonts.FONT_FAMILY and not getattr(pdf, 'core_font', False):
+            pdf_fonts.add_font(pdf, style, template_pdf)
+        pdf.set_font(family, style)
+    _forget_font(pdf)
+
+
+class _Recorder(pdf_fonts.FontSelection, FPDF):
+    pass
+
+
+class StaticFragment:
+    """Content-stream operators of one static block plus the cursor movement it causes"""
+
+    __slots__ = ('content', 'flowing', 'x0', 'y0', 'end_x', 'height', 'generation')
+
+    def __init__(self, content, flowing, x0, y0, end_x, height, generation):
+        self.content = content
+        self.flowing = flowing
+        self.x0 = x0
+        self.y0 = y0
+        self.end_x = end_x
+        self.height = height
+        # Fragments recorded so far, including this one (see PageTemplate.register_fonts)
+        self.generation = generation
+
+
+class PageTemplate:
+    """Fragments recorded once per PDF class and replayed into every document"""
+
+    def __init__(self, core_font=False):
+        self.core_font = core_font
+        self._fragments = {}
+        self._generation = 0
+        self._recorder = None
+        self._lock = threading.Lock()
+
+    def _get_recorder(self):
+        # Caller holds the lock. One scratch document records every fragment,
+        # so all of them share a single set of glyph codes.
+        if self._recorder is None:
+            recorder = _Recorder()
+            recorder.core_font = self.core_font
+            recorder.set_auto_page_break(False)
+            register_template_fonts(recorder)
+            self._recorder = recorder
+        return self._recorder
+
+    def _record(self, draw, flowing):
+        # Caller holds the lock
+        recorder = self._get_recorder()
+        recorder.add_page()
+        _forget_font(recorder)
+        start = len(recorder.pages[recorder.page].contents)
+        x0, y0 = recorder.x, recorder.y
+        draw(recorder)
+        content = bytes(recorder.pages[recorder.page].contents[start:])
+        self._generation += 1
+        return StaticFragment(content, flowing, x0, y0, recorder.x, recorder.y - y0, self._generation)
+
+    def register_fonts(self, pdf):
+        """Register TEMPLATE_FONTS on `pdf` so the fragments recorded so far can be replayed into it"""
+        with self._lock:
+            register_template_fonts(pdf, self._get_recorder())
+            pdf.template_generation = self._generation
+
+    def get(self, name, draw, flowing=True):
+        fragment = self._fragments.get(name)
+        if fragment is None:
+            with self._lock:
+                fragment = self._fragments.get(name)
+                if fragment is None:
+                    fragment = self._fragments[name] = self._record(draw, flowing)
+        return fragment
+
+    def replay(self, pdf, name, draw, flowing=True):
+        """Replay the static block `name` into `pdf`, drawing it live if it does not fit.
+
+        `draw` is the function that lays out the block on a given FPDF; it is
+        used to record the fragment the first time and as the fallback.
+        `flowing` blocks continue at the current cursor position, the others
+        position themselves absolutely on the page.
+        """
+        fragment = self.get(name, draw, flowing)
+        if fragment.generation > getattr(pdf, 'template_generation', 0):
+            # Recorded after `pdf` registered its fonts, so its glyph codes are unknown there
+            draw(pdf)
+            return
+        if flowing and pdf.auto_page_break and pdf.y + fragment.height > pdf.page_break_trigger:
+            draw(pdf)
+            return
+
+        if flowing:
+            dx = (pdf.x - fragment.x0) * pdf.k
+            dy = (fragment.y0 - pdf.y) * pdf.k
+            pdf._out(f'q 1 0 0 1 {dx:.2f} {dy:.2f} cm')
+        else:
+            pdf._out('q')
+        pdf._out(fragment.content.rstrip(b'\n'))
+        pdf._out('Q')
+
+        if flowing:
+            pdf.set_xy(fragment.end_x, pdf.y + fragment.height)
+        else:
+            pdf.set_xy(fragment.end_x, fragment.y0 + fragment.height)
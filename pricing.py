@@ -0,0 +1,151 @@
+"""Cent-exact price, tax and discount calculation shared by the Flask API and the Streamlit app.
+
+Two paths compute identical results:
+
+* the scalar path (`price_invoice`) uses Decimal and serves single invoices;
+* the batch path (`price_batch`) uses NumPy int64 arrays of cents and prices
+  thousands of invoices at once for reports and re-billing.
+
+All rounding is commercial (half up) to whole cents.
+"""
+from decimal import Decimal, ROUND_HALF_UP
+
+CENT = Decimal('0.01')
+TAX_RATE = Decimal('0.19')
+TAX_RATE_PERCENT = 19
+REGULAR_CUSTOMER_DISCOUNT = Decimal('10')
+# Earlier visits after which a customer gets REGULAR_CUSTOMER_DISCOUNT automatically
+REGULAR_CUSTOMER_VISITS = 5
+
+
+def to_money(value):
+    """Convert a price (int, str, float or Decimal) to a Decimal rounded to cents"""
+    if not isinstance(value, Decimal):
+        # str() keeps floats like 0.1 from dragging their binary expansion along
+        value = Decimal(str(value))
+    return value.quantize(CENT, rounding=ROUND_HALF_UP)
+
+
+def to_percent(value):
+    """Discount percentages are kept to two decimals (whole basis points)"""
+    return to_money(value)
+
+
+def price_line(net):
+    """Return (net, tax, gross) for one line item"""
+    net = to_money(net)
+    tax = (net * TAX_RATE).quantize(CENT, rounding=ROUND_HALF_UP)
+    return net, tax, net + tax
+
+
+def resolve_discounts(discount_codes, is_regular_customer=False, discount_code='', manual_discount=None):
+    """Collect the applicable discounts.
+
+    Returns (total_discount_percent, discount_sources) where the sources are the
+    labels printed on the invoice.
+    """
+    total_discount_percent = Decimal('0')
+    discount_sources = []
+
+    # Regular customer discount
+    if is_regular_customer:
+        total_discount_percent += REGULAR_CUSTOMER_DISCOUNT
+        discount_sources.append(f'Stammkundenrabatt ({REGULAR_CUSTOMER_DISCOUNT}%)')
+
+    # Discount code
+    discount_code = (discount_code or '').upper()
+    if discount_code and discount_code in discount_codes:
+        code_discount = to_percent(discount_codes[discount_code])
+        total_discount_percent += code_discount
+        discount_sources.append(f'Code {discount_code} ({code_discount.normalize():f}%)')
+
+    # Manual discount
+    if manual_discount:
+        manual_discount = to_percent(manual_discount)
+        if manual_discount > 0:
+            total_discount_percent += manual_discount
+            discount_sources.append(f'Manueller Rabatt ({manual_discount.normalize():f}%)')
+
+    return total_discount_percent, discount_sources
+
+
+def discount_source_key(label):
+    """Split a discount_sources label from resolve_discounts() into (source, percent).
+
+    'Stammkundenrabatt (10%)' -> ('regular', 10), 'Code WINTER2025 (15%)' ->
+    ('code:WINTER2025', 15), 'Manueller Rabatt (2.5%)' -> ('manual', 2.5).
+    """
+    name, _, percent = label.rpartition(' (')
+    percent = Decimal(percent.rstrip('%)'))
+    if name.startswith('Code '):
+        return f'code:{name[len("Code "):]}', percent
+    if name.startswith('Stammkunde'):
+        return 'regular', percent
+    if name.startswith('Manuell'):
+        return 'manual', percent
+    return name, percent
+
+
+def price_invoice(service_price, additional_prices=(), total_discount_percent=0):
+    """Price a single invoice.
+
+    Tax is calculated once on the net total; the discount is taken off the gross
+    amount. All returned amounts are Decimals rounded to cents.
+    """
+    service_price = to_money(service_price)
+    net_price = service_price + sum((to_money(price) for price in additional_prices), Decimal('0'))
+    net_price, tax_amount, gross_price = price_line(net_price)
+
+    total_discount_percent = to_percent(total_discount_percent)
+    discount_amount = (gross_price * total_discount_percent / 100).quantize(CENT, rounding=ROUND_HALF_UP)
+
+    return {
+        'service_price': service_price,
+        'net_price': net_price,
+        'tax_amount': tax_amount,
+        'gross_price': gross_price,
+        'total_discount_percent': total_discount_percent,
+        'discount_amount': discount_amount,
+        'total_price': gross_price - discount_amount,
+    }
+
+
+def _div_half_up(numerator, denominator):
+    # Round-half-up integer division for non-negative numerators
+    return (2 * numerator + denominator) // (2 * denominator)
+
+
+def price_batch(net_cents, discount_basis_points):
+    """Price many invoices at once.
+
+    `net_cents` holds each invoice's net total in cents and
+    `discount_basis_points` its total discount in hundredths of a percent
+    (12.5% -> 1250). Returns a dict of int64 cent arrays with the same keys and
+    rounding as `price_invoice`.
+    """
+    # Imported here so the scalar path (and the Streamlit app's cold start) never loads NumPy
+    try:
+        import numpy as np
+    except ImportError:
+        raise ImportError('NumPy is required for batch pricing: pip install numpy') from None
+
+    net = np.asarray(net_cents, dtype=np.int64)
+    basis_points = np.asarray(discount_basis_points, dtype=np.int64)
+    if np.any(net < 0) or np.any(basis_points < 0):
+        raise ValueError('Net amounts and discounts must not be negative')
+
+    tax = _div_half_up(net * TAX_RATE_PERCENT, 100)
+    gross = net + tax
+    discount = _div_half_up(gross * basis_points, 10000)
+    return {
+        'net_price': net,
+        'tax_amount': tax,
+        'gross_price': gross,
+        'discount_amount': discount,
+        'total_price': gross - discount,
+    }
+
+
+def to_cents(amount):
+    """Decimal euros -> int cents, for feeding `price_batch`"""
+    return int(to_money(amount) * 100)
@@ -0,0 +1,293 @@
+"""Background PDF rendering on a bounded process pool.
+
+The pool is shared by the batch endpoint and the async job API, so renders
+never run on (or block) a Flask request thread. Jobs whose render raises are
+retried a few times before they are reported as failed.
+
+Under gunicorn every worker renders its own jobs, but job status and finished
+PDFs are kept in the render_jobs table once the queue is bound to the app
+(RenderJobQueue.init_app), so whichever worker a status request reaches can
+answer it.
+"""
+import atexit
+import logging
+import multiprocessing
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from sqlalchemy import and_, delete, or_
+from sqlalchemy.exc import SQLAlchemyError
+
+from extensions import db
+
+RENDER_WORKERS = os.cpu_count() or 2
+
+# Render processes are started by a single-threaded fork server instead of being
+# forked from the app process, which already runs threads (write-behind writer,
+# catalog watcher, gthread request threads): a child forked from there can inherit
+# a lock another thread was holding and hang on it
+START_METHOD = 'forkserver' if 'forkserver' in multiprocessing.get_all_start_methods() else 'spawn'
+
+# Jobs that may be queued or rendering at once before new ones are refused
+MAX_ACTIVE_JOBS = 200
+MAX_ATTEMPTS = 3
+
+# Finished jobs (and their PDFs) are kept this many seconds for pickup
+JOB_TTL = 3600
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+# Render processes per pool. Every gunicorn worker starts its own pool, so the
+# master divides RENDER_WORKERS among them before forking (share_render_workers)
+_pool_size = RENDER_WORKERS
+
+# Modules of the render functions; the fork server imports them once, so every
+# render process it starts has fonts, logo and page template loaded already
+_preload = set()
+
+
+def share_render_workers(processes):
+    """Size each pool so `processes` app processes together start about RENDER_WORKERS renderers"""
+    global _pool_size
+    _pool_size = max(1, RENDER_WORKERS // max(1, processes))
+
+
+def render_pool_size():
+    """Render processes in this process's pool"""
+    return _pool_size
+
+
+def get_render_pool():
+    """The process-wide render pool, started on first use"""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                context = multiprocessing.get_context(START_METHOD)
+                if START_METHOD == 'forkserver':
+                    context.set_forkserver_preload(sorted(_preload))
+                _pool = ProcessPoolExecutor(max_workers=_pool_size, mp_context=context)
+    return _pool
+
+
+def _replace_broken_pool(broken):
+    global _pool
+    with _pool_lock:
+        if _pool is broken:
+            _pool = None
+    broken.shutdown(wait=False, cancel_futures=True)
+    return get_render_pool()
+
+
+@atexit.register
+def shutdown_render_pool():
+    """Stop the workers; queued renders are cancelled, running ones finish"""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+class QueueFullError(RuntimeError):
+    """Raised when MAX_ACTIVE_JOBS renders are already pending"""
+
+
+class RenderJobRecord(db.Model):
+    """A render job as stored for every app process; the PDF is kept once it is done"""
+
+    __tablename__ = 'render_jobs'
+
+    id = db.Column(db.String(32), primary_key=True)
+    invoice_number = db.Column(db.String(40), nullable=False)
+    filename = db.Column(db.String(255), nullable=False)
+    status = db.Column(db.String(10), nullable=False)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    error = db.Column(db.Text)
+    pdf = db.Column(db.LargeBinary)
+    created_at = db.Column(db.Float, nullable=False, index=True)
+    finished_at = db.Column(db.Float, index=True)
+
+
+class RenderJob:
+    def __init__(self, invoice_number, invoice_data, filename):
+        self.id = uuid.uuid4().hex
+        self.invoice_number = invoice_number
+        self.invoice_data = invoice_data
+        self.filename = filename
+        self.status = 'queued'
+        self.attempts = 0
+        self.error = None
+        self.pdf = None
+        self.created_at = time.time()
+        self.finished_at = None
+        self.future = None
+
+    @classmethod
+    def from_record(cls, record):
+        job = cls(record.invoice_number, None, record.filename)
+        job.id = record.id
+        job.status = record.status
+        job.attempts = record.attempts
+        job.error = record.error
+        job.pdf = record.pdf
+        job.created_at = record.created_at
+        job.finished_at = record.finished_at
+        return job
+
+    def to_record(self):
+        return RenderJobRecord(
+            id=self.id, invoice_number=self.invoice_number, filename=self.filename, status=self.status,
+            attempts=self.attempts, error=self.error, pdf=self.pdf if self.status == 'done' else None,
+            created_at=self.created_at, finished_at=self.finished_at
+        )
+
+    def to_dict(self):
+        status = self.status
+        if status == 'queued' and self.future is not None and self.future.running():
+            status = 'running'
+        return {
+            'jobId': self.id,
+            'status': status,
+            'invoiceNumber': self.invoice_number,
+            'attempts': self.attempts,
+            'error': self.error,
+        }
+
+
+class RenderJobQueue:
+    """Tracks render jobs submitted to the shared pool.
+
+    `render` must be a picklable top-level function taking
+    (invoice_data, invoice_number) and returning the PDF bytes. `on_success`
+    is called with the finished job from the pool's callback thread before the
+    job is reported done; if it raises, the job fails.
+
+    Until init_app() binds it to an app, jobs are only kept in this process.
+    Afterwards they are written to the render_jobs table when submitted and
+    when finished, and this process only remembers the ones still rendering.
+    """
+
+    def __init__(self, render, on_success=None, max_active=MAX_ACTIVE_JOBS,
+                 max_attempts=MAX_ATTEMPTS, ttl=JOB_TTL):
+        self.render = render
+        _preload.add(render.__module__)
+        self.on_success = on_success
+        self.max_active = max_active
+        self.max_attempts = max_attempts
+        self.ttl = ttl
+        self.app = None
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        """Keep job status and PDFs in `app`'s database, shared by all its worker processes"""
+        self.app = app
+        with app.app_context():
+            db.create_all()
+
+    def submit(self, invoice_number, invoice_data, filename):
+        with self._lock:
+            self._prune()
+            active = sum(1 for job in self._jobs.values() if job.finished_at is None)
+            if active >= self.max_active:
+                raise QueueFullError('Too many render jobs queued, try again shortly')
+            job = RenderJob(invoice_number, invoice_data, filename)
+            self._jobs[job.id] = job
+        self._store(job, prune=True)
+        self._start(job)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None or self.app is None:
+            return job
+        with self.app.app_context():
+            try:
+                record = db.session.get(RenderJobRecord, job_id)
+                return RenderJob.from_record(record) if record is not None else None
+            finally:
+                db.session.remove()
+
+    def _prune(self):
+        # Caller holds the lock
+        cutoff = time.time() - self.ttl
+        for job_id in [job_id for job_id, job in self._jobs.items()
+                       if job.finished_at is not None and job.finished_at < cutoff]:
+            del self._jobs[job_id]
+
+    def _store(self, job, prune=False):
+        """Write `job` to the render_jobs table; with `prune`, drop the expired ones there too"""
+        if self.app is None:
+            return False
+        with self.app.app_context():
+            try:
+                if prune:
+                    # Jobs not finished within the TTL were lost with the process rendering them
+                    cutoff = time.time() - self.ttl
+                    db.session.execute(delete(RenderJobRecord).where(or_(
+                        RenderJobRecord.finished_at < cutoff,
+                        and_(RenderJobRecord.finished_at.is_(None), RenderJobRecord.created_at < cutoff)
+                    )))
+                db.session.merge(job.to_record())
+                db.session.commit()
+                return True
+            except SQLAlchemyError:
+                db.session.rollback()
+                logger.exception('Could not store render job %s', job.id)
+                return False
+            finally:
+                db.session.remove()
+
+    def _start(self, job):
+        job.attempts += 1
+        pool = get_render_pool()
+        try:
+            job.future = pool.submit(self.render, job.invoice_data, job.invoice_number)
+        except BrokenProcessPool:
+            job.future = _replace_broken_pool(pool).submit(self.render, job.invoice_data, job.invoice_number)
+        except RuntimeError as e:
+            # Pool already shut down (interpreter exiting)
+            self._finish(job, error=str(e))
+            return
+        job.future.add_done_callback(lambda future: self._done(job, future))
+
+    def _done(self, job, future):
+        if future.cancelled():
+            self._finish(job, error='Render was cancelled')
+            return
+        error = future.exception()
+        if error is None:
+            job.pdf = future.result()
+            # Stored, cached and archived before any process reports the job done
+            if self.on_success is not None:
+                try:
+                    self.on_success(job)
+                except Exception as e:
+                    logger.exception('Post-render hook failed for job %s', job.id)
+                    self._finish(job, error=f'Rendered, but could not be stored: {e}')
+                    return
+            self._finish(job)
+            return
+        if job.attempts < self.max_attempts:
+            logger.warning('Render job %s failed (attempt %d), retrying: %s', job.id, job.attempts, error)
+            self._start(job)
+            return
+        self._finish(job, error=str(error))
+
+    def _finish(self, job, error=None):
+        job.error = error
+        job.status = 'failed' if error else 'done'
+        job.finished_at = time.time()
+        if self._store(job):
+            # The table answers for it from now on, in this process as in the others
+            with self._lock:
+                self._jobs.pop(job.id, None)
@@ -0,0 +1,224 @@
+"""Revenue, service, discount and customer statistics from the rollup tables.
+
+    GET /api/reports/revenue?period=day|week|month&from=2025-01-01&to=2025-12-31
+    GET /api/reports/services?from=...&to=...
+    GET /api/reports/discounts?from=...&to=...
+    GET /api/reports/customers?from=...&to=...&limit=10
+
+`from` and `to` are inclusive ISO dates and default to the last 365 days; top
+customers are rolled up per month and count whole months. Every
+query reads the rollups (rollups.py) for that range only, so it costs the same
+after ten years of invoices as after one.
+
+Recompute the rollups from the invoices table, e.g. after editing invoices by hand:
+
+    python reports.py --rebuild [--database database/app.db]
+"""
+import argparse
+import os
+import sys
+from datetime import date, timedelta
+from decimal import Decimal
+
+from flask import Blueprint, Flask, jsonify, request
+from sqlalchemy import and_, func, select
+
+# Same import root as main.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from catalog import get_catalog  # noqa: E402
+from extensions import db  # noqa: E402
+from invoice_store import rebuild_customer_visits, rebuild_rollups  # noqa: E402
+from rollups import DailyDiscount, DailyRevenue, MonthlyCustomerRevenue  # noqa: E402
+
+reports_bp = Blueprint('reports', __name__)
+
+DATABASE_PATH = os.path.join(os.path.dirname(__file__), 'database', 'app.db')
+
+DEFAULT_RANGE_DAYS = 365
+MAX_TOP_CUSTOMERS = 100
+PERIODS = ('day', 'week', 'month')
+
+_AMOUNT_COLUMNS = ('service_cents', 'net_cents', 'tax_cents', 'gross_cents', 'discount_cents', 'total_cents')
+
+
+class ReportError(ValueError):
+    """Bad query parameters; reported as 400"""
+
+
+def _date_range():
+    try:
+        end = date.fromisoformat(request.args['to']) if request.args.get('to') else date.today()
+        start = (date.fromisoformat(request.args['from']) if request.args.get('from')
+                 else end - timedelta(days=DEFAULT_RANGE_DAYS - 1))
+    except ValueError:
+        raise ReportError('from and to must be dates like 2025-01-31') from None
+    if start > end:
+        raise ReportError('from must not be after to')
+    return start, end
+
+
+def _period_key(day, period):
+    if period == 'day':
+        return day.isoformat()
+    if period == 'week':
+        year, week, _ = day.isocalendar()
+        return f'{year}-W{week:02d}'
+    return day.strftime('%Y-%m')
+
+
+def _euros(cents):
+    # Cents in the rollups, euro strings in the reports
+    return str(Decimal(cents).scaleb(-2))
+
+
+def _amounts(row):
+    return {
+        'invoices': row['invoices'],
+        'net': _euros(row['net_cents']),
+        'tax': _euros(row['tax_cents']),
+        'gross': _euros(row['gross_cents']),
+        'discount': _euros(row['discount_cents']),
+        'total': _euros(row['total_cents']),
+    }
+
+
+def _sum_columns(model, names):
+    return [func.sum(getattr(model, name)).label(name) for name in names]
+
+
+@reports_bp.errorhandler(ReportError)
+def _report_error(e):
+    return jsonify({'error': str(e)}), 400
+
+
+@reports_bp.route('/revenue', methods=['GET'])
+def revenue_report():
+    period = request.args.get('period', 'day')
+    if period not in PERIODS:
+        raise ReportError(f'period must be one of {", ".join(PERIODS)}')
+    start, end = _date_range()
+    rows = db.session.execute(
+        select(DailyRevenue.day, *_sum_columns(DailyRevenue, ('invoices',) + _AMOUNT_COLUMNS))
+        .where(DailyRevenue.day.between(start, end))
+        .group_by(DailyRevenue.day)
+        .order_by(DailyRevenue.day)
+    ).mappings()
+
+    # At most one row per day; weeks and months are summed up here
+    buckets = {}
+    for row in rows:
+        bucket = buckets.setdefault(_period_key(row['day'], period), dict.fromkeys(('invoices',) + _AMOUNT_COLUMNS, 0))
+        for name in bucket:
+            bucket[name] += row[name]
+    return jsonify({
+        'period': period, 'from': start.isoformat(), 'to': end.isoformat(),
+        'revenue': [dict(_amounts(bucket), period=key) for key, bucket in buckets.items()],
+    })
+
+
+@reports_bp.route('/services', methods=['GET'])
+def services_report():
+    start, end = _date_range()
+    services = get_catalog().services
+    rows = db.session.execute(
+        select(DailyRevenue.service_key, *_sum_columns(DailyRevenue, ('invoices',) + _AMOUNT_COLUMNS))
+        .where(DailyRevenue.day.between(start, end))
+        .group_by(DailyRevenue.service_key)
+        .order_by(func.sum(DailyRevenue.total_cents).desc())
+    ).mappings()
+    return jsonify({
+        'from': start.isoformat(), 'to': end.isoformat(),
+        'services': [
+            dict(
+                _amounts(row),
+                serviceKey=row['service_key'],
+                # Services since removed from the catalog keep their key
+                name=services.get(row['service_key'], {}).get('name', row['service_key']),
+                serviceNet=_euros(row['service_cents']),
+            )
+            for row in rows
+        ],
+    })
+
+
+@reports_bp.route('/discounts', methods=['GET'])
+def discounts_report():
+    start, end = _date_range()
+    rows = db.session.execute(
+        select(DailyDiscount.source, *_sum_columns(DailyDiscount, ('uses', 'discount_cents')))
+        .where(DailyDiscount.day.between(start, end))
+        .group_by(DailyDiscount.source)
+        .order_by(func.sum(DailyDiscount.uses).desc())
+    ).mappings()
+    return jsonify({
+        'from': start.isoformat(), 'to': end.isoformat(),
+        'discounts': [
+            {'source': row['source'], 'uses': row['uses'], 'discount': _euros(row['discount_cents'])}
+            for row in rows
+        ],
+    })
+
+
+@reports_bp.route('/customers', methods=['GET'])
+def top_customers_report():
+    start, end = _date_range()
+    try:
+        limit = min(int(request.args.get('limit', 10)), MAX_TOP_CUSTOMERS)
+    except ValueError:
+        raise ReportError('limit must be a number') from None
+    # Months overlapping the range; customers are rolled up per month
+    top = (
+        select(
+            MonthlyCustomerRevenue.customer_key,
+            func.max(MonthlyCustomerRevenue.month).label('last_month'),
+            *_sum_columns(MonthlyCustomerRevenue, ('invoices', 'total_cents')),
+        )
+        .where(MonthlyCustomerRevenue.month.between(start.replace(day=1), end))
+        .group_by(MonthlyCustomerRevenue.customer_key)
+        .order_by(func.sum(MonthlyCustomerRevenue.total_cents).desc())
+        .limit(limit)
+        .subquery()
+    )
+    # Name and vehicle as written on the latest invoice: the customer's row of its last month
+    rows = db.session.execute(
+        select(top, MonthlyCustomerRevenue.customer_name, MonthlyCustomerRevenue.vehicle_number)
+        .join(MonthlyCustomerRevenue, and_(
+            MonthlyCustomerRevenue.month == top.c.last_month,
+            MonthlyCustomerRevenue.customer_key == top.c.customer_key,
+        ))
+        .order_by(top.c.total_cents.desc())
+    ).mappings()
+    return jsonify({
+        'from': start.replace(day=1).isoformat(), 'to': end.isoformat(),
+        'customers': [
+            {
+                'customerName': row['customer_name'], 'vehicleNumber': row['vehicle_number'],
+                'invoices': row['invoices'], 'total': _euros(row['total_cents']),
+            }
+            for row in rows
+        ],
+    })
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rebuild', action='store_true', help='recompute all rollups from the invoices table')
+    parser.add_argument('--database', default=DATABASE_PATH)
+    args = parser.parse_args()
+    if not args.rebuild:
+        parser.print_help()
+        return
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{os.path.abspath(args.database)}'
+    db.init_app(app)
+    with app.app_context():
+        db.create_all()
+        invoices = rebuild_rollups()
+        customers = rebuild_customer_visits()
+    print(f'Rebuilt rollups from {invoices} invoices ({customers} customers)')
+
+
+if __name__ == '__main__':
+    main()
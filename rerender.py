@@ -0,0 +1,171 @@
+"""Re-render every stored invoice to PDF, e.g. after the letterhead or footer changed.
+
+Usage: python rerender.py --output archive/ [--workers N] [--force]
+       python rerender.py --archive database/invoices.pack [--workers N] [--force]
+
+Invoices are streamed from the database and rendered on all cores; every
+worker warms the logo and page template once and writes its PDFs straight to
+the output directory. A state file in the output directory records the content
+hash of each written PDF, so an interrupted run picks up where it stopped and
+unchanged invoices are skipped. Bump TEMPLATE_VERSION in invoice.py when the
+layout changes, or pass --force.
+
+With --archive the PDFs are appended to a pack file (pdf_archive.py) instead
+of written as one file each; the archive records each invoice's content hash
+itself. Superseded versions stay in the pack until `python pdf_archive.py compact`.
+"""
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+# Same import root as main.py
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.orm import Session
+
+import invoice
+from invoice_store import Invoice
+from pdf_archive import PDFArchive
+from pdf_cache import cache_key
+
+DATABASE_PATH = os.path.join(os.path.dirname(__file__), 'database', 'app.db')
+STATE_FILE = '.rerender-state'
+
+# Rows fetched from SQLite per round trip
+FETCH_SIZE = 500
+
+
+def _warm_worker():
+    # Runs once per worker process, before its first render
+    invoice.warm_caches()
+
+
+def _render_to_file(invoice_number, invoice_data, path):
+    pdf_bytes = invoice.render_invoice_pdf(invoice_data, invoice_number)
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(pdf_bytes)
+    os.replace(tmp_path, path)
+    return len(pdf_bytes)
+
+
+def _render(invoice_number, invoice_data):
+    # The archive is written by the parent process only
+    return bytes(invoice.render_invoice_pdf(invoice_data, invoice_number))
+
+
+def _load_state(path):
+    state = {}
+    if os.path.exists(path):
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 2:
+                    state[parts[0]] = parts[1]
+    return state
+
+
+def _iter_invoices(session):
+    query = select(Invoice).order_by(Invoice.id).execution_options(yield_per=FETCH_SIZE)
+    for invoice_row in session.scalars(query):
+        yield invoice_row.invoice_number, invoice_row.to_invoice_data()
+
+
+def rerender(database, output=None, workers=None, force=False, progress=sys.stderr, archive=None):
+    """Render every invoice into the directory `output`, or into the PDFArchive at path `archive`"""
+    if archive:
+        archive = PDFArchive(archive)
+        state = {}
+        # The archive keeps the content hash of every invoice itself
+        state_file = open(os.devnull, 'w', encoding='utf-8')
+    else:
+        os.makedirs(output, exist_ok=True)
+        state_path = os.path.join(output, STATE_FILE)
+        state = {} if force else _load_state(state_path)
+        state_file = open(state_path, 'a', encoding='utf-8')
+
+    engine = create_engine(f'sqlite:///{database}')
+    rendered = skipped = failed = written_bytes = 0
+    started = last_report = time.monotonic()
+
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = workers * 4
+
+    with Session(engine) as session, state_file, \
+            ProcessPoolExecutor(max_workers=workers, initializer=_warm_worker) as pool:
+        total = session.scalar(select(func.count(Invoice.id)))
+        pending = {}
+
+        def collect(done):
+            nonlocal rendered, failed, written_bytes
+            for future in done:
+                invoice_number, key = pending.pop(future)
+                try:
+                    result = future.result()
+                    if archive:
+                        archive.put(invoice_number, result, key)
+                        result = len(result)
+                    written_bytes += result
+                except Exception as e:
+                    failed += 1
+                    print(f'\n{invoice_number}: {e}', file=progress)
+                    continue
+                rendered += 1
+                state_file.write(f'{invoice_number} {key}\n')
+            state_file.flush()
+
+        for invoice_number, invoice_data in _iter_invoices(session):
+            key = cache_key(invoice_number, invoice_data, invoice.TEMPLATE_VERSION)
+            if archive:
+                if not force and archive.key(invoice_number) == key:
+                    skipped += 1
+                    continue
+                future = pool.submit(_render, invoice_number, invoice_data)
+            else:
+                path = os.path.join(output, f'{invoice_number}.pdf')
+                if state.get(invoice_number) == key and os.path.exists(path):
+                    skipped += 1
+                    continue
+                future = pool.submit(_render_to_file, invoice_number, invoice_data, path)
+            pending[future] = (invoice_number, key)
+            if len(pending) >= max_in_flight:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+
+            now = time.monotonic()
+            if now - last_report >= 1:
+                last_report = now
+                finished = rendered + skipped + failed
+                print(f'\r{finished}/{total} invoices, {rendered / (now - started):.1f} PDFs/s', end='', file=progress)
+
+        collect(wait(pending).done)
+
+    elapsed = time.monotonic() - started
+    print(
+        f'\r{rendered} rendered, {skipped} up to date, {failed} failed '
+        f'in {elapsed:.1f}s ({rendered / elapsed if elapsed else 0:.1f} PDFs/s, '
+        f'{written_bytes / 1024 / 1024:.1f} MiB written)',
+        file=progress
+    )
+    return failed == 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--database', default=DATABASE_PATH, help='SQLite database with the stored invoices')
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--output', help='directory for the rendered PDFs')
+    target.add_argument('--archive', help='pack file to append the rendered PDFs to (see pdf_archive.py)')
+    parser.add_argument('--workers', type=int, default=None, help='worker processes (default: all cores)')
+    parser.add_argument('--force', action='store_true', help='re-render even invoices that are up to date')
+    args = parser.parse_args()
+
+    ok = rerender(args.database, args.output, workers=args.workers, force=args.force, archive=args.archive)
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == '__main__':
+    main()
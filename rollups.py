@@ -0,0 +1,127 @@
+"""Daily and monthly revenue rollups, maintained incrementally as invoices are stored.
+
+InvoiceWriter adds every committed batch to these tables in the same
+transaction (update_rollups), so the reports in reports.py read at most one
+row per day and service, day and discount, or month and customer, however many
+invoices there are. All tables are clustered on their period column.
+"""
+from sqlalchemy import delete
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from extensions import db
+
+
+class DailyRevenue(db.Model):
+    """Invoices and amounts per invoice day and catalog service"""
+    __tablename__ = 'revenue_daily'
+    __table_args__ = {'sqlite_with_rowid': False}
+
+    day = db.Column(db.Date, primary_key=True)
+    service_key = db.Column(db.String(60), primary_key=True)
+    invoices = db.Column(db.Integer, nullable=False)
+    # The catalog service itself, without additional services
+    service_cents = db.Column(db.Integer, nullable=False)
+    net_cents = db.Column(db.Integer, nullable=False)
+    tax_cents = db.Column(db.Integer, nullable=False)
+    gross_cents = db.Column(db.Integer, nullable=False)
+    discount_cents = db.Column(db.Integer, nullable=False)
+    total_cents = db.Column(db.Integer, nullable=False)
+
+
+class DailyDiscount(db.Model):
+    """Uses and granted amount per invoice day and discount source (see pricing.discount_source_key)"""
+    __tablename__ = 'discounts_daily'
+    __table_args__ = {'sqlite_with_rowid': False}
+
+    day = db.Column(db.Date, primary_key=True)
+    source = db.Column(db.String(80), primary_key=True)
+    uses = db.Column(db.Integer, nullable=False)
+    discount_cents = db.Column(db.Integer, nullable=False)
+
+
+class MonthlyCustomerRevenue(db.Model):
+    """Invoices and totals per month (first day) and customer_key"""
+    __tablename__ = 'customers_monthly'
+    __table_args__ = {'sqlite_with_rowid': False}
+
+    month = db.Column(db.Date, primary_key=True)
+    customer_key = db.Column(db.String(260), primary_key=True)
+    # As written on the customer's latest invoice
+    customer_name = db.Column(db.String(200), nullable=False)
+    vehicle_number = db.Column(db.String(40), nullable=False)
+    invoices = db.Column(db.Integer, nullable=False)
+    total_cents = db.Column(db.Integer, nullable=False)
+
+
+ROLLUP_MODELS = (DailyRevenue, DailyDiscount, MonthlyCustomerRevenue)
+
+_REVENUE_COLUMNS = ('service_cents', 'net_cents', 'tax_cents', 'gross_cents', 'discount_cents', 'total_cents')
+
+
+def _add(rows, key, values, latest=None):
+    row = rows.get(key)
+    if row is None:
+        rows[key] = row = dict(values)
+    else:
+        for name, value in values.items():
+            row[name] += value
+    if latest:
+        row.update(latest)
+
+
+def _upsert(session, model, rows, keys, replace=()):
+    """Insert `rows`, or add their counts to the existing rows with the same `keys`.
+
+    Columns in `replace` are overwritten instead of added to. The statement is
+    the same for every batch, so SQLAlchemy compiles it once and runs it as executemany.
+    """
+    if not rows:
+        return
+    insert = sqlite_insert(model)
+    session.execute(insert.on_conflict_do_update(
+        index_elements=[getattr(model, key) for key in keys],
+        set_={
+            name: insert.excluded[name] if name in replace else getattr(model, name) + insert.excluded[name]
+            for name in rows[0] if name not in keys
+        }
+    ), rows)
+
+
+def update_rollups(session, records):
+    """Add invoices to the rollups; the caller commits.
+
+    Each record is a dict with day, service_key, customer_key, customer_name,
+    vehicle_number, the amounts in _REVENUE_COLUMNS and discounts, a list of
+    (source, cents) pairs. Records are aggregated here first, so a batch costs
+    one upsert per touched row rather than per invoice.
+    """
+    revenue, discounts, customers = {}, {}, {}
+    for record in records:
+        day = record['day']
+        _add(revenue, (day, record['service_key']),
+             dict({name: record[name] for name in _REVENUE_COLUMNS}, invoices=1))
+        for source, cents in record['discounts']:
+            _add(discounts, (day, source), {'uses': 1, 'discount_cents': cents})
+        _add(customers, (day.replace(day=1), record['customer_key']),
+             {'invoices': 1, 'total_cents': record['total_cents']},
+             latest={'customer_name': record['customer_name'], 'vehicle_number': record['vehicle_number']})
+
+    for model, rows, keys, replace in (
+        (DailyRevenue, [dict(values, day=day, service_key=service_key)
+                        for (day, service_key), values in revenue.items()], ('day', 'service_key'), ()),
+        (DailyDiscount, [dict(values, day=day, source=source)
+                         for (day, source), values in discounts.items()], ('day', 'source'), ()),
+        (MonthlyCustomerRevenue, [dict(values, month=month, customer_key=customer_key)
+                                  for (month, customer_key), values in customers.items()],
+         ('month', 'customer_key'), ('customer_name', 'vehicle_number')),
+    ):
+        _upsert(session, model, rows, keys, replace)
+
+
+def clear_rollups(session):
+    for model in ROLLUP_MODELS:
+        session.execute(delete(model))
+
+
+def rollups_empty(session):
+    return session.query(DailyRevenue.day).first() is None
@@ -0,0 +1,104 @@
+"""Invoice search for the front desk.
+
+    GET /api/search/invoices?q=müller NR-GW&limit=20
+
+Every word of `q` is matched as a prefix against the customer name, the
+vehicle number (with or without separators), the service and the additional
+services of all stored invoices (search_index.py). The best matches come first,
+name and plate hits weighing more than service texts; ties go to the newest
+invoice. Invoices still in the write-behind queue show up once committed.
+
+    GET /api/search/customers?q=mül&limit=8
+
+Autocomplete for the customer and vehicle fields, answered from memory
+(customer_index.py): known customers whose name, a word of it or the plate
+starts with `q`, regular customers first.
+"""
+from decimal import Decimal
+
+from flask import Blueprint, jsonify, request
+from sqlalchemy import text
+
+from customer_index import DEFAULT_LIMIT as SUGGEST_LIMIT, MAX_LIMIT as MAX_SUGGEST_LIMIT, get_customer_index
+from extensions import db
+from search_index import match_query
+
+search_bp = Blueprint('search', __name__)
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+# Matches ranked per query: the newest ones, so a broad prefix such as 'm' costs
+# the same after ten years as after one. Narrower queries are ranked in full.
+RANK_CANDIDATES = 2000
+
+# FTS5 walks its doclists newest first and stops after RANK_CANDIDATES; only
+# those are scored and only the returned rows are joined to invoices
+_SEARCH_SQL = text("""
+    SELECT i.invoice_number, i.invoice_date, i.customer_name, i.vehicle_number, i.service_name, i.total_cents
+    FROM (
+        SELECT rowid, rank FROM (
+            SELECT rowid, rank FROM invoice_search WHERE invoice_search MATCH :query
+            ORDER BY rowid DESC LIMIT :candidates
+        )
+        ORDER BY rank, rowid DESC LIMIT :limit
+    ) AS hits
+    JOIN invoices i ON i.id = hits.rowid
+    ORDER BY hits.rank, hits.rowid DESC
+""")
+
+
+@search_bp.route('/invoices', methods=['GET'])
+def search_invoices():
+    query = request.args.get('q', '')
+    try:
+        limit = min(int(request.args.get('limit', DEFAULT_LIMIT)), MAX_LIMIT)
+    except ValueError:
+        return jsonify({'error': 'limit must be a number'}), 400
+
+    match = match_query(query)
+    if match is None:
+        return jsonify({'error': 'q must contain at least one letter or digit'}), 400
+
+    rows = db.session.execute(
+        _SEARCH_SQL, {'query': match, 'candidates': RANK_CANDIDATES, 'limit': max(limit, 1)}
+    ).mappings()
+    return jsonify({
+        'query': query,
+        'invoices': [
+            {
+                'invoiceNumber': row['invoice_number'],
+                # SQLite hands back the stored text, '2025-08-07 15:30:00.000000'
+                'invoiceDate': str(row['invoice_date'])[:19].replace(' ', 'T'),
+                'customerName': row['customer_name'],
+                'vehicleNumber': row['vehicle_number'],
+                'serviceName': row['service_name'],
+                'total': str(Decimal(row['total_cents']).scaleb(-2)),
+            }
+            for row in rows
+        ],
+    })
+
+
+@search_bp.route('/customers', methods=['GET'])
+def suggest_customers():
+    query = request.args.get('q', '')
+    try:
+        limit = min(int(request.args.get('limit', SUGGEST_LIMIT)), MAX_SUGGEST_LIMIT)
+    except ValueError:
+        return jsonify({'error': 'limit must be a number'}), 400
+
+    index = get_customer_index()
+    index.refresh_if_due(db.session)
+    return jsonify({
+        'query': query,
+        'customers': [
+            {
+                'customerName': customer['name'],
+                'vehicleNumber': customer['plate'],
+                'visits': customer['visits'],
+                'lastVisit': customer['last_visit'],
+            }
+            for customer in index.suggest(query, max(limit, 1))
+        ],
+    })
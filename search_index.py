@@ -0,0 +1,99 @@
+"""Full-text index over stored invoices (SQLite FTS5).
+
+invoice_search holds one row per invoice (rowid = invoices.id) with the
+customer name, the vehicle number as written and without separators
+('NRGW123', so a plate typed without its hyphen is found too), and the service
+plus all additional-service descriptions. Triggers on invoices and
+invoice_items keep it in step inside the writer's own transactions; nothing in
+Python has to remember to update it. Diacritics are folded, so 'muller' finds
+'Müller'.
+"""
+import re
+import unicodedata
+
+from sqlalchemy import text
+
+# Query tokens beyond this are ignored; a query is a name, a plate or a few words
+MAX_QUERY_TOKENS = 8
+
+# bm25 weights per column: customer_name, vehicle_number, plate, services
+RANK_WEIGHTS = (4.0, 8.0, 8.0, 1.0)
+
+# Letters and digits; everything else separates tokens, as in the unicode61 tokenizer
+_TOKEN_RE = re.compile(r'[^\W_]+')
+
+_PLATE_SQL = "replace(replace({0}, '-', ''), ' ', '')"
+_SERVICES_SQL = (
+    "(SELECT i.service_name || coalesce(' ' || (SELECT group_concat(description, ' ') "
+    "FROM invoice_items WHERE invoice_id = i.id), '') FROM invoices i WHERE i.id = {0})"
+)
+
+_SCHEMA = (
+    """CREATE VIRTUAL TABLE IF NOT EXISTS invoice_search USING fts5(
+        customer_name, vehicle_number, plate, services,
+        tokenize = 'unicode61 remove_diacritics 2', prefix = '1 2 3'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS invoice_search_insert AFTER INSERT ON invoices BEGIN
+        INSERT INTO invoice_search (rowid, customer_name, vehicle_number, plate, services)
+        VALUES (new.id, new.customer_name, new.vehicle_number, {_PLATE_SQL.format('new.vehicle_number')},
+                new.service_name);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS invoice_search_update
+    AFTER UPDATE OF customer_name, vehicle_number, service_name ON invoices BEGIN
+        UPDATE invoice_search SET customer_name = new.customer_name, vehicle_number = new.vehicle_number,
+            plate = {_PLATE_SQL.format('new.vehicle_number')}, services = {_SERVICES_SQL.format('new.id')}
+        WHERE rowid = new.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS invoice_search_delete AFTER DELETE ON invoices BEGIN
+        DELETE FROM invoice_search WHERE rowid = old.id;
+    END""",
+    # Items are inserted right after their invoice, in the same transaction
+    """CREATE TRIGGER IF NOT EXISTS invoice_items_search_insert AFTER INSERT ON invoice_items BEGIN
+        UPDATE invoice_search SET services = services || ' ' || new.description WHERE rowid = new.invoice_id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS invoice_items_search_update AFTER UPDATE OF description ON invoice_items BEGIN
+        UPDATE invoice_search SET services = {_SERVICES_SQL.format('new.invoice_id')} WHERE rowid = new.invoice_id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS invoice_items_search_delete AFTER DELETE ON invoice_items BEGIN
+        UPDATE invoice_search SET services = {_SERVICES_SQL.format('old.invoice_id')} WHERE rowid = old.invoice_id;
+    END""",
+)
+
+
+def create_search_index(session):
+    """Create the FTS table and its triggers if missing; the caller commits"""
+    for statement in _SCHEMA:
+        session.execute(text(statement))
+    # Stored in the table, so a plain ORDER BY rank uses the column weights
+    session.execute(text("INSERT INTO invoice_search (invoice_search, rank) VALUES ('rank', :rank)"),
+                    {'rank': f'bm25({", ".join(str(weight) for weight in RANK_WEIGHTS)})'})
+
+
+def search_index_empty(session):
+    return session.execute(text('SELECT rowid FROM invoice_search LIMIT 1')).first() is None
+
+
+def rebuild_search_index(session):
+    """Re-index all stored invoices; the caller commits. Returns the number of invoices"""
+    session.execute(text('DELETE FROM invoice_search'))
+    result = session.execute(text(f"""
+        INSERT INTO invoice_search (rowid, customer_name, vehicle_number, plate, services)
+        SELECT id, customer_name, vehicle_number, {_PLATE_SQL.format('vehicle_number')},
+               service_name || coalesce(' ' || (SELECT group_concat(description, ' ')
+                                                FROM invoice_items WHERE invoice_id = invoices.id), '')
+        FROM invoices
+    """))
+    session.execute(text("INSERT INTO invoice_search (invoice_search) VALUES ('optimize')"))
+    return result.rowcount
+
+
+def match_query(query):
+    """FTS5 MATCH expression for free text typed by staff, or None if it has no searchable tokens.
+
+    Every token is quoted, so FTS operators in the input are plain text, and
+    prefix-matched, so 'NR-GW 12' and 'mül' work while typing. All tokens must match.
+    """
+    tokens = _TOKEN_RE.findall(unicodedata.normalize('NFKC', query or ''))[:MAX_QUERY_TOKENS]
+    if not tokens:
+        return None
+    return ' '.join(f'"{token}"*' for token in tokens)
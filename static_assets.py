@@ -0,0 +1,142 @@
+"""In-memory manifest of the built front end in static/.
+
+The static folder is scanned once at startup. Every file gets its content type,
+a strong ETag (content hash) and, for text assets, gzip and Brotli variants
+compressed ahead of time, so a request is a dict lookup and no stat() or
+compression happens per request. Fingerprinted bundles such as
+`index-DThUhZ7H.js` never change under their name and are sent with an
+immutable Cache-Control; everything else (index.html) is revalidated by ETag.
+The manifest is not refreshed; restart the app after deploying a new build.
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+
+from flask import Response, request, send_file
+
+try:
+    import brotli
+except ImportError:  # only gzip variants are built then
+    brotli = None
+
+# Vite's 8-character content hash before the extension: index-DThUhZ7H.js, logo-4f3a9c21.svg
+FINGERPRINT_RE = re.compile(r'[.-]([A-Za-z0-9_-]{8})\.[A-Za-z0-9]+$')
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'no-cache'
+
+# Content types worth compressing; images and archives are compressed already
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json', 'image/svg+xml', 'application/xml')
+# Smaller files fit in one packet either way
+MIN_COMPRESS_BYTES = 256
+# Files up to this size are held in memory; larger ones are sent from disk
+MAX_MEMORY_BYTES = 1024 * 1024
+
+# Preferred first when the client accepts several
+ENCODINGS = ('br', 'gzip')
+
+
+def _compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=11)
+    # mtime=0 keeps the output, and so its ETag, identical across restarts
+    return gzip.compress(data, compresslevel=9, mtime=0)
+
+
+def is_fingerprinted(name):
+    """True for file names carrying a content hash, which never change under that name"""
+    match = FINGERPRINT_RE.search(os.path.basename(name))
+    if match is None:
+        return False
+    # A lowercase word (app-settings.js) is part of the name, not a hash
+    fingerprint = match.group(1)
+    return not (fingerprint.isalpha() and fingerprint.islower())
+
+
+class StaticAsset:
+    """One file of the static folder and its precompressed variants"""
+
+    __slots__ = ('path', 'content_type', 'size', 'etag', 'cache_control', 'body', 'variants')
+
+    def __init__(self, path, name):
+        self.path = path
+        content_type = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+        if content_type.startswith('text/') or content_type == 'application/javascript':
+            content_type += '; charset=utf-8'
+        self.content_type = content_type
+        self.cache_control = IMMUTABLE_CACHE_CONTROL if is_fingerprinted(name) else REVALIDATE_CACHE_CONTROL
+        self.size = os.path.getsize(path)
+        self.variants = {}
+
+        digest = hashlib.sha256()
+        with open(path, 'rb') as f:
+            if self.size <= MAX_MEMORY_BYTES:
+                self.body = f.read()
+                digest.update(self.body)
+            else:
+                self.body = None
+                for chunk in iter(lambda: f.read(65536), b''):
+                    digest.update(chunk)
+        self.etag = digest.hexdigest()[:32]
+
+        if self.body is not None and self.size >= MIN_COMPRESS_BYTES and content_type.startswith(COMPRESSIBLE_TYPES):
+            for encoding in ENCODINGS:
+                if encoding == 'br' and brotli is None:
+                    continue
+                compressed = _compress(self.body, encoding)
+                # Not worth a Content-Encoding header for a few percent
+                if len(compressed) < self.size * 0.9:
+                    self.variants[encoding] = compressed
+
+    def choose_encoding(self, accept_encodings):
+        for encoding in ENCODINGS:
+            if encoding in self.variants and accept_encodings[encoding]:
+                return encoding
+        return None
+
+    def response(self):
+        """A conditional response for the current request, compressed if the client accepts it"""
+        if self.body is None:
+            response = send_file(self.path, mimetype=self.content_type, etag=self.etag, conditional=True)
+            response.headers['Cache-Control'] = self.cache_control
+            return response
+
+        encoding = self.choose_encoding(request.accept_encodings)
+        if encoding is None:
+            response = Response(self.body, content_type=self.content_type)
+            response.set_etag(self.etag)
+        else:
+            response = Response(self.variants[encoding], content_type=self.content_type)
+            response.headers['Content-Encoding'] = encoding
+            # Every variant is its own representation with its own validator
+            response.set_etag(f'{self.etag}-{encoding}')
+        if self.variants:
+            response.headers['Vary'] = 'Accept-Encoding'
+        response.headers['Cache-Control'] = self.cache_control
+        return response.make_conditional(request)
+
+
+class StaticManifest:
+    """Relative path -> StaticAsset for every file below `directory`"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.assets = {}
+        if directory and os.path.isdir(directory):
+            self._scan()
+
+    def _scan(self):
+        for root, dirs, files in os.walk(self.directory):
+            dirs[:] = [name for name in dirs if not name.startswith('.')]
+            for filename in files:
+                if filename.startswith('.'):
+                    continue
+                path = os.path.join(root, filename)
+                name = os.path.relpath(path, self.directory).replace(os.sep, '/')
+                self.assets[name] = StaticAsset(path, name)
+
+    def get(self, name):
+        return self.assets.get(name)
+